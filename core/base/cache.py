@@ -0,0 +1,140 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+# every live cache, so that memory use can be inspected across the process (see cache_statistics)
+_registry = weakref.WeakSet()
+_registry_lock = threading.Lock()
+
+
+class LRUCache(object):
+    """
+    A bounded dictionary-like cache. Once maxsize entries are held, adding a new entry evicts the least recently used
+    one. Lookups through __getitem__ and get are counted as hits or misses, and evictions are counted too.
+
+    Each operation holds the cache's lock, so a cache can be shared between threads: e.g. the module level caches of
+    discounted durations and shape ratio trees are used by every thread pricing curves.
+    """
+
+    def __init__(self, maxsize=1024, name=None):
+        """
+        :param maxsize: int, the maximum number of entries held in the cache
+        :param name: optional str, identifies the cache in cache_statistics
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be a positive integer: {} provided".format(maxsize))
+        self.maxsize = maxsize
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with _registry_lock:
+            _registry.add(self)
+
+    def __getstate__(self):
+        # locks can't be pickled, so each copy gets a new one
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.add(self)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._lookup(key)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        """list of the keys, least recently used first"""
+        with self._lock:
+            return list(self._data)
+
+    def pop(self, key, default=None):
+        """removes the entry for key, returning its value (or default if there's no entry)"""
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                return self._lookup(key)
+            except KeyError:
+                return default
+
+    def clear(self):
+        """Removes all of the entries, but keeps the counters"""
+        with self._lock:
+            self._data.clear()
+
+    @property
+    def statistics(self):
+        """dict of the name, size, maxsize, and hit, miss and eviction counts of the cache"""
+        with self._lock:
+            return {"name": self.name, "size": len(self._data), "maxsize": self.maxsize,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _lookup(self, key):
+        """looks up key, counting the hit or miss, the caller holds the lock"""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+
+class NullCache(LRUCache):
+    """
+    A cache that never holds anything, for when caching isn't wanted. Every lookup is counted as a miss.
+    """
+
+    def __init__(self, name=None):
+        super().__init__(maxsize=1, name=name)
+        self.maxsize = 0
+
+    def __setitem__(self, key, value):
+        pass
+
+
+def new_cache(maxsize, name=None):
+    """
+    Creates a cache for the given policy.
+
+    :param maxsize: int, the maximum number of entries. 0 (or None) means no caching
+    :param name: optional str, identifies the cache in cache_statistics
+    :return: LRUCache or NullCache object
+    """
+    if not maxsize:
+        return NullCache(name=name)
+    return LRUCache(maxsize=maxsize, name=name)
+
+
+def cache_statistics():
+    """
+    :return: list of the statistics dict of every live cache in the process, largest first
+    """
+    with _registry_lock:
+        caches = list(_registry)
+    return sorted((cache.statistics for cache in caches), key=lambda statistics: -statistics["size"])
@@ -0,0 +1,79 @@
+import pickle
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from core.base.cache import LRUCache, NullCache, new_cache, cache_statistics
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache["a"] = 1
+        cache["b"] = 2
+        # reading "a" makes "b" the least recently used entry
+        self.assertEqual(1, cache["a"])
+        cache["c"] = 3
+        self.assertEqual(2, len(cache))
+        self.assertTrue("a" in cache)
+        self.assertFalse("b" in cache)
+        self.assertTrue("c" in cache)
+
+    def test_get(self):
+        cache = LRUCache()
+        cache["a"] = 1
+        self.assertEqual(1, cache.get("a"))
+        self.assertEqual(None, cache.get("b"))
+        self.assertEqual(2, cache.get("b", 2))
+        with self.assertRaises(KeyError):
+            cache["b"]
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+    def test_maxsize(self):
+        with self.assertRaises(ValueError):
+            LRUCache(maxsize=0)
+
+    def test_statistics(self):
+        cache = LRUCache(maxsize=1, name="test_statistics")
+        cache["a"] = 1
+        cache.get("a")
+        cache.get("b")
+        cache["b"] = 2
+        expected = {"name": "test_statistics", "size": 1, "maxsize": 1, "hits": 1, "misses": 1, "evictions": 1}
+        self.assertEqual(expected, cache.statistics)
+        self.assertIn(expected, cache_statistics())
+
+    def test_threads(self):
+        """a cache shared between threads stays consistent while entries are evicted"""
+        cache = LRUCache(maxsize=8)
+
+        def work(thread):
+            for index in range(2000):
+                key = (thread + index) % 32
+                if cache.get(key) is None:
+                    cache[key] = key
+            return True
+
+        with ThreadPoolExecutor(8) as executor:
+            self.assertTrue(all(executor.map(work, range(8))))
+        self.assertEqual(8, len(cache))
+        self.assertEqual(8 * 2000, cache.hits + cache.misses)
+        self.assertLessEqual(cache.evictions, cache.misses - 8)
+
+    def test_pickle(self):
+        cache = LRUCache(maxsize=2, name="test_pickle")
+        cache["a"] = 1
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(1, copy["a"])
+        copy["b"] = 2
+        self.assertEqual(1, len(cache))
+
+    def test_null_cache(self):
+        cache = new_cache(0)
+        self.assertIsInstance(cache, NullCache)
+        cache["a"] = 1
+        self.assertEqual(0, len(cache))
+        self.assertEqual(None, cache.get("a"))
+        self.assertEqual(1, cache.statistics["misses"])
+        self.assertIsInstance(new_cache(10), LRUCache)
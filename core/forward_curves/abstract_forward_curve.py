@@ -3,15 +3,28 @@ from abc import ABCMeta, abstractmethod
 
 import numpy as np
 
+from core.base.cache import LRUCache, new_cache
+from core.base.quantity import Quantity, DIMENSIONLESS
+from core.forward_curves.block_system import BlockSystem
+from core.forward_curves.cumulative_curve import cell_durations
 from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import LoadShape, BASE
 from core.time_period.time_period_sets import TimePeriodSet
 from inputs.market_data.forwards.quotes import AbstractContinuousQuotes, AbstractDailyQuotes, MissingPriceError
 
 
+# the structure of continuous curves (see AbstractContinuousForwardCurve._build_structure), keyed on the curve class,
+# the quoted time periods and AbstractContinuousForwardCurve._structure_key
+_structure_cache = LRUCache(maxsize=256, name="curve_structure")
+
+
 class AbstractForwardCurve(object, metaclass=ABCMeta):
 
+    # the default cache policy for new curves: the maximum number of prices each curve holds, 0 for no caching
+    cache_maxsize = 10000
+
     def __init__(self):
-        self._cache = {}
+        self.set_cache_policy(self.cache_maxsize)
 
     def price(self, time_period):
         """
@@ -20,10 +33,74 @@ class AbstractForwardCurve(object, metaclass=ABCMeta):
         :param delivery_period: The delivery period for the price being requested.
         :return: Quantity object with the calculated price.
         """
-        if time_period not in self._cache:
-            time_period = self._parse_time_period(time_period)
-            self._cache[time_period] = self._new_price(time_period)
-        return self._cache[time_period]
+        # parse first, so that e.g. a dt.date and the equivalent DateRange share a cache entry
+        time_period = self._parse_time_period(time_period)
+        try:
+            return self._cache[time_period]
+        except KeyError:
+            price = self._new_price(time_period)
+            self._cache[time_period] = price
+            return price
+
+    def price_many(self, periods):
+        """
+        Calculate the prices of many delivery periods at once. This implementation prices each period in turn, concrete
+        sub-classes override it with vectorised versions.
+
+        :param periods: sequence of delivery periods (anything that .price accepts), or a numpy array of ordinal dates
+        :return: Quantity object holding an array of the calculated prices
+        """
+        prices = [self.price(period) for period in self._parse_many(periods)]
+        return self._quantity_array(np.array([getattr(price, "value", price) for price in prices], np.float64),
+                                    prices[0].unit if prices and isinstance(prices[0], Quantity) else None)
+
+    def cell_weights(self, first, last, block_bitmaps):
+        """
+        The weight of each cell of a days x blocks grid when averaging prices over a period. This is the duration of
+        the cell, discounted curves override it with the discounted duration.
+
+        :param first: int, the ordinal of the first day
+        :param last: int, the ordinal of the last day
+        :param block_bitmaps: numpy int64 array of the bitmaps of blocks, each either all weekday or all weekend hours
+        :return: numpy (days x blocks) array of the weight of each cell
+        """
+        return cell_durations(np.arange(first, last + 1, dtype=np.int64), block_bitmaps)
+
+    def _parse_many(self, periods):
+        """parses each of a sequence of delivery periods, or numpy array of ordinal dates"""
+        if isinstance(periods, np.ndarray):
+            periods = [int(ordinal) for ordinal in periods.ravel()]
+        return [self._parse_time_period(period) for period in periods]
+
+    def _quantity_array(self, values, unit=None):
+        """wraps an array of prices in a Quantity, in the curve's unit unless another is given"""
+        if unit is None:
+            unit = getattr(self, "unit", DIMENSIONLESS)
+        return Quantity(values, unit)
+
+    @staticmethod
+    def _period_arrays(periods):
+        """
+        :param periods: sequence of parsed DateRange or LoadShapedDateRange objects
+        :return: tuple of numpy int64 arrays of the start ordinals, (inclusive) end ordinals and LoadShape bitmaps
+        """
+        starts = np.array([period.start.toordinal() for period in periods], np.int64)
+        ends = np.array([period.end.toordinal() for period in periods], np.int64)
+        bitmaps = np.array([getattr(period, "load_shape", BASE).bitmap for period in periods], np.int64)
+        return starts, ends, bitmaps
+
+    def set_cache_policy(self, maxsize):
+        """
+        Replaces the price cache, discarding any cached prices.
+
+        :param maxsize: int, the maximum number of prices held, least recently used first out. 0 for no caching
+        """
+        self._cache = new_cache(maxsize, name="{}@{:x}".format(type(self).__name__, id(self)))
+
+    @property
+    def cache_statistics(self):
+        """dict of the size, maxsize, and hit, miss and eviction counts of the price cache"""
+        return self._cache.statistics
 
     def _parse_time_period(self, delivery_period):
         """
@@ -68,10 +145,40 @@ class AbstractContinuousForwardCurve(AbstractForwardCurve, metaclass=ABCMeta):
     def __init__(self, quotes):
         super().__init__()
         assert isinstance(quotes, AbstractContinuousQuotes)
-        self._time_period_set = TimePeriodSet(quotes.price_dict.keys())
-        self._time_period_partition_set = self._time_period_set.partition
+        # curves with the same quoted tenors (and whatever else the transformation depends on) share their structure
+        structure_key = self._structure_key()
+        if structure_key is not None:
+            structure_key = (type(self), frozenset(quotes.price_dict), structure_key)
+        structure = _structure_cache.get(structure_key) if structure_key is not None else None
+        if structure is None:
+            structure = self._build_structure(quotes)
+            if structure_key is not None:
+                _structure_cache[structure_key] = structure
+        (self._time_period_set, self._time_period_partition_set, self._quoted_time_periods,
+         self._disjoint_time_periods, self._quoted_index, self._system) = structure
         self._prices = self._generate_disjoint_prices(quotes)
 
+    def _build_structure(self, quotes):
+        """
+        Everything about the curve that depends on the quoted time periods but not their prices: the partition, the
+        ordered quoted and disjoint time periods, and the factorised transformation matrix.
+        """
+        time_period_set = TimePeriodSet(quotes.price_dict.keys())
+        partition_set = time_period_set.partition
+        quoted_time_periods = sorted(time_period_set, key=str)
+        disjoint_time_periods = sorted(partition_set, key=str)
+        quoted_index = {time_period: index for index, time_period in enumerate(quoted_time_periods)}
+        system = BlockSystem(self._transform_time_periods(quoted_time_periods, disjoint_time_periods))
+        return time_period_set, partition_set, quoted_time_periods, disjoint_time_periods, quoted_index, system
+
+    def _structure_key(self):
+        """
+        Hashable key of everything other than the quoted time periods that the transformation matrix depends on, or
+        None if the structure can't be shared with other curves. Sub-classes whose transformation depends on more than
+        the durations of the time periods extend this.
+        """
+        return ()
+
     # TODO
     # should _generate_disjoint_prices be done in the price_dict object? Is there any extra information that makes it a
     # method of the forward curve?
@@ -83,18 +190,79 @@ class AbstractContinuousForwardCurve(AbstractForwardCurve, metaclass=ABCMeta):
         :param quotes: the input Dictionary of potentially overlapping price_dict
         :return: a new Dictionary of non-overlapping price_dict.
         """
-        quoted_time_periods = sorted(self._time_period_set, key=str)
-        disjoint_time_periods = sorted(self._time_period_partition_set, key=str)
-        quoted_values = np.array([quotes[time_period] for time_period in quoted_time_periods])
-        transformation_matrix = self._transform_time_periods(quoted_time_periods, disjoint_time_periods)
-        disjoint_prices = np.linalg.solve(transformation_matrix, quoted_values)
-        return dict(zip(disjoint_time_periods, disjoint_prices))
+        self._quoted_values = np.array([quotes[time_period] for time_period in self._quoted_time_periods], np.float64)
+        self._disjoint_values = self._system.solve(self._quoted_values)
+        return dict(zip(self._disjoint_time_periods, self._disjoint_values))
+
+    def update(self, changed_quotes):
+        """
+        Re-solves the curve for new prices of some of the quoted time periods, reusing the partition and the
+        factorised transformation matrix. Only the disjoint prices in the same blocks of the transformation matrix as
+        the changed quotes are re-solved, and only the cached prices that depend on them are discarded. Curves built
+        on top of this one (e.g. shifted curves) keep their own caches, so should be rebuilt.
+
+        :param changed_quotes: dict of the new prices (floats, or Quantities in the curve's unit), keyed by quoted time
+                               periods
+        :return: self, to allow chaining
+        """
+        rows = []
+        for time_period, quote in changed_quotes.items():
+            if time_period not in self._quoted_index:
+                raise ValueError("{} isn't quoted on this curve, so the curve must be rebuilt".format(time_period))
+            if isinstance(quote, Quantity):
+                quote = quote.convert(getattr(self, "unit", DIMENSIONLESS)).value
+            rows.append(self._quoted_index[time_period])
+            self._quoted_values[rows[-1]] = quote
+        changed = self._system.solve_rows(self._quoted_values, self._disjoint_values, rows)
+        changed_time_period_sets = [self._disjoint_time_periods[index] for index in changed]
+        for index, time_period_set in zip(changed, changed_time_period_sets):
+            self._prices[time_period_set] = self._disjoint_values[index]
+        self._prices_changed(changed_time_period_sets)
+        return self
+
+    def _prices_changed(self, changed_time_period_sets):
+        """
+        Called when the disjoint prices of some of the partition have changed, discards the cached prices of the time
+        periods that intersect them. Sub-classes holding other state derived from the prices extend this.
+
+        :param changed_time_period_sets: list of the TimePeriodSets of the partition whose prices have changed
+        """
+        for time_period in self._cache.keys():
+            if any(time_period_set.intersects(time_period) for time_period_set in changed_time_period_sets):
+                self._cache.pop(time_period)
 
     @abstractmethod
     def _transform_time_periods(self, quoted_time_periods, disjoint_time_periods):
         """Provided by concrete sub-classes, e.g. because CommodityForwardCurve needs settlement rules and
         discount curve to do this transformation, whereas DailyShapeRatioCurve doesn't"""
 
+    def _transformation_matrix(self, quoted_time_periods, disjoint_time_periods, atom_durations, quoted_durations):
+        """
+        Builds the NxN square matrix where:
+                M_{i,j} = (duration of disjoint_time_period[j] intersecting quoted_time_period[i]) /
+                                (duration of quoted_time_period[i])
+        from the incidence of the atomic periods of the partition on the quoted time periods. Each atomic period is
+        either within or disjoint from each quoted time period, so the incidence is found by comparing days and load
+        shapes in bulk.
+
+        :param quoted_time_periods: list of the quoted time periods
+        :param disjoint_time_periods: list of the TimePeriodSets of the partition
+        :param atom_durations: function returning a numpy array of the durations of a list of atomic periods
+        :param quoted_durations: function returning a numpy array of the durations of a list of quoted time periods
+        :return: numpy array
+        """
+        atoms = [atom for disjoint_time_period in disjoint_time_periods for atom in disjoint_time_period]
+        classes = np.repeat(np.arange(len(disjoint_time_periods)),
+                            [len(disjoint_time_period) for disjoint_time_period in disjoint_time_periods])
+        quoted_starts, quoted_ends, quoted_bitmaps = self._period_arrays(quoted_time_periods)
+        atom_starts, atom_ends, atom_bitmaps = self._period_arrays(atoms)
+        incidence = ((quoted_starts[:, np.newaxis] <= atom_ends) & (atom_starts <= quoted_ends[:, np.newaxis]) &
+                     ((quoted_bitmaps[:, np.newaxis] & atom_bitmaps) != 0))
+        membership = np.zeros((len(atoms), len(disjoint_time_periods)))
+        membership[np.arange(len(atoms)), classes] = 1
+        matrix = (incidence * atom_durations(atoms)).dot(membership)
+        return matrix / quoted_durations(quoted_time_periods)[:, np.newaxis]
+
 
 class AbstractDailyForwardCurve(AbstractForwardCurve):
     """
@@ -106,55 +274,148 @@ class AbstractDailyForwardCurve(AbstractForwardCurve):
         assert isinstance(quotes, AbstractDailyQuotes)
         self.value_date = quotes.value_date
         self._dates = quotes.dates
-        self._cache = {}
+
+    def _check_bounds_many(self, dates):
+        """vector version of _check_bounds, for a numpy array of dates relative to the value date"""
+        outside = (dates < self._dates[0]) | (dates > self._dates[-1])
+        if np.any(outside):
+            self._check_bounds(int(dates[np.argmax(outside)]))
 
     def _check_bounds(self, date):
         if date < self._dates[0] or date > self._dates[-1]:
             date = date + self.value_date
             raise MissingPriceError("Date requested ({})is outside the quoted period ({} to {})"
                                     .format(dt.date.fromordinal(date),
-                                            dt.date.fromordinal(self._dates[0]),
-                                            dt.date.fromordinal(self._dates[-1])))
+                                            dt.date.fromordinal(int(self._dates[0]) + self.value_date),
+                                            dt.date.fromordinal(int(self._dates[-1]) + self.value_date)))
 
 
 class ShiftedForwardPriceCurve(AbstractForwardCurve):
     """
     Applies a multiplicative shift to a forward curve. Uses Decorator pattern.
+
+    Shifting a shifted curve doesn't stack another decorator: the shifts are folded into a single piecewise-constant
+    shift profile over the input curve (see _ShiftProfile), so the cost of pricing doesn't grow with the number of
+    shifts.
     """
 
     def __init__(self, input_curve, shift_time_period, shift_factor):
         super().__init__()
+        self.layers = [(shift_time_period, shift_factor)]
+        if isinstance(input_curve, ShiftedForwardPriceCurve):
+            self.layers = input_curve.layers + self.layers
+            input_curve = input_curve.input_curve
         self.input_curve = input_curve
         self.shift_time_period = shift_time_period
         self.shift_factor = shift_factor
+        self._profile = _ShiftProfile(self.layers)
+
+    def cell_weights(self, first, last, block_bitmaps):
+        """the shift doesn't change how prices are averaged, so these are the weights of the input curve"""
+        return self.input_curve.cell_weights(first, last, block_bitmaps)
+
+    def price_many(self, periods):
+        """
+        Vectorised version of price. Periods with a single shift factor across them (including those that don't touch
+        the shifts) are priced in bulk from the input curve, only those that straddle the edge of a shift are priced
+        one by one.
+        """
+        periods = self._parse_many(periods)
+        input_prices = self.input_curve.price_many(periods)
+        factors = self._profile.uniform_factors(*self._period_arrays(periods))
+        values = factors * input_prices.value
+        for index in np.flatnonzero(np.isnan(factors)):
+            price = self.price(periods[index])
+            values[index] = getattr(price, "value", price)
+        return Quantity(values, input_prices.unit)
 
     def _new_price(self, delivery_period):
-        input_price = self.input_curve.price(delivery_period)
-        # 3 cases:
-        #   1) shift_time_period contains delivery_period -> transform the price
-        #   2) shift_time_period intersects but does not contain delivery_period -> compute the partition and
-        #      transform the price within the relevant part of the partition.
-        #   3) shift_time_period does not intersect time_period -> do not transform the price.
-        if self.shift_time_period.intersects(delivery_period):
-            # case 1
-            if delivery_period in self.shift_time_period:
-                return self.shift_factor * input_price
-            # case 2
-            else:
-                intersection = self.shift_time_period.intersection(delivery_period)
-                differences = delivery_period.difference(self.shift_time_period)
-                duration = intersection.duration
-                # first get the intersection price, which contains the shift and time weight.
-                value = self.price(intersection) * duration
-                # now get the unshifted prices, for all of the other parts of delivery_period, and time weight them too.
-                for difference in differences:
-                    difference_duration = difference.duration
-                    if difference_duration:
-                        value += self.price(difference) * difference_duration
-                        duration += difference_duration
-                assert duration > 0
-                return value / duration
-        # case 3
-        else:
-            return input_price
+        pieces = [(factor, piece, piece.duration) for factor, piece in self._profile.pieces(delivery_period)]
+        pieces = [(factor, piece, duration) for factor, piece, duration in pieces if duration > 0]
+        factors = set(factor for factor, _, _ in pieces)
+        # if the whole of the delivery period has the same shift, transform its price
+        if len(factors) <= 1:
+            input_price = self.input_curve.price(delivery_period)
+            factor = factors.pop() if factors else 1
+            return input_price if factor == 1 else factor * input_price
+        # otherwise transform the price of each piece of the delivery period, and time weight them
+        value = 0
+        duration = 0
+        for factor, piece, piece_duration in pieces:
+            value += factor * self.input_curve.price(piece) * piece_duration
+            duration += piece_duration
+        return value / duration
+
+
+class _ShiftProfile(object):
+    """
+    The combined multiplicative shift of a stack of (shift time period, shift factor) layers, held as a sorted map of
+    day intervals to the shift factor of each load shape block. The blocks are the finest LoadShapes that can be built
+    from the load shapes of the layers (just BASE if they're all DateRanges), and adjacent intervals with the same
+    factors are merged.
+    """
+
+    def __init__(self, layers):
+        blocks = {BASE.bitmap}
+        for time_period, _ in layers:
+            bitmap = getattr(time_period, "load_shape", BASE).bitmap
+            blocks = {part for block in blocks for part in (block & bitmap, block & ~bitmap) if part}
+        self.block_bitmaps = np.array(sorted(blocks), np.int64)
+        bounds = np.unique([ordinal for time_period, _ in layers
+                            for ordinal in (time_period.start.toordinal(), time_period.end.toordinal() + 1)])
+        factors = np.ones((len(bounds) - 1, len(self.block_bitmaps)))
+        for time_period, factor in layers:
+            bitmap = getattr(time_period, "load_shape", BASE).bitmap
+            intervals = (time_period.start.toordinal() <= bounds[:-1]) & (bounds[:-1] <= time_period.end.toordinal())
+            factors[np.ix_(intervals, (self.block_bitmaps & bitmap) != 0)] *= factor
+        # merge adjacent intervals with the same factors
+        changes = np.concatenate([[True], np.any(factors[1:] != factors[:-1], axis=1), [True]])
+        self.bounds = bounds[changes]
+        self.factors = factors[changes[:-1]]
+
+    def pieces(self, time_period):
+        """
+        Splits the time period at the edges of the shifts.
+
+        :param time_period: DateRange or LoadShapedDateRange object
+        :return: list of (shift factor, DateRange or LoadShapedDateRange) tuples
+        """
+        start, end = time_period.start.toordinal(), time_period.end.toordinal()
+        bitmap = getattr(time_period, "load_shape", BASE).bitmap
+        bounds = np.concatenate([[start], self.bounds[(start < self.bounds) & (self.bounds <= end)], [end + 1]])
+        pieces = []
+        for lower, upper in zip(bounds[:-1], bounds[1:]):
+            interval = np.searchsorted(self.bounds, lower, side="right") - 1
+            date_range = DateRange(dt.date.fromordinal(int(lower)), dt.date.fromordinal(int(upper - 1)))
+            if interval < 0 or interval >= len(self.factors):
+                pieces.append((1, _piece(time_period, date_range, bitmap)))
+                continue
+            for block, factor in zip(self.block_bitmaps, self.factors[interval]):
+                if block & bitmap:
+                    pieces.append((factor, _piece(time_period, date_range, int(block & bitmap))))
+        return pieces
+
+    def uniform_factors(self, starts, ends, bitmaps):
+        """
+        :param starts: numpy int64 array of the start ordinal of each period
+        :param ends: numpy int64 array of the (inclusive) end ordinal of each period
+        :param bitmaps: numpy int64 array of the LoadShape bitmap of each period
+        :return: numpy array of the shift factor of each period, or NaN where it isn't the same across the period
+        """
+        first_intervals = np.searchsorted(self.bounds, starts, side="right") - 1
+        last_intervals = np.searchsorted(self.bounds, ends, side="right") - 1
+        outside = (last_intervals < 0) | (first_intervals >= len(self.factors))
+        within = (first_intervals == last_intervals) & ~outside & (first_intervals >= 0)
+        rows = self.factors[np.clip(first_intervals, 0, len(self.factors) - 1)]
+        used = (bitmaps[:, np.newaxis] & self.block_bitmaps) != 0
+        highest = np.where(used, rows, -np.inf).max(axis=1)
+        lowest = np.where(used, rows, np.inf).min(axis=1)
+        uniform = within & (highest == lowest)
+        return np.where(outside, 1., np.where(uniform, highest, np.nan))
+
 
+def _piece(time_period, date_range, bitmap):
+    """the part of the time period on the given days and hours, as a DateRange if possible"""
+    if bitmap == BASE.bitmap and not isinstance(time_period, LoadShapedDateRange):
+        return date_range
+    return LoadShapedDateRange(date_range, LoadShape(bitmap))
@@ -0,0 +1,187 @@
+import numpy as np
+
+
+class BlockSystem(object):
+    """
+    A square linear system M x = b, split into its independent blocks. Two unknowns are in the same block if some row
+    of M involves both, so e.g. the transformation matrix of a curve quoted as months and quarters has a block per
+    quarter (the quarter and its months) and a block of one for each other month. Each block is factorised once, so
+    solving for a new right hand side (or many right hand sides at once) costs a substitution per block.
+
+    Nested tenors (e.g. a calendar, its seasons and some of their quarters and months) chain into one block, but can
+    be ordered so that each row settles one more unknown, which makes the block triangular, and it's solved by forward
+    substitution in that order. Other blocks (e.g. overlapping periods that don't nest) are LU factorised, with
+    partial pivoting.
+    """
+
+    def __init__(self, matrix):
+        """
+        :param matrix: square numpy array
+        :raises np.linalg.LinAlgError: if the matrix is singular
+        """
+        matrix = np.asarray(matrix, np.float64)
+        rows, columns = matrix.shape
+        if rows != columns:
+            raise np.linalg.LinAlgError("matrix must be square: {} provided".format(matrix.shape))
+        self.size = rows
+        self.blocks = []
+        for block_rows, block_columns in _components(matrix != 0):
+            if len(block_rows) != len(block_columns):
+                raise np.linalg.LinAlgError("Singular matrix")
+            block = matrix[np.ix_(block_rows, block_columns)]
+            order = _triangular_order(block)
+            factor = _LUFactor(block) if order is None else _TriangularFactor(block, *order)
+            self.blocks.append((block_rows, block_columns, factor))
+        self._row_blocks = np.zeros(rows, np.int64)
+        for index, (block_rows, _, _) in enumerate(self.blocks):
+            self._row_blocks[block_rows] = index
+
+    def solve(self, rhs):
+        """
+        :param rhs: numpy array, either one right hand side (length n) or one per column (n x k)
+        :return: numpy array of the solution(s), the same shape as rhs
+        """
+        rhs = np.asarray(rhs, np.float64)
+        solution = np.empty(rhs.shape)
+        for block_rows, block_columns, factor in self.blocks:
+            solution[block_columns] = factor.solve(rhs[block_rows])
+        return solution
+
+    def solve_rows(self, rhs, solution, changed_rows):
+        """
+        Updates a solution in place for a change to some rows of the right hand side, re-solving only the blocks that
+        include them.
+
+        :param rhs: numpy array, the new right hand side
+        :param solution: numpy array, the solution for the old right hand side, which is updated
+        :param changed_rows: sequence of the indices of the rows of rhs that have changed
+        :return: numpy int64 array of the indices of the unknowns that were re-solved
+        """
+        rhs = np.asarray(rhs, np.float64)
+        changed_columns = [np.zeros(0, np.int64)]
+        for index in np.unique(self._row_blocks[np.asarray(changed_rows, np.int64)]):
+            block_rows, block_columns, factor = self.blocks[index]
+            solution[block_columns] = factor.solve(rhs[block_rows])
+            changed_columns.append(block_columns)
+        return np.concatenate(changed_columns)
+
+
+class _TriangularFactor(object):
+    """a square matrix whose rows and columns can be ordered to make it lower triangular, solved by substitution"""
+
+    def __init__(self, matrix, rows, columns):
+        """
+        :param matrix: square numpy array
+        :param rows: numpy int64 array of the order of the rows, see _triangular_order
+        :param columns: numpy int64 array of the order of the columns
+        """
+        self._rows = rows
+        self._columns = columns
+        self._lower = matrix[np.ix_(rows, columns)]
+
+    def solve(self, rhs):
+        """
+        :param rhs: numpy array, either one right hand side (length n) or one per column (n x k)
+        :return: numpy array of the solution(s), the same shape as rhs
+        """
+        rhs = rhs[self._rows]
+        ordered = np.empty(rhs.shape)
+        for index in range(len(ordered)):
+            ordered[index] = (rhs[index] - self._lower[index, :index].dot(ordered[:index])) / self._lower[index, index]
+        solution = np.empty(rhs.shape)
+        solution[self._columns] = ordered
+        return solution
+
+
+class _LUFactor(object):
+    """the LU factorisation, with partial pivoting, of a square matrix"""
+
+    def __init__(self, matrix):
+        """
+        :param matrix: square numpy array
+        :raises np.linalg.LinAlgError: if the matrix is singular
+        """
+        lu = np.array(matrix, np.float64)
+        pivots = np.arange(len(lu))
+        for index in range(len(lu)):
+            pivot = index + np.argmax(np.abs(lu[index:, index]))
+            if lu[pivot, index] == 0:
+                raise np.linalg.LinAlgError("Singular matrix")
+            lu[[index, pivot]] = lu[[pivot, index]]
+            pivots[[index, pivot]] = pivots[[pivot, index]]
+            lu[index + 1:, index] /= lu[index, index]
+            lu[index + 1:, index + 1:] -= np.outer(lu[index + 1:, index], lu[index, index + 1:])
+        self._lu = lu
+        self._pivots = pivots
+
+    def solve(self, rhs):
+        """
+        :param rhs: numpy array, either one right hand side (length n) or one per column (n x k)
+        :return: numpy array of the solution(s), the same shape as rhs
+        """
+        solution = np.array(rhs[self._pivots], np.float64)
+        for index in range(len(solution)):
+            solution[index] -= self._lu[index, :index].dot(solution[:index])
+        for index in reversed(range(len(solution))):
+            solution[index] -= self._lu[index, index + 1:].dot(solution[index + 1:])
+            solution[index] /= self._lu[index, index]
+        return solution
+
+
+def _triangular_order(matrix):
+    """
+    An order of the rows and columns of a square matrix that makes it lower triangular, found by repeatedly taking a
+    row with a single non zero among the columns not yet ordered (e.g. a month within a quoted quarter, before the
+    quarter).
+
+    :param matrix: square numpy array
+    :return: tuple of numpy int64 arrays of the order of the rows and of the columns, or None if there isn't one
+    """
+    nonzero = matrix != 0
+    unordered = nonzero.sum(axis=1)
+    rows_ordered = np.zeros(len(matrix), bool)
+    columns_ordered = np.zeros(len(matrix), bool)
+    rows, columns = [], []
+    pending = list(np.flatnonzero(unordered == 1))
+    while pending:
+        row = pending.pop()
+        if rows_ordered[row] or unordered[row] != 1:
+            continue
+        column = np.flatnonzero(nonzero[row] & ~columns_ordered)[0]
+        rows.append(row)
+        columns.append(column)
+        rows_ordered[row] = True
+        columns_ordered[column] = True
+        for other in np.flatnonzero(nonzero[:, column] & ~rows_ordered):
+            unordered[other] -= 1
+            if unordered[other] == 1:
+                pending.append(other)
+    if len(rows) < len(matrix):
+        return None
+    return np.array(rows, np.int64), np.array(columns, np.int64)
+
+
+def _components(incidence):
+    """
+    The connected components of the bipartite graph between rows and columns given by a boolean incidence matrix.
+
+    :return: list of (row indices, column indices) tuples of numpy int64 arrays
+    """
+    rows, columns = incidence.shape
+    # union-find over the rows (0 to rows - 1) and columns (rows to rows + columns - 1)
+    parents = list(range(rows + columns))
+
+    def find(node):
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    for row, column in zip(*np.nonzero(incidence)):
+        parents[find(int(row))] = find(rows + int(column))
+    roots = np.array([find(node) for node in range(rows + columns)])
+    components = []
+    for root in np.unique(roots):
+        members = np.flatnonzero(roots == root)
+        components.append((members[members < rows], members[members >= rows] - rows))
+    return components
@@ -0,0 +1,154 @@
+import datetime as dt
+
+import numpy as np
+
+from core.base.quantity import Quantity
+from core.forward_curves.abstract_forward_curve import ShiftedForwardPriceCurve
+from core.forward_curves.cumulative_curve import CumulativeCurve, atomic_bitmaps, cell_durations, load_shape_bitmap, \
+    period_durations
+from core.time_period.date_range import LoadShapedDateRange
+from core.time_period.load_shape import LoadShape, BASE
+from inputs.market_data.forwards.quotes import MissingPriceError
+
+
+class BumpedCurveSet(object):
+    """
+    Prices a set of periods under each of N bucket shifts of a curve in one vectorised pass, e.g. for a delta ladder
+    across monthly buckets, instead of building a ShiftedForwardPriceCurve per bucket.
+
+    ShiftedForwardPriceCurve prices a period that straddles the edge of the shifted bucket by splitting it into pieces
+    (the part within the bucket, which is shifted, and the parts outside it) and time weighting their prices. So
+    shifting bucket k by a factor f prices a period P at offset(P, k) + price(P) + (f - 1) x exposure(P, k), where
+    exposure(P, k) = price(P & k) x duration(P & k) / duration(P), and offset(P, k) is the difference between the
+    time weighted average price of the pieces and price(P), which is 0 for undiscounted curves. Neither depends on the
+    shift factor, so they're computed once for every (bucket, period) pair. The price of each piece is read from a
+    dense grid of the curve's prices over the days x load shape blocks of the buckets, which is priced once and
+    weighted by the curve's cell_weights (the discounted durations, for a CommodityForwardCurve), so the prices match
+    ShiftedForwardPriceCurve. Pairs that the grid can't price (e.g. periods whose load shape isn't made of whole
+    blocks) are priced through a ShiftedForwardPriceCurve instead.
+    """
+
+    def __init__(self, curve, buckets, load_shapes=()):
+        """
+        :param curve: the AbstractForwardCurve to be shifted
+        :param buckets: sequence of DateRange or LoadShapedDateRange objects, the periods shifted by each bump
+        :param load_shapes: sequence of the LoadShapes of the periods to be priced, if not just BASE and those of the
+                            buckets, so that the grid is fine enough to price them
+        """
+        self.curve = curve
+        self.buckets = list(buckets)
+        if not self.buckets:
+            raise ValueError("need at least one bucket to shift")
+        self._bucket_starts = np.array([bucket.start.toordinal() for bucket in self.buckets], np.int64)
+        self._bucket_ends = np.array([bucket.end.toordinal() for bucket in self.buckets], np.int64)
+        self._bucket_bitmaps = np.array([load_shape_bitmap(bucket) for bucket in self.buckets], np.int64)
+        bitmaps = set(self._bucket_bitmaps.tolist()) | {BASE.bitmap}
+        bitmaps |= {LoadShape(load_shape).bitmap if isinstance(load_shape, str) else load_shape.bitmap
+                    for load_shape in load_shapes}
+        self._grid = self._build_grid(atomic_bitmaps(bitmaps))
+
+    def _build_grid(self, block_bitmaps):
+        """prices every cell of the days x blocks grid spanning the buckets"""
+        first, last = int(self._bucket_starts.min()), int(self._bucket_ends.max())
+        block_bitmaps = np.array(block_bitmaps, np.int64)
+        durations = cell_durations(np.arange(first, last + 1), block_bitmaps)
+        days, blocks = np.nonzero(durations)
+        cells = [LoadShapedDateRange(dt.date.fromordinal(first + int(day)), LoadShape(int(block_bitmaps[block])))
+                 for day, block in zip(days, blocks)]
+        values = np.zeros(durations.shape)
+        values[days, blocks] = _prices(self.curve, cells)
+        return CumulativeCurve(first, block_bitmaps, values, self.curve.cell_weights(first, last, block_bitmaps))
+
+    def exposures(self, periods):
+        """
+        :param periods: sequence of DateRange or LoadShapedDateRange objects (each with positive duration)
+        :return: numpy (buckets x periods) array of the price of each period within each bucket, time weighted by the
+                 fraction of the period within the bucket
+        """
+        periods = list(periods)
+        return self._components(periods, self.curve.price_many(periods).value)[0]
+
+    def prices(self, periods, shift_factor):
+        """
+        :param periods: sequence of DateRange or LoadShapedDateRange objects (each with positive duration)
+        :param shift_factor: the multiplicative shift applied to each bucket in turn, e.g. 1.01 for an up shift
+        :return: Quantity holding a (buckets x periods) array of the price of each period with each bucket shifted
+        """
+        periods = list(periods)
+        base_prices = self.curve.price_many(periods)
+        if shift_factor == 1:
+            return Quantity(np.repeat(base_prices.value[np.newaxis, :], len(self.buckets), axis=0), base_prices.unit)
+        exposures, offsets = self._components(periods, base_prices.value)
+        return Quantity(base_prices.value + offsets + (shift_factor - 1) * exposures, base_prices.unit)
+
+    def _components(self, periods, base_prices):
+        """
+        :param periods: list of DateRange or LoadShapedDateRange objects (each with positive duration)
+        :param base_prices: numpy array of the unshifted price of each period
+        :return: tuple of numpy (buckets x periods) arrays of the exposure and the offset of each period to each bucket
+        """
+        starts = np.array([period.start.toordinal() for period in periods], np.int64)
+        ends = np.array([period.end.toordinal() for period in periods], np.int64)
+        bitmaps = np.array([load_shape_bitmap(period) for period in periods], np.int64)
+        bucket_starts = self._bucket_starts[:, np.newaxis]
+        bucket_ends = self._bucket_ends[:, np.newaxis]
+        bucket_bitmaps = self._bucket_bitmaps[:, np.newaxis]
+        overlap_starts = np.maximum(bucket_starts, starts)
+        overlap_ends = np.minimum(bucket_ends, ends)
+        # the pieces that ShiftedForwardPriceCurve splits each period into: the part within the bucket (which is
+        # shifted), the other hours of the bucket's days, and the days before and after the bucket
+        pieces = [(overlap_starts, overlap_ends, bucket_bitmaps & bitmaps),
+                  (overlap_starts, overlap_ends, ~bucket_bitmaps & bitmaps),
+                  (starts, np.minimum(ends, bucket_starts - 1), bitmaps),
+                  (np.maximum(starts, bucket_ends + 1), ends, bitmaps)]
+        shape = overlap_starts.shape
+        durations = []
+        amounts = []
+        valid = np.ones(shape, bool)
+        for piece_starts, piece_ends, piece_bitmaps in pieces:
+            piece_starts, piece_ends, piece_bitmaps = (np.broadcast_to(array, shape).ravel()
+                                                       for array in (piece_starts, piece_ends, piece_bitmaps))
+            piece_durations = period_durations(piece_starts, piece_ends, piece_bitmaps)
+            values, weights, priced = self._grid.sums_many(piece_starts, piece_ends, piece_bitmaps)
+            priced &= weights > 0
+            # each piece is priced as the weighted average of its cells, and time weighted by its duration
+            amounts.append(np.where(priced, values / np.where(priced, weights, 1), 0.).reshape(shape) *
+                           piece_durations.reshape(shape))
+            durations.append(piece_durations.reshape(shape))
+            valid &= priced.reshape(shape) | (durations[-1] == 0)
+        period_duration = sum(durations)
+        shifted = durations[0] > 0
+        straddles = shifted & (durations[1] + durations[2] + durations[3] > 0)
+        within = shifted & ~straddles
+        exposures = np.where(straddles, amounts[0] / period_duration, np.where(within, base_prices, 0.))
+        offsets = np.where(straddles, sum(amounts) / period_duration - base_prices, 0.)
+        for bucket, period in zip(*np.nonzero(~valid & straddles)):
+            exposures[bucket, period], offsets[bucket, period] = self._fallback(self.buckets[bucket], periods[period],
+                                                                                base_prices[period])
+        return exposures, offsets
+
+    def _fallback(self, bucket, period, base_price):
+        """the exposure and offset of one period to one bucket, priced through ShiftedForwardPriceCurves"""
+        doubled = _value(ShiftedForwardPriceCurve(self.curve, bucket, 2).price(period))
+        tripled = _value(ShiftedForwardPriceCurve(self.curve, bucket, 3).price(period))
+        return tripled - doubled, 2 * doubled - tripled - base_price
+
+
+def _value(price):
+    """the value of a price, which may or may not be a Quantity"""
+    return getattr(price, "value", price)
+
+
+def _prices(curve, cells):
+    """prices the cells in bulk, with NaN for any that the curve can't price"""
+    try:
+        return curve.price_many(cells).value
+    except MissingPriceError:
+        prices = np.full(len(cells), np.nan)
+        for index, cell in enumerate(cells):
+            try:
+                price = curve.price(cell)
+            except MissingPriceError:
+                continue
+            prices[index] = _value(price)
+        return prices
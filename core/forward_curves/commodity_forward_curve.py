@@ -3,14 +3,22 @@
 # settlement date conventions between the settlement dates supplied in the input price_dict object and the default
 # settlement dates of the asset.
 
+import datetime as dt
+
 import numpy as np
+import pandas as pd
 from inputs.market_data.forwards.daily_shape_calibration import AbstractDailyShapeCalibration
 from inputs.market_data.forwards.intraday_shape_calibration import BaseIntradayShapeCalibration
 
-from core.base.quantity import DAY
+from core.base.quantity import DAY, Quantity
 from core.forward_curves.abstract_forward_curve import AbstractContinuousForwardCurve
+from core.forward_curves.cumulative_curve import CumulativeCurve, atomic_bitmaps, cell_durations, load_shape_bitmap, \
+    period_durations
 from core.forward_curves.fx_rates_forward_curves import DiscountCurve, ForeignDiscountCurve
 from core.forward_curves.shape_ratio import ShapeAlgorithm
+from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import LoadShape
+from core.time_period.time_utilities import EPOCH_ORDINAL
 from inputs.market_data.forwards.quotes import MissingPriceError, ContinuousQuotes
 from inputs.static_data.time_constants import SECONDS_PER_DAY
 
@@ -20,12 +28,14 @@ class CommodityForwardCurve(AbstractContinuousForwardCurve):
     Generic class for Commodity Forward curves.
     """
 
-    def __init__(self, quotes, discount_curve, daily_shape_calibration=None, intraday_shape_calibration=None):
+    def __init__(self, quotes, discount_curve, daily_shape_calibration=None, intraday_shape_calibration=None,
+                 materialise=False):
         """
         :param quotes: a Quotes object
         :param discount_curve: a DiscountCurve object
         :param daily_shape_calibration: a DailyShapeCalibration object
         :param intraday_shape_calibration: an IntradayShapeCalibration object
+        :param materialise: if True, solve the curve onto a dense price grid up front, see .materialise()
         """
         assert isinstance(quotes, ContinuousQuotes)
         assert isinstance(discount_curve, (DiscountCurve, ForeignDiscountCurve))
@@ -35,46 +45,273 @@ class CommodityForwardCurve(AbstractContinuousForwardCurve):
         if intraday_shape_calibration:
             assert isinstance(intraday_shape_calibration, BaseIntradayShapeCalibration)
         self._discount_curve = discount_curve
-        self._shape = ShapeAlgorithm(daily_shape_calibration, intraday_shape_calibration)
+        # shape ratios average the shape by discounted duration, consistent with the prices of the partition
+        self._shape = ShapeAlgorithm(daily_shape_calibration, intraday_shape_calibration, self._day_discount_factors)
         self._settlement_rule = quotes.settlement_rule
         self.unit = quotes.unit
+        self._grid = None
         super().__init__(quotes)
+        if materialise:
+            self.materialise()
+
+    def materialise(self):
+        """
+        Solves the curve once onto a dense grid of days x load shape blocks over the quoted horizon, holding the shaped
+        price and discounted duration of each cell. The blocks are the finest LoadShapes that can be built from the
+        quoted load shapes (or single hours, if there's an intraday shape calibration). After this, the price of any
+        period made of whole blocks is a discounted duration weighted mean read from prefix sums, in O(1). Other periods
+        are still priced from the partition.
+
+        The shape ratios are averaged by discounted duration, so the discounted duration weighted mean of the shape
+        over each partition is 1. The grid so reprices each partition, and hence each quote, exactly, and prices any
+        other period as it's priced from the partition.
+
+        :return: self, to allow chaining
+        """
+        self._grid_layout = self._layout()
+        self._build_grid()
+        self._cache.clear()
+        return self
+
+    def _layout(self):
+        """
+        The layout of the materialised grid, which doesn't depend on the prices (so is kept in case they're updated).
+
+        :return: tuple of the first ordinal, the numpy array of block bitmaps, the list of TimePeriodSets of the
+                 partition, the numpy (days x blocks) arrays of the index in the partition of each cell (-1 if it isn't
+                 quoted), the shape ratio of each cell and the discounted duration of each cell
+        """
+        classes = list(self._time_period_partition_set)
+        members = [(index, time_period) for index, time_period_set in enumerate(classes)
+                   for time_period in time_period_set]
+        first = min(time_period.start for _, time_period in members).toordinal()
+        last = max(time_period.end for _, time_period in members).toordinal()
+        if self._shape.intraday_shape_calibration:
+            block_bitmaps = [1 << bit for bit in range(48)]
+        else:
+            block_bitmaps = atomic_bitmaps(load_shape_bitmap(time_period) for _, time_period in members)
+        block_bitmaps = np.array(block_bitmaps, np.int64)
+        durations = cell_durations(np.arange(first, last + 1, dtype=np.int64), block_bitmaps)
+
+        # the partition that each cell belongs to, or -1 if it isn't quoted
+        class_index = np.full(durations.shape, -1, np.int64)
+        for index, time_period in members:
+            bitmap = load_shape_bitmap(time_period)
+            within = (block_bitmaps & bitmap) == block_bitmaps
+            class_index[time_period.start.toordinal() - first:time_period.end.toordinal() - first + 1, within] = index
+
+        weights = self.cell_weights(first, last, block_bitmaps)
+
+        shape_ratios = np.ones(durations.shape)
+        if self._shape.is_shaped:
+            for index, time_period_set in enumerate(classes):
+                days, blocks = np.nonzero((class_index == index) & (durations > 0))
+                cells = [LoadShapedDateRange(DateRange(dt.date.fromordinal(int(first + day)), range_type='d'),
+                                             LoadShape(int(block_bitmaps[block])))
+                         for day, block in zip(days, blocks)]
+                shape_ratios[days, blocks] = self._shape.shape_ratios(cells, time_period_set)
+        return first, block_bitmaps, classes, class_index, shape_ratios, weights
+
+    def cell_weights(self, first, last, block_bitmaps):
+        """
+        The discounted duration of each cell of a days x blocks grid: prices are averaged with these weights.
+
+        :param first: int, the ordinal of the first day
+        :param last: int, the ordinal of the last day
+        :param block_bitmaps: numpy int64 array of the bitmaps of blocks, each either all weekday or all weekend hours
+        :return: numpy (days x blocks) array of the discounted duration, in days, of each cell
+        """
+        discount_factors = self._day_discount_factors(first, last)[:, np.newaxis]
+        return cell_durations(np.arange(first, last + 1, dtype=np.int64), block_bitmaps) * discount_factors
+
+    def _day_discount_factors(self, first, last):
+        """numpy array of the discount factor of the settlement date of each day from first to last"""
+        schedule = self._settlement_rule.settlement_schedule(first, last)
+        return self._discount_curve.discount_factors(schedule)
+
+    def _build_grid(self):
+        """builds the materialised grid from the current prices of the partition"""
+        first, block_bitmaps, _, _, _, weights = self._grid_layout
+        values = self._cell_values(self._grid_layout)
+        self._grid = CumulativeCurve(first, block_bitmaps, values, weights)
+        # the price of each cell, kept so that hourly prices can be read off without re-pricing
+        self._grid_values = values
+
+    def _cell_values(self, layout):
+        """
+        :param layout: tuple, from ._layout()
+        :return: numpy (days x blocks) array of the shaped price of each cell from the current prices of the partition,
+                 with NaN for the cells that aren't quoted
+        """
+        _, _, classes, class_index, shape_ratios, _ = layout
+        prices = np.array([self._prices[time_period_set] for time_period_set in classes], np.float64)
+        return np.where(class_index >= 0, prices[class_index], np.nan) * shape_ratios
+
+    def _prices_changed(self, changed_time_period_sets):
+        super()._prices_changed(changed_time_period_sets)
+        if self._grid is not None:
+            self._build_grid()
+
+    def iter_hourly_chunks(self, chunk_days=31, start=None, end=None):
+        """
+        Streams the price of every hour from start to end, chunk_days days at a time. The prices are read in bulk from
+        the materialised grid (or, if the curve isn't materialised, from a grid built for the export alone, so that the
+        curve's prices don't change): each hour is priced as the cell of the grid that contains it, so is shaped by
+        the intraday calibration if there is one, and is flat across each load shape block otherwise. Only one chunk
+        of hourly prices is held at a time.
+
+        :param chunk_days: int, the number of days in each chunk
+        :param start: optional dt.date, the first day (by default the start of the quoted horizon)
+        :param end: optional dt.date, the last day (by default the end of the quoted horizon)
+        :return: generator of tuples of numpy arrays of the start of each hour (datetime64[h]) and the price of the
+                 hour (in the curve's unit)
+        :raises MissingPriceError: if any of the hours can't be priced
+        """
+        if chunk_days < 1:
+            raise ValueError("chunk_days must be a positive integer: {} provided".format(chunk_days))
+        if self._grid is None:
+            layout = self._layout()
+            first, block_bitmaps, values = layout[0], layout[1], self._cell_values(layout)
+        else:
+            first, block_bitmaps, values = self._grid.first, self._grid.block_bitmaps, self._grid_values
+        last = first + len(values) - 1
+        start = first if start is None else start.toordinal()
+        end = last if end is None else end.toordinal()
+        if start < first or end > last:
+            raise MissingPriceError("Hourly prices requested from {} to {}, but the curve only covers {} to {}"
+                                    .format(dt.date.fromordinal(start), dt.date.fromordinal(end),
+                                            dt.date.fromordinal(first), dt.date.fromordinal(last)))
+        hour_blocks = _hour_blocks(block_bitmaps)
+        for chunk_start in range(start, end + 1, chunk_days):
+            ordinals = np.arange(chunk_start, min(chunk_start + chunk_days - 1, end) + 1)
+            weekend = ((ordinals - 1) % 7 > 4).astype(np.int64)
+            prices = values[ordinals[:, np.newaxis] - first, hour_blocks[weekend]]
+            if np.any(np.isnan(prices)):
+                day, hour = np.argwhere(np.isnan(prices))[0]
+                raise MissingPriceError("Couldn't price hour {} of {}"
+                                        .format(hour, dt.date.fromordinal(int(ordinals[day]))))
+            days = (ordinals - EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[h]")
+            hours = days[:, np.newaxis] + np.arange(24).astype("timedelta64[h]")
+            yield hours.ravel(), prices.ravel()
+
+    def to_hourly_frame(self, start=None, end=None):
+        """
+        :param start: optional dt.date, the first day (by default the start of the quoted horizon)
+        :param end: optional dt.date, the last day (by default the end of the quoted horizon)
+        :return: pandas DataFrame with a "price" column (in the curve's unit), indexed by the start of each hour. See
+                 iter_hourly_chunks.
+        """
+        chunks = list(self.iter_hourly_chunks(start=start, end=end))
+        hours = np.concatenate([chunk_hours for chunk_hours, _ in chunks])
+        prices = np.concatenate([chunk_prices for _, chunk_prices in chunks])
+        return pd.DataFrame({"price": prices}, index=pd.DatetimeIndex(hours, name="hour"))
 
     # TODO
     # should _transform_time_periods be done in the price_dict object? Is there any extra information that makes it a
     # method of the forward curve?
     def _transform_time_periods(self, quoted_time_periods, disjoint_time_periods):
         """Builds an NxN square matrix where:
-                M_{i,j} = (duration of disjoint_time_period[j] intersecting quoted_time_period[i]) /
-                                (duration of quoted_time_period[i])
-        """
-        matrix = []
-        for quoted_time_period in quoted_time_periods:
-            quoted_duration = quoted_time_period.discounted_duration(self._settlement_rule, self._discount_curve)
-            matrix_row = []
-            for disjoint_time_period in disjoint_time_periods:
-                intersecting_duration = 0 * DAY
-                for atomic_period in disjoint_time_period:
-                    if atomic_period.intersects(quoted_time_period):
-                        intersecting_duration += atomic_period.discounted_duration(self._settlement_rule,
-                                                                                   self._discount_curve)
-                matrix_row.append(intersecting_duration / quoted_duration)
-            matrix.append(matrix_row)
-        return np.array(matrix)
+                M_{i,j} = (discounted duration of disjoint_time_period[j] intersecting quoted_time_period[i]) /
+                                (discounted duration of quoted_time_period[i])
+        """
+        # each atomic period's discounted duration is computed once, rather than once per row
+        return self._transformation_matrix(quoted_time_periods, disjoint_time_periods,
+                                           self._discounted_durations, self._discounted_durations)
+
+    def _structure_key(self):
+        """the transformation matrix depends on the settlement rule and the discount curve too"""
+        fingerprint = getattr(self._discount_curve, "fingerprint", None)
+        if fingerprint is None:
+            return None
+        return self._settlement_rule, fingerprint
+
+    def _discounted_durations(self, time_periods):
+        """numpy array of the discounted durations, in days, of a list of time periods"""
+        return np.array([time_period.discounted_duration(self._settlement_rule, self._discount_curve).value
+                         for time_period in time_periods], np.float64)
+
+    def price_many(self, periods):
+        """
+        Vectorised version of price. Once the curve is materialised, periods made of whole blocks of the grid are
+        priced in bulk from its prefix sums. Otherwise the periods are priced in bulk from the partition, see
+        ._partition_prices. Any periods that can't be priced in bulk are priced one by one.
+        """
+        periods = self._parse_many(periods)
+        if self._grid is None:
+            prices = self._partition_prices(periods)
+        else:
+            prices = self._grid.averages(*self._period_arrays(periods))
+        for index in np.flatnonzero(np.isnan(prices)):
+            prices[index] = self.price(periods[index]).value
+        return self._quantity_array(prices)
+
+    def _partition_prices(self, periods):
+        """
+        Vector version of pricing from the partition (see ._price_components). The periods are intersected with each
+        time period of the partition as arrays, and the shaped value and discounted duration of the intersections
+        that aren't empty are summed in bulk from the shape ratio tables.
+
+        :param periods: list of parsed DateRange or LoadShapedDateRange objects
+        :return: numpy array of the price of each period, with NaN for those that can't be priced in bulk (including
+                 those that the partition doesn't cover)
+        """
+        starts, ends, bitmaps = self._period_arrays(periods)
+        values = np.zeros(len(periods))
+        weights = np.zeros(len(periods))
+        durations = np.zeros(len(periods))
+        valid = np.ones(len(periods), bool)
+        for time_period_set in self._time_period_partition_set:
+            for time_period in time_period_set:
+                piece_starts = np.maximum(starts, time_period.start.toordinal())
+                piece_ends = np.minimum(ends, time_period.end.toordinal())
+                piece_bitmaps = bitmaps & load_shape_bitmap(time_period)
+                piece_durations = period_durations(piece_starts, piece_ends, piece_bitmaps)
+                pieces = np.flatnonzero(piece_durations > 0)
+                if not len(pieces):
+                    continue
+                piece_values, piece_weights, piece_valid = self._shape.shaped_sums(
+                    piece_starts[pieces], piece_ends[pieces], piece_bitmaps[pieces], time_period_set)
+                values[pieces] += self._prices[time_period_set] * piece_values
+                weights[pieces] += piece_weights
+                durations[pieces] += piece_durations[pieces]
+                valid[pieces] &= piece_valid
+        # as in ._price_components, allow a SECOND of difference in the coverage, given that we're dealing with floats
+        valid &= np.abs(durations - period_durations(starts, ends, bitmaps)) <= 1 / SECONDS_PER_DAY
+        valid &= weights > 0
+        return np.where(valid, values / np.where(valid, weights, 1), np.nan)
 
     def _new_price(self, required_time_period):
+        if self._grid is not None and self._grid.covers(required_time_period):
+            price = self._grid.average(required_time_period)
+            if price is not None:
+                return Quantity(price, self.unit)
+        components, total_time = self._price_components(required_time_period)
+        total_price = 0
+        for known_time_period_set, shape_ratio, time in components:
+            price = self._prices[known_time_period_set] * shape_ratio
+            total_price += price * time
+        return total_price / total_time * self.unit
+
+    def _price_components(self, required_time_period):
+        """
+        The price of a time period is the discounted duration weighted average of the shaped prices of the parts of
+        the partition that it intersects. The weights don't depend on the prices, so can be reused for other prices
+        on the same partition (e.g. in scenarios).
+
+        :param required_time_period: DateRange or LoadShapedDateRange object
+        :return: tuple of a list of (TimePeriodSet of the partition, shape ratio, discounted duration) tuples, and the
+                 total discounted duration
+        """
         known_time_period_sets = set(partition for partition in self._time_period_partition_set
                                      if partition.intersects(required_time_period))
-        total_price = 0
+        components = []
         total_time = 0 * DAY
         for known_time_period_set in known_time_period_sets:
             intersecting_time_period_set = known_time_period_set.intersection(required_time_period)
             time = self._discounted_duration_of_time_set(intersecting_time_period_set)
             if time > 0:
-                unshaped_price = self._prices[known_time_period_set]
                 shape_ratio = self._shape.shape_ratio(intersecting_time_period_set, known_time_period_set)
-                price = unshaped_price * shape_ratio
-                total_price += price * time
+                components.append((known_time_period_set, shape_ratio, time))
                 total_time += time
 
         # check whether the known time periods (for which we have prices) cover the required time period
@@ -85,12 +322,78 @@ class CommodityForwardCurve(AbstractContinuousForwardCurve):
             msg = "can't calulate price for time period: {}".format(required_time_period)
             msg += " the forward curve doesn't span sufficient range (out by {})".format(difference)
             raise MissingPriceError(msg)
-
-        try:
-            return total_price / total_time * self.unit
-        except Exception:
+        if not total_time > 0:
             raise MissingPriceError("Couldn't calculate price (null delivery?): {}".format(str(required_time_period)))
+        return components, total_time
 
     def _discounted_duration_of_time_set(self, time_period_set):
         return sum(time_period.discounted_duration(self._settlement_rule, self._discount_curve)
                    for time_period in time_period_set)
+
+
+class ScenarioForwardCurve(object):
+    """
+    Prices a CommodityForwardCurve under many scenarios for its quotes at once, e.g. for historical or Monte Carlo VaR.
+    The partition, the factorised transformation matrix, the discounting and the shape ratios don't depend on the
+    quoted prices, so they're taken from the curve, and all of the scenarios are solved in one pass. The price of each
+    requested period is a fixed weighted sum of the disjoint prices, so the weights (including the shape ratios) are
+    found once and applied to every scenario with a single matrix product.
+    """
+
+    def __init__(self, curve, quoted_time_periods, scenario_quotes):
+        """
+        :param curve: a CommodityForwardCurve
+        :param quoted_time_periods: sequence of quoted time periods of the curve, giving the columns of scenario_quotes.
+                                    Any other quotes of the curve keep their prices in every scenario
+        :param scenario_quotes: numpy (scenarios x quotes) array of quoted prices, in the curve's unit
+        """
+        if not isinstance(curve, CommodityForwardCurve):
+            raise TypeError("curve must be a CommodityForwardCurve: {} provided".format(type(curve)))
+        scenario_quotes = np.atleast_2d(np.asarray(scenario_quotes, np.float64))
+        quoted_time_periods = list(quoted_time_periods)
+        if scenario_quotes.shape[1] != len(quoted_time_periods):
+            raise ValueError("scenario_quotes has {} columns, but {} quoted time periods were provided"
+                             .format(scenario_quotes.shape[1], len(quoted_time_periods)))
+        missing = [time_period for time_period in quoted_time_periods if time_period not in curve._quoted_index]
+        if missing:
+            raise ValueError("{} aren't quoted on the curve".format(missing))
+        self.curve = curve
+        self.unit = curve.unit
+        self.scenarios = len(scenario_quotes)
+        rhs = np.repeat(curve._quoted_values[:, np.newaxis], self.scenarios, axis=1)
+        rhs[[curve._quoted_index[time_period] for time_period in quoted_time_periods], :] = scenario_quotes.T
+        # (disjoint time periods x scenarios)
+        self._disjoint_prices = curve._system.solve(rhs)
+        self._disjoint_index = {time_period_set: index
+                                for index, time_period_set in enumerate(curve._disjoint_time_periods)}
+
+    def weights(self, periods):
+        """
+        :param periods: sequence of delivery periods (anything that CommodityForwardCurve.price accepts)
+        :return: numpy (periods x disjoint time periods) array of the weight of each disjoint price in the price of
+                 each period
+        """
+        periods = [self.curve._parse_time_period(period) for period in periods]
+        weights = np.zeros((len(periods), len(self._disjoint_index)))
+        for row, period in enumerate(periods):
+            components, total_time = self.curve._price_components(period)
+            for time_period_set, shape_ratio, time in components:
+                weights[row, self._disjoint_index[time_period_set]] += shape_ratio * float(time / total_time)
+        return weights
+
+    def prices(self, periods):
+        """
+        :param periods: sequence of delivery periods (anything that CommodityForwardCurve.price accepts)
+        :return: Quantity holding a (scenarios x periods) array of the price of each period in each scenario
+        """
+        return Quantity(self._disjoint_prices.T.dot(self.weights(periods).T), self.unit)
+
+
+def _hour_blocks(block_bitmaps):
+    """
+    :param block_bitmaps: sequence of the bitmaps of blocks that partition the hours of the week
+    :return: numpy (2 x 24) int64 array of the index of the block containing each hour of a weekday (row 0) and a
+             weekend day (row 1)
+    """
+    bits = np.arange(48).reshape(2, 24)
+    return np.argmax(np.asarray(block_bitmaps, np.int64)[:, np.newaxis, np.newaxis] >> bits & 1, axis=0)
@@ -0,0 +1,181 @@
+import numpy as np
+
+from core.time_period.load_shape import BASE, WEEKDAY, WEEKEND
+
+
+class CumulativeCurve(object):
+    """
+    Holds prices and weights (e.g. durations, or discounted durations) on a dense grid of days x load shape blocks, as
+    cumulative sums over the days of price x weight and of weight. The weighted average price over any DateRange or
+    LoadShapedDateRange is then two subtractions per block, regardless of the length of the period.
+
+    Each block must be either all weekday or all weekend hours. Cells with a NaN price are missing, and periods that
+    include a missing cell with positive weight can't be priced.
+    """
+
+    def __init__(self, first, block_bitmaps, values, weights, divisible=False):
+        """
+        :param first: int, the ordinal of the first day of the grid
+        :param block_bitmaps: sequence of the LoadShape bitmap of each block
+        :param values: numpy (days x blocks) array of prices
+        :param weights: numpy (days x blocks) array of weights
+        :param divisible: if True, prices are flat across the hours of each block, so a period that covers part of a
+                          block is priced pro-rata by the hours it covers. If False, periods must be made of whole
+                          blocks.
+        """
+        values = np.asarray(values, np.float64)
+        weights = np.asarray(weights, np.float64)
+        self.first = first
+        self.last = first + len(values) - 1
+        self.block_bitmaps = np.array(block_bitmaps, np.int64)
+        self.divisible = divisible
+        self._block_hours = bit_counts(self.block_bitmaps).astype(np.float64)
+        missing = np.isnan(values) & (weights > 0)
+        self._value_sums = _prefix_sums(np.where(np.isnan(values), 0, values * weights))
+        self._weight_sums = _prefix_sums(weights)
+        self._missing_sums = _prefix_sums(missing.astype(np.int64))
+
+    @classmethod
+    def from_daily(cls, first, prices):
+        """
+        Builds a CumulativeCurve from daily prices, which are flat across the hours of each day. Periods are weighted
+        by their duration, so e.g. each weekday of a PEAK period has half the weight of each weekend day of an OFFPEAK
+        period.
+
+        :param first: int, the ordinal of the first day
+        :param prices: numpy array of the price of each day
+        :return: CumulativeCurve object
+        """
+        prices = np.asarray(prices, np.float64)
+        weekend = (np.arange(first, first + len(prices)) - 1) % 7 > 4
+        weights = np.stack([~weekend, weekend], axis=1).astype(np.float64)
+        return cls(first, [WEEKDAY.bitmap, WEEKEND.bitmap], np.stack([prices, prices], axis=1), weights, True)
+
+    def covers(self, time_period):
+        """True if the days of the time_period are all within the grid"""
+        return self.first <= time_period.start.toordinal() and time_period.end.toordinal() <= self.last
+
+    def sums(self, time_period):
+        """
+        :param time_period: DateRange or LoadShapedDateRange object, within the grid
+        :return: tuple of the sum of price x weight and the sum of weight over the time_period, or None if the
+                 time_period includes a missing cell or, for indivisible blocks, isn't made of whole blocks
+        """
+        start, end = time_period.start.toordinal(), time_period.end.toordinal()
+        if end < start:
+            return 0., 0.
+        if not self.covers(time_period):
+            raise ValueError("{} is outside of the cumulative curve".format(time_period))
+        bitmap = getattr(time_period, "load_shape", BASE).bitmap
+        values, weights, valid = self.sums_many(np.array([start]), np.array([end]), np.array([bitmap]))
+        if not valid[0]:
+            return None
+        return values[0], weights[0]
+
+    def sums_many(self, starts, ends, bitmaps):
+        """
+        Vector version of sums.
+
+        :param starts: numpy int64 array of the start ordinal of each period
+        :param ends: numpy int64 array of the (inclusive) end ordinal of each period
+        :param bitmaps: numpy int64 array of the LoadShape bitmap of each period
+        :return: tuple of numpy arrays of the sum of price x weight and the sum of weight over each period, and a
+                 boolean array which is False where the period can't be priced from the grid (including periods
+                 that aren't within the grid)
+        """
+        starts, ends, bitmaps = (np.asarray(array, np.int64) for array in (starts, ends, bitmaps))
+        valid = (self.first <= starts) & (ends <= self.last) & (starts <= ends)
+        overlap = bitmaps[:, np.newaxis] & self.block_bitmaps
+        if self.divisible:
+            fractions = bit_counts(overlap) / self._block_hours
+        else:
+            whole = overlap == self.block_bitmaps
+            valid &= ~np.any((overlap != 0) & ~whole, axis=1)
+            fractions = whole.astype(np.float64)
+        lower = np.where(valid, starts - self.first, 0)
+        upper = np.where(valid, ends - self.first + 1, 0)
+        missing = (self._missing_sums[upper] - self._missing_sums[lower]) * (fractions > 0)
+        valid &= ~np.any(missing, axis=1)
+        values = ((self._value_sums[upper] - self._value_sums[lower]) * fractions).sum(axis=1)
+        weights = ((self._weight_sums[upper] - self._weight_sums[lower]) * fractions).sum(axis=1)
+        return values, weights, valid
+
+    def average(self, time_period):
+        """
+        :param time_period: DateRange or LoadShapedDateRange object, within the grid
+        :return: the weighted average price over the time_period, or None if it can't be priced from the grid
+        """
+        sums = self.sums(time_period)
+        if sums is None or sums[1] <= 0:
+            return None
+        return sums[0] / sums[1]
+
+    def averages(self, starts, ends, bitmaps):
+        """
+        Vector version of average.
+
+        :param starts: numpy int64 array of the start ordinal of each period
+        :param ends: numpy int64 array of the (inclusive) end ordinal of each period
+        :param bitmaps: numpy int64 array of the LoadShape bitmap of each period
+        :return: numpy array of the weighted average price over each period, NaN where it can't be priced from the
+                 grid
+        """
+        values, weights, valid = self.sums_many(starts, ends, bitmaps)
+        valid &= weights > 0
+        return np.where(valid, values / np.where(valid, weights, 1), np.nan)
+
+
+def _prefix_sums(array):
+    """cumulative sums over the first axis, with a leading row of zeros"""
+    return np.concatenate([np.zeros((1,) + array.shape[1:], array.dtype), np.cumsum(array, axis=0)])
+
+
+def bit_counts(bitmaps):
+    """the number of bits set in each element of an int64 array of LoadShape bitmaps"""
+    return sum((np.asarray(bitmaps, np.int64) >> bit) & 1 for bit in range(48))
+
+
+def load_shape_bitmap(time_period):
+    """the LoadShape bitmap of a DateRange (which is BASE) or LoadShapedDateRange"""
+    return getattr(time_period, "load_shape", BASE).bitmap
+
+
+def atomic_bitmaps(bitmaps):
+    """
+    The finest partition of the hours of the week into blocks, each either all weekday or all weekend hours, such that
+    every one of the given bitmaps is a union of blocks.
+    """
+    blocks = {WEEKDAY.bitmap, WEEKEND.bitmap}
+    for bitmap in set(bitmaps):
+        blocks = {part for block in blocks for part in (block & bitmap, block & ~bitmap) if part}
+    return sorted(blocks)
+
+
+def cell_durations(ordinals, block_bitmaps):
+    """
+    :param ordinals: numpy int64 array of ordinal dates
+    :param block_bitmaps: numpy int64 array of the bitmaps of blocks, each either all weekday or all weekend hours
+    :return: numpy (days x blocks) array of the duration, in days, of each block on each day
+    """
+    weekend = (np.asarray(ordinals, np.int64) - 1) % 7 > 4
+    weekday_block = (np.asarray(block_bitmaps, np.int64) & WEEKDAY.bitmap) != 0
+    return (weekend[:, np.newaxis] != weekday_block) * bit_counts(block_bitmaps) / 24
+
+
+def period_durations(starts, ends, bitmaps):
+    """
+    :param starts: numpy int64 array of the start ordinal of each period
+    :param ends: numpy int64 array of the (inclusive) end ordinal of each period
+    :param bitmaps: numpy int64 array of the LoadShape bitmap of each period
+    :return: numpy array of the duration, in days, of each period, 0 for periods that end before they start
+    """
+    starts, ends, bitmaps = (np.asarray(array, np.int64) for array in (starts, ends, bitmaps))
+    weekend_days = _weekend_days_to(ends) - _weekend_days_to(starts - 1)
+    weekdays = ends - starts + 1 - weekend_days
+    durations = (weekdays * bit_counts(bitmaps & WEEKDAY.bitmap) + weekend_days * bit_counts(bitmaps & WEEKEND.bitmap))
+    return np.where(starts <= ends, durations / 24, 0.)
+
+
+def _weekend_days_to(ordinals):
+    """the number of weekend days with ordinals from 1 (a Monday) up to and including each of the ordinals"""
+    return 2 * (ordinals // 7) + np.maximum(ordinals % 7 - 5, 0)
@@ -1,40 +1,176 @@
 import datetime as dt
+import hashlib
 
 import numpy as np
 
+from core.base.cache import LRUCache
 from core.forward_curves.abstract_forward_curve import AbstractDailyForwardCurve, AbstractForwardCurve
+from core.forward_curves.cumulative_curve import CumulativeCurve
+from core.forward_curves.interpolation import LogLinearInterpolator
 from core.time_period.date_range import DateRange, LoadShapedDateRange
-from inputs.market_data.forwards.quotes import FxQuotes, RatesQuotes
+from core.time_period.load_shape import BASE
+from inputs.market_data.forwards.quotes import FxQuotes, RatesQuotes, MissingPriceError
 from inputs.static_data.time_constants import DAYS_PER_YEAR
 
+# the cross fx curves built by triangulate, keyed by the fingerprints of the two legs
+_cross_curve_cache = LRUCache(256, name="cross_fx_curve")
+
 
 class FxForwardCurve(AbstractDailyForwardCurve):
 
-    def __init__(self, quotes):
+    def __init__(self, quotes, interpolator=LogLinearInterpolator):
+        """
+        :param quotes: an FxQuotes object
+        :param interpolator: the AbstractInterpolator subclass used to interpolate the quoted forwards
+        """
         if not isinstance(quotes, FxQuotes):
             raise TypeError("price_dict must be FXQuotes: {} provided".format(type(quotes)))
         super().__init__(quotes)
         self.unit = quotes.unit
-        # pre-calculate the log forwards, since these are used in log-linear interpolation during each .price(period)
-        # operation
-        self._log_forwards = np.log(np.array([quotes[date] for date in self._dates]))
+        # the interpolator's coefficients are pre-calculated, since it's used during each .price(period) operation
+        self._forwards = np.array([quotes[date] for date in self._dates], np.float64)
+        self._interpolator = interpolator(self._dates, self._forwards)
+        self._build_table(self._interpolator(np.arange(self._dates[0], self._dates[-1] + 1)))
+        self._fingerprint = _digest(self.value_date, self.unit, type(self._interpolator).__name__, self._dates,
+                                    self._forwards)
+
+    def _build_table(self, daily_forwards):
+        """
+        Holds the daily forwards over the quoted period (from self._dates[0] to self._dates[-1]), so a single day is an
+        array lookup, and their cumulative sums, so averages over periods are O(1).
+        """
+        self._daily_forwards = daily_forwards
+        self._cumulative = CumulativeCurve.from_daily(self.value_date + self._dates[0], daily_forwards)
+
+    @property
+    def fingerprint(self):
+        """digest of the curve's data, computed once as curves don't change"""
+        return self._fingerprint
 
     def _new_price(self, period):
-        if period not in self._cache:
-            self._cache[period] = period.weighted_average_duration(self._one_day_price)
-        return self._cache[period]
+        if period.start == period.end:
+            return self._one_day_price(period)
+        self._check_bounds(period.start.toordinal() - self.value_date)
+        self._check_bounds(period.end.toordinal() - self.value_date)
+        price = self._cumulative.average(period)
+        if price is None:
+            raise MissingPriceError("Couldn't calculate price (null delivery?): {}".format(period))
+        return price * self.unit
+
+    def price_many(self, periods):
+        """
+        Vectorised version of price: single days are read from the daily forwards, longer periods are averaged from
+        their cumulative sums.
+        """
+        if isinstance(periods, np.ndarray):
+            starts = ends = periods.astype(np.int64).ravel()
+            bitmaps = np.full(len(starts), BASE.bitmap, np.int64)
+        else:
+            starts, ends, bitmaps = self._period_arrays(self._parse_many(periods))
+        self._check_bounds_many(starts - self.value_date)
+        self._check_bounds_many(ends - self.value_date)
+        single = starts == ends
+        prices = np.empty(len(starts))
+        prices[single] = self._daily_forwards[starts[single] - self.value_date - self._dates[0]]
+        prices[~single] = self._cumulative.averages(starts[~single], ends[~single], bitmaps[~single])
+        if np.any(np.isnan(prices)):
+            index = np.argmax(np.isnan(prices))
+            raise MissingPriceError("Couldn't calculate price (null delivery?): {} to {}"
+                                    .format(dt.date.fromordinal(int(starts[index])),
+                                            dt.date.fromordinal(int(ends[index]))))
+        return self._quantity_array(prices)
 
     def _one_day_price(self, date):
         date = date.start.toordinal() - self.value_date
         self._check_bounds(date)
-        # use log-linear extrapolation to find the fx forward price
-        return np.exp(np.interp(date, self._dates, self._log_forwards)) * self.unit
+        return self._daily_forwards[date - self._dates[0]] * self.unit
+
+    def forwards(self, ordinals):
+        """
+        Looks up the fx forwards for an array of dates in bulk.
+
+        :param ordinals: numpy array of ordinal dates
+        :return: numpy array of fx forwards, in the curve's unit
+        """
+        taus = np.asarray(ordinals, np.int64) - self.value_date
+        self._check_bounds_many(taus)
+        return self._daily_forwards[taus - self._dates[0]]
+
+    @property
+    def horizon(self):
+        """tuple of the first and last ordinal dates of the quoted period"""
+        return self.value_date + int(self._dates[0]), self.value_date + int(self._dates[-1])
 
     @property
     def inverse(self):
         return InverseFxForwardCurve(self)
 
 
+class CrossFxForwardCurve(FxForwardCurve):
+
+    """
+    An fx forward curve triangulated through a common currency, as the product of two fx curves in which the common
+    currency cancels, e.g. EUR/GBP from EUR/USD and USD/GBP. Build these with triangulate, which orients the legs and
+    caches the result.
+    """
+
+    def __init__(self, first_curve, second_curve):
+        """
+        :param first_curve: FxForwardCurve (or inverse) with units N/C
+        :param second_curve: FxForwardCurve (or inverse) with units C/D, giving a cross curve with units N/D
+        """
+        AbstractForwardCurve.__init__(self)
+        if first_curve.unit.denominator != second_curve.unit.numerator:
+            raise TypeError("fx curves with units {} and {} can't be triangulated"
+                            .format(first_curve.unit, second_curve.unit))
+        if first_curve.value_date != second_curve.value_date:
+            raise TypeError("fx curves have different value dates: {} and {}"
+                            .format(first_curve.value_date, second_curve.value_date))
+        self.value_date = first_curve.value_date
+        self.unit = first_curve.unit * second_curve.unit
+        self._legs = first_curve, second_curve
+        self._fingerprint = _digest("cross", first_curve.fingerprint, second_curve.fingerprint)
+        # the quoted period is where both legs are quoted
+        first = max(first_curve.horizon[0], second_curve.horizon[0])
+        last = min(first_curve.horizon[1], second_curve.horizon[1])
+        if first > last:
+            raise MissingPriceError("fx curves with units {} and {} have no quoted dates in common"
+                                    .format(first_curve.unit, second_curve.unit))
+        self._dates = np.array([first, last], np.int64) - self.value_date
+        ordinals = np.arange(first, last + 1)
+        self._build_table(first_curve.forwards(ordinals) * second_curve.forwards(ordinals))
+
+
+def triangulate(first_curve, second_curve):
+    """
+    The cross fx forward curve between the currencies of two fx curves that aren't shared, e.g. EUR/GBP from EUR/USD and
+    GBP/USD. Each leg is inverted as required, and the cross curve is cached, so repeated calls for the same curves
+    return the same daily table.
+
+    :param first_curve: FxForwardCurve, whose currency that isn't shared is the numerator of the cross curve
+    :param second_curve: FxForwardCurve, whose currency that isn't shared is the denominator of the cross curve
+    :return: CrossFxForwardCurve
+    :raises TypeError: if the curves don't share exactly one currency
+    """
+    first_currencies = first_curve.unit.numerator, first_curve.unit.denominator
+    second_currencies = second_curve.unit.numerator, second_curve.unit.denominator
+    common = set(first_currencies) & set(second_currencies)
+    if len(common) != 1:
+        raise TypeError("fx curves with units {} and {} don't share exactly one currency"
+                        .format(first_curve.unit, second_curve.unit))
+    common = common.pop()
+    if first_curve.unit.numerator == common:
+        first_curve = first_curve.inverse
+    if second_curve.unit.denominator == common:
+        second_curve = second_curve.inverse
+    key = first_curve.fingerprint, second_curve.fingerprint
+    curve = _cross_curve_cache.get(key)
+    if curve is None:
+        curve = CrossFxForwardCurve(first_curve, second_curve)
+        _cross_curve_cache[key] = curve
+    return curve
+
+
 class InverseFxForwardCurve(AbstractForwardCurve):
 
     def __init__(self, fx_curve):
@@ -42,10 +178,37 @@ class InverseFxForwardCurve(AbstractForwardCurve):
         self._fx_curve = fx_curve
         self.unit = fx_curve.unit.inverse
         self.value_date = fx_curve.value_date
+        self._fingerprint = _digest("inverse", fx_curve.fingerprint)
+
+    @property
+    def fingerprint(self):
+        """digest of the curve's data, computed once as curves don't change"""
+        return self._fingerprint
 
     def _new_price(self, period):
         return 1 / self._fx_curve.price(period)
 
+    def price_many(self, periods):
+        return 1 / self._fx_curve.price_many(periods)
+
+    def forwards(self, ordinals):
+        """
+        Looks up the fx forwards for an array of dates in bulk.
+
+        :param ordinals: numpy array of ordinal dates
+        :return: numpy array of fx forwards, in the curve's unit
+        """
+        return 1 / self._fx_curve.forwards(ordinals)
+
+    @property
+    def horizon(self):
+        """tuple of the first and last ordinal dates of the quoted period"""
+        return self._fx_curve.horizon
+
+    @property
+    def inverse(self):
+        return self._fx_curve
+
 
 class DiscountCurve(AbstractDailyForwardCurve):
 
@@ -61,13 +224,46 @@ class DiscountCurve(AbstractDailyForwardCurve):
     The forward discount factor (from t1 to t2) is calculated a B(t2 - t0) / B(t1 - t0)
     """
 
-    def __init__(self, quotes):
+    def __init__(self, quotes, materialise=False, interpolator=None):
+        """
+        :param quotes: a RatesQuotes object
+        :param materialise: if True, precompute a dense daily table of discount factors, see .materialise()
+        :param interpolator: optional AbstractInterpolator subclass applied to the discount factors at the quoted
+                             dates, e.g. LogLinearInterpolator for flat forward rates between them. By default the
+                             quoted rates are interpolated linearly.
+        """
         if not isinstance(quotes, RatesQuotes):
             raise TypeError("price_dict must be RatesQuotes: {} provided".format(type(quotes)))
         super().__init__(quotes)
         # interpolation of the yield curve is linear (unlike forward curve)
         self._rates = np.array([quotes[date] for date in self._dates])
         self.currency = quotes.currency
+        self._df_interpolator = None
+        if interpolator is not None:
+            pillar_factors = (1 + self._rates) ** (- self._dates / DAYS_PER_YEAR)
+            self._df_interpolator = interpolator(self._dates, pillar_factors)
+        self._table_first = None
+        self._table = None
+        self._fingerprint = _digest(self.value_date, self.currency, type(self._df_interpolator).__name__, self._dates,
+                                    self._rates)
+        if materialise:
+            self.materialise()
+
+    def materialise(self):
+        """
+        Precomputes the discount factor of every day from the value date (or first quote, if earlier) to the last
+        quote, so that discount_factors is a single array lookup.
+
+        :return: self, to allow chaining
+        """
+        self._table_first = min(0, int(self._dates[0]))
+        self._table = self._interpolate(np.arange(self._table_first, self._dates[-1] + 1))
+        return self
+
+    @property
+    def fingerprint(self):
+        """digest of the curve's data, computed once as curves don't change"""
+        return self._fingerprint
 
     @property
     def is_null(self):
@@ -90,12 +286,44 @@ class DiscountCurve(AbstractDailyForwardCurve):
             return 1
         tau = period - self.value_date
         self._check_bounds(tau)
+        if self._df_interpolator is not None:
+            return self._df_interpolator(tau)
         rate = np.interp(tau, self._dates, self._rates)
         return (1 + rate) ** (- tau / DAYS_PER_YEAR)
 
+    def price_many(self, periods):
+        """Vectorised version of price, each period must be a single day"""
+        if isinstance(periods, np.ndarray):
+            ordinals = periods.astype(np.int64).ravel()
+        else:
+            ordinals = np.array(self._parse_many(periods), np.int64)
+        return self._quantity_array(self.discount_factors(ordinals))
+
     def forward_price(self, period):
         return self.price(period.end) / self.price(period.start)
 
+    def discount_factors(self, ordinals):
+        """
+        Calculates the discount factors for an array of dates in bulk, interpolating and exponentiating in one go, or
+        reading from the daily table if the curve is materialised.
+
+        :param ordinals: numpy array of ordinal dates
+        :return: numpy array of discount factors
+        """
+        taus = np.asarray(ordinals, np.int64) - self.value_date
+        # the value date itself always has a discount factor of 1, even if it's before the first quote
+        self._check_bounds_many(taus[taus != 0])
+        if self._table is not None:
+            return self._table[taus - self._table_first]
+        return self._interpolate(taus)
+
+    def _interpolate(self, taus):
+        """the discount factors for a numpy array of days after the value date, with no bounds checking"""
+        if self._df_interpolator is not None:
+            return np.where(taus == 0, 1., self._df_interpolator(taus))
+        rates = np.interp(taus, self._dates, self._rates)
+        return np.where(taus == 0, 1., (1 + rates) ** (- taus / DAYS_PER_YEAR))
+
 
 class ForeignDiscountCurve(AbstractForwardCurve):
 
@@ -123,8 +351,41 @@ class ForeignDiscountCurve(AbstractForwardCurve):
         self._domestic_curve = domestic_curve
         self._fx_curve = fx_curve
         self._spot_fx = fx_curve.price(self.value_date)
+        self._fingerprint = _digest("foreign", domestic_curve.fingerprint, fx_curve.fingerprint)
+
+    @property
+    def fingerprint(self):
+        """digest of the curve's data, computed once as curves don't change"""
+        return self._fingerprint
 
     def _new_price(self, period):
         domestic_df = self._domestic_curve.price(period)
         forward_fx = self._fx_curve.price(period)
         return self._spot_fx * domestic_df / forward_fx
+
+    def discount_factors(self, ordinals):
+        """
+        Calculates the discount factors for an array of dates in bulk, from the domestic discount factors and the fx
+        forwards.
+
+        :param ordinals: numpy array of ordinal dates
+        :return: numpy array of discount factors
+        """
+        ordinals = np.asarray(ordinals, np.int64)
+        return self._spot_fx.value * self._domestic_curve.discount_factors(ordinals) / self._fx_curve.forwards(ordinals)
+
+
+def _digest(*parts):
+    """
+    A short digest of a curve's data, to use as a cache key in place of the data itself.
+
+    :param parts: numpy arrays, which are included by their bytes, or other objects, which are included by their str
+    :return: str of the hex digest
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        data = part.tobytes() if isinstance(part, np.ndarray) else str(part).encode()
+        # prefix each part with its length, so that different parts can't run together into the same bytes
+        digest.update("{}:".format(len(data)).encode())
+        digest.update(data)
+    return digest.hexdigest()
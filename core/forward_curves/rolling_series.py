@@ -0,0 +1,98 @@
+import datetime as dt
+
+import numpy as np
+
+from core.base.quantity import Quantity
+from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import LoadShape
+from core.time_period.relative_date_range import RelativeDateRange
+from inputs.market_data.forwards.quotes import MissingPriceError
+
+
+class RollingSeries(object):
+    """
+    Builds rolling-contract price series, e.g. the front month price on each of a set of historical observation dates.
+
+    The RelativeDateRange is fixed for all of the observation dates in one vectorised pass, and the observation dates
+    are then grouped by (curve, fixed delivery period), so each distinct contract is priced only once per curve.
+    """
+
+    def __init__(self, relative_date_range, load_shape=None):
+        """
+        :param relative_date_range: RelativeDateRange object, or a range type string such as 'ma' (with offset 1)
+        :param load_shape: optional LoadShape (or string), if given the contracts are LoadShapedDateRanges
+        """
+        if isinstance(relative_date_range, str):
+            relative_date_range = RelativeDateRange(relative_date_range)
+        if not isinstance(relative_date_range, RelativeDateRange):
+            raise TypeError("relative_date_range must be a RelativeDateRange: {} provided".format(relative_date_range))
+        if isinstance(load_shape, str):
+            load_shape = LoadShape(load_shape)
+        self.relative_date_range = relative_date_range
+        self.load_shape = load_shape
+
+    def contracts(self, obs_dates):
+        """
+        Fixes the rolling contract for each observation date.
+
+        :param obs_dates: iterable of dt.date objects, or a numpy array of ordinals or datetime64 values
+        :return: list of DateRange (or LoadShapedDateRange) objects, one per observation date
+        """
+        starts, ends = self.relative_date_range.fix_many(obs_dates)
+        return [self._contract(start, end) for start, end in zip(starts, ends)]
+
+    def build(self, obs_dates, curves):
+        """
+        Prices the rolling contract on each observation date.
+
+        :param obs_dates: iterable of dt.date objects, or a numpy array of ordinals or datetime64 values
+        :param curves: a forward curve used for every observation date, or a sequence of forward curves with one
+                       curve per observation date (e.g. the historical curve marked on each date)
+        :return: Quantity with a numpy array value, one price per observation date, NaN where the curve has no price
+        """
+        starts, ends = self.relative_date_range.fix_many(obs_dates)
+        curve_index, distinct_curves = _index_curves(curves, len(starts))
+        keys = np.stack([curve_index, starts, ends], axis=1)
+        distinct_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+        unit = None
+        values = np.full(len(distinct_keys), np.nan)
+        for i, (index, start, end) in enumerate(distinct_keys):
+            try:
+                price = distinct_curves[index].price(self._contract(start, end))
+            except MissingPriceError:
+                continue
+            if unit is None:
+                unit = price.unit
+            values[i] = price.convert(unit).value
+        if unit is None and len(distinct_keys):
+            raise MissingPriceError("no prices available for {} on the observation dates".format(
+                self.relative_date_range))
+        if unit is None:
+            return Quantity(np.zeros(0))
+        return Quantity(values[inverse.ravel()], unit)
+
+    def _contract(self, start, end):
+        date_range = DateRange(dt.date.fromordinal(int(start)), dt.date.fromordinal(int(end)))
+        if self.load_shape is None:
+            return date_range
+        return LoadShapedDateRange(date_range, self.load_shape)
+
+
+def _index_curves(curves, length):
+    """
+    Maps a single curve, or a sequence of curves, onto an array of indices into a list of the distinct curves.
+    """
+    if isinstance(curves, (list, tuple)):
+        if len(curves) != length:
+            raise ValueError("{} curves provided for {} observation dates".format(len(curves), length))
+        distinct_curves = []
+        positions = {}
+        curve_index = np.zeros(length, np.int64)
+        for i, curve in enumerate(curves):
+            if id(curve) not in positions:
+                positions[id(curve)] = len(distinct_curves)
+                distinct_curves.append(curve)
+            curve_index[i] = positions[id(curve)]
+        return curve_index, distinct_curves
+    return np.zeros(length, np.int64), [curves]
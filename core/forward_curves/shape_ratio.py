@@ -4,8 +4,10 @@ import numpy as np
 
 from core.base.quantity import DAY
 from core.forward_curves.abstract_forward_curve import AbstractContinuousForwardCurve, AbstractForwardCurve
+from core.forward_curves.cumulative_curve import CumulativeCurve
 from core.time_period.date_range import LoadShapedDateRange, DateRange
-from core.time_period.load_shape import BASE
+from core.time_period.load_shape import BASE, WEEKDAY, WEEKEND
+from core.time_period.time_utilities import month_indices, month_start_ordinals
 from inputs.market_data.forwards.quotes import MissingPriceError
 from inputs.static_data.time_constants import SECONDS_PER_DAY
 
@@ -16,29 +18,94 @@ class ShapeAlgorithm(object):
     given a pair of time_periods as numerator and denominator
     """
 
-    def __init__(self, daily_shape_calibration=None, intraday_shape_calibration=None):
+    def __init__(self, daily_shape_calibration=None, intraday_shape_calibration=None, day_weights=None):
         """
         :param daily_shape_calibration: a dict of DailyShapeCalibration objects, keyed by the releavnt LoadShape object.
         :param intraday_shape_calibration: a BaseIntradayShapeCalibration object (or sub-class)
+        :param day_weights: optional function of the first and last ordinals of a span of days, returning a numpy array
+                            of the weight of each day (e.g. the discount factor of its settlement date). The prices of
+                            the shape are averaged by duration x day weight, so by duration if this isn't provided.
         """
         self.daily_shape_calibration = daily_shape_calibration
         self.intraday_shape_calibration = intraday_shape_calibration
+        self._day_weights = day_weights
         self._cache_shape_ratio_curves = {}
+        self._unshaped_curve = UnshapedDailyRatioCurve()
+        self._intraday_curves = {}
+        self._relative_prices = {}
+        self._ratio_tables = {}
 
     def shape_ratio(self, numerator, denominator):
         """
         Determines the ratio of the price of the numerator time period set to the price of the denominator
-        time period set,
+        time period set, where each price is the average of the shape weighted by duration x day weight (so that,
+        with discount factors as the day weights, prices built from the ratios are consistent with a discounted
+        duration weighted average of the shaped prices of the hours).
 
         :param numerator: TimePeriodSet representing the sub-period we are trying to price
         :param denominator: TimePeriodSet representing the period we already know how to price
         :return: the ratio of the two prices.
         """
+        if not self.is_shaped:
+            return 1
         shape_ratio_curve = self._shape_ratio_curve(denominator)
-        numerator_price = self.price_time_period_set(shape_ratio_curve, numerator)
-        denominator_price = self.price_time_period_set(shape_ratio_curve, denominator)
+        table = self._ratio_table(shape_ratio_curve, denominator)
+        numerator_price = _table_average(table, numerator)
+        denominator_price = _table_average(table, denominator)
+        if numerator_price is None or denominator_price is None:
+            # some of the hours can't be priced from the table, so price through the curve, which raises any errors
+            numerator_price = self.price_time_period_set(shape_ratio_curve, numerator)
+            denominator_price = self.price_time_period_set(shape_ratio_curve, denominator)
         return numerator_price / denominator_price
 
+    @property
+    def is_shaped(self):
+        """False if there are no calibrations, in which case every shape ratio is 1"""
+        return bool(self.daily_shape_calibration or self.intraday_shape_calibration)
+
+    def shape_ratios(self, numerators, denominator):
+        """
+        Vector version of shape_ratio, for a sequence of numerators sharing the same denominator.
+
+        :param numerators: sequence of time periods (each with positive duration) within the denominator
+        :param denominator: TimePeriodSet representing the period we already know how to price
+        :return: numpy array of the ratio of the price of each numerator to the price of the denominator
+        """
+        numerators = list(numerators)
+        if not self.is_shaped:
+            return np.ones(len(numerators))
+        shape_ratio_curve = self._shape_ratio_curve(denominator)
+        table = self._ratio_table(shape_ratio_curve, denominator)
+        denominator_price = _table_average(table, denominator)
+        if denominator_price is None:
+            denominator_price = self.price_time_period_set(shape_ratio_curve, denominator)
+        ratios = table.averages(*AbstractForwardCurve._period_arrays(numerators)) / denominator_price
+        for index in np.flatnonzero(np.isnan(ratios)):
+            price = shape_ratio_curve.price(numerators[index]) / denominator_price
+            ratios[index] = getattr(price, "value", price)
+        return ratios
+
+    def shaped_sums(self, starts, ends, bitmaps, denominator):
+        """
+        Vector version of shape_ratio for many numerators within the denominator, as sums rather than averages, so that
+        the numerators can be pieces of larger periods.
+
+        :param starts: numpy int64 array of the start ordinal of each numerator
+        :param ends: numpy int64 array of the (inclusive) end ordinal of each numerator
+        :param bitmaps: numpy int64 array of the LoadShape bitmap of each numerator
+        :param denominator: TimePeriodSet representing the period we already know how to price
+        :return: tuple of numpy arrays of the sums over each numerator of weight x shape ratio and of weight (where
+                 the weight is the duration x day weight), and a boolean array which is False where the numerator
+                 can't be shaped from the ratio table (in which case use shape_ratio)
+        """
+        shape_ratio_curve = self._shape_ratio_curve(denominator)
+        table = self._ratio_table(shape_ratio_curve, denominator)
+        denominator_price = _table_average(table, denominator)
+        values, weights, valid = table.sums_many(starts, ends, bitmaps)
+        if denominator_price is None:
+            return values, weights, np.zeros(len(valid), bool)
+        return values / denominator_price, weights, valid
+
     def _shape_ratio_curve(self, time_period_set):
         """
         A shape ratio curve is the equivalent forward curve that we'd get if all of the commodity prices were 1.
@@ -50,12 +117,68 @@ class ShapeAlgorithm(object):
             if self.daily_shape_calibration:
                 shape_ratio_curve = self.daily_shape_calibration.shape_ratio_curve(time_period_set)
             else:
-                shape_ratio_curve = UnshapedDailyRatioCurve()
+                shape_ratio_curve = self._unshaped_curve
             if self.intraday_shape_calibration:
-                shape_ratio_curve = self.intraday_shape_calibration.decorate(shape_ratio_curve)
+                # decorate each daily curve once, so that time period sets sharing it also share its ratio tables
+                if shape_ratio_curve not in self._intraday_curves:
+                    self._intraday_curves[shape_ratio_curve] = \
+                        self.intraday_shape_calibration.decorate(shape_ratio_curve)
+                shape_ratio_curve = self._intraday_curves[shape_ratio_curve]
             self._cache_shape_ratio_curves[time_period_set] = shape_ratio_curve
         return self._cache_shape_ratio_curves[time_period_set]
 
+    def _ratio_table(self, shape_ratio_curve, time_period_set):
+        """
+        Shape ratios don't depend on market prices, so the relative price of every hour of the calibrated period (e.g.
+        the season or year) of a shape ratio curve is computed once and held as a CumulativeCurve. The relative price
+        of any time period made of whole days x hours is then two lookups into its cumulative sums.
+
+        Without day weights, a table covers the whole calibrated period, so is shared by every time period set that the
+        shape ratio curve shapes. The day weights may only be available over the time period set (e.g. discount
+        factors, within the horizon of the discount curve), so with day weights a table covers the days of the time
+        period set, sliced from the relative prices of the calibrated period.
+
+        :param shape_ratio_curve: shape ratio curve, from ._shape_ratio_curve(time_period_set)
+        :param time_period_set: TimePeriodSet that we want the table to cover
+        :return: CumulativeCurve object, with a block per hour of the week
+        """
+        calibrated_first, calibrated_last = shape_ratio_curve.calibrated_span(time_period_set)
+        if self._day_weights is None:
+            first, last = calibrated_first, calibrated_last
+        else:
+            first = min(time_period.start for time_period in time_period_set).toordinal()
+            last = max(time_period.end for time_period in time_period_set).toordinal()
+        key = (shape_ratio_curve, first, last)
+        if key not in self._ratio_tables and not self.is_shaped:
+            self._ratio_tables[key] = self._weight_table(first, last)
+        if key not in self._ratio_tables:
+            calibrated_key = (shape_ratio_curve, calibrated_first, calibrated_last)
+            if calibrated_key not in self._relative_prices:
+                self._relative_prices[calibrated_key] = shape_ratio_curve.hourly_relative_prices(calibrated_first,
+                                                                                                 calibrated_last)
+            values = self._relative_prices[calibrated_key][first - calibrated_first:last - calibrated_first + 1]
+            weights = _hourly_weights(first, last)
+            if self._day_weights is not None:
+                weights = weights * np.asarray(self._day_weights(first, last), np.float64)[:, np.newaxis]
+            self._ratio_tables[key] = CumulativeCurve(first, _HOUR_BITMAPS, values, weights)
+        return self._ratio_tables[key]
+
+    def _weight_table(self, first, last):
+        """
+        The ratio table of an unshaped curve, whose hours all have a relative price of 1. Only the weights are needed,
+        and they're flat across the hours of each day, so the table has a weekday and a weekend block rather than a
+        block per hour of the week.
+
+        :param first: int, the ordinal of the first day
+        :param last: int, the ordinal of the last day
+        :return: CumulativeCurve object, with divisible weekday and weekend blocks
+        """
+        weekend = (np.arange(first, last + 1) - 1) % 7 > 4
+        weights = np.stack([~weekend, weekend], axis=1).astype(np.float64)
+        if self._day_weights is not None:
+            weights *= np.asarray(self._day_weights(first, last), np.float64)[:, np.newaxis]
+        return CumulativeCurve(first, [WEEKDAY.bitmap, WEEKEND.bitmap], np.ones(weights.shape), weights, True)
+
     @staticmethod
     def price_time_period_set(shape_ratio_curve, time_period_set):
         value = 0
@@ -72,6 +195,16 @@ class UnshapedDailyRatioCurve(AbstractForwardCurve):
     def _new_price(self, time_period):
         return 1
 
+    @staticmethod
+    def calibrated_span(time_period_set):
+        """the first and last ordinals of the calendar years spanned by the time_period_set"""
+        return _calendar_year_span(time_period_set)
+
+    @staticmethod
+    def hourly_relative_prices(first, last):
+        """every hour has a relative price of 1"""
+        return np.ones((last - first + 1, 48))
+
 
 class IntradayShapeRatioCurve(AbstractForwardCurve):
     """
@@ -86,6 +219,7 @@ class IntradayShapeRatioCurve(AbstractForwardCurve):
         super().__init__()
         self.input_curve = input_curve
         self.intraday_shape_calibration = intraday_shape_calibration
+        self._month_curves = {}
 
     def _new_price(self, time_period):
         """
@@ -95,7 +229,110 @@ class IntradayShapeRatioCurve(AbstractForwardCurve):
         :return: the price with hourly shaping applied
         """
         assert time_period.duration > 0, time_period
-        return time_period.weighted_average_duration(self._daily_price)
+        value, weight = 0, 0
+        first_month, last_month = month_indices(np.array([time_period.start.toordinal(),
+                                                          time_period.end.toordinal()]))
+        for month in range(first_month, last_month + 1):
+            month_curve = self._month_curve(month)
+            sums = month_curve.sums(time_period.intersection(DateRange(dt.date.fromordinal(month_curve.first),
+                                                                       dt.date.fromordinal(month_curve.last))))
+            if sums is None:
+                # some of the hours can't be shaped, so price day by day, which raises the relevant error
+                return time_period.weighted_average_duration(self._daily_price)
+            value += sums[0]
+            weight += sums[1]
+        return value / weight
+
+    def _month_curve(self, month):
+        """
+        A CumulativeCurve of the shaped price of every hour in the month, with NaN for hours that can't be priced.
+
+        :param month: int, the month counted in months since January 1970
+        :return: CumulativeCurve object
+        """
+        if month not in self._month_curves:
+            first, end = (int(ordinal) for ordinal in month_start_ordinals(np.array([month, month + 1])))
+            values = self.hourly_relative_prices(first, end - 1)
+            self._month_curves[month] = CumulativeCurve(first, _HOUR_BITMAPS, values, _hourly_weights(first, end - 1))
+        return self._month_curves[month]
+
+    def calibrated_span(self, time_period_set):
+        """the first and last ordinals of the period over which the input curve is calibrated"""
+        return self.input_curve.calibrated_span(time_period_set)
+
+    def hourly_prices(self, date_range):
+        """
+        Vectorised hourly shaping: the ratio of each hour to the price of its block is looked up from the calibration
+        by array indexing, and the block prices are averaged from the hourly prices of the input curve.
+
+        :param date_range: DateRange or LoadShapedDateRange object (only the days are used)
+        :return: numpy (days x 24) array of the shaped price of each hour (00:00 to 23:00) of each day
+        :raises MissingPriceError: if any of the hours can't be priced
+        """
+        first, last = date_range.start.toordinal(), date_range.end.toordinal()
+        prices = self._clock_hour_prices(first, last)
+        if np.any(np.isnan(prices)):
+            day, hour = np.argwhere(np.isnan(prices))[0]
+            raise MissingPriceError("Couldn't shape hour {} of {}".format(hour, dt.date.fromordinal(int(first + day))))
+        return prices
+
+    def hourly_relative_prices(self, first, last):
+        """
+        :param first: int, the ordinal of the first day
+        :param last: int, the ordinal of the last day
+        :return: numpy (days x 48) array of the shaped price of each hour of each day, where column h is the hour with
+                 LoadShape bitmap 1 << h, with NaN for the hours that can't be priced (including weekend hours of
+                 weekdays and vice versa)
+        """
+        prices = self._clock_hour_prices(first, last)
+        weekend = (np.arange(first, last + 1) - 1) % 7 > 4
+        values = np.full((last - first + 1, 48), np.nan)
+        values[~weekend, :24] = prices[~weekend]
+        values[weekend, 24:] = prices[weekend]
+        return values
+
+    def settlement_period_prices(self, date_range):
+        """
+        Version of hourly_prices for every settlement period (e.g. half hour, with a half hourly calibration) of each
+        day.
+
+        :param date_range: DateRange or LoadShapedDateRange object (only the days are used)
+        :return: numpy (days x settlement periods per day) array of the shaped price of each settlement period
+        :raises MissingPriceError: if any of the settlement periods can't be priced
+        """
+        first, last = date_range.start.toordinal(), date_range.end.toordinal()
+        blocks, ratios = self.intraday_shape_calibration.extract_period_shape_ratios(np.arange(first, last + 1))
+        prices = ratios * self._block_prices(first, last)[blocks, np.arange(last - first + 1)[:, np.newaxis]]
+        if np.any(np.isnan(prices)):
+            day, period = np.argwhere(np.isnan(prices))[0]
+            raise MissingPriceError("Couldn't shape settlement period {} of {}"
+                                    .format(period, dt.date.fromordinal(int(first + day))))
+        return prices
+
+    def _clock_hour_prices(self, first, last):
+        """numpy (days x 24) array of the shaped price of each hour of each day, with NaN where it can't be priced"""
+        blocks, ratios = self.intraday_shape_calibration.extract_shape_ratios(np.arange(first, last + 1))
+        return ratios * self._block_prices(first, last)[blocks, np.arange(last - first + 1)[:, np.newaxis]]
+
+    def _block_prices(self, first, last):
+        """
+        numpy (blocks x days) array of the price of each block of the calibration on each day: the average of the
+        input curve's prices over the hours of the block on that day, with NaN if any of them can't be priced
+        """
+        input_prices = self.input_curve.hourly_relative_prices(first, last)
+        weekend = (np.arange(first, last + 1) - 1) % 7 > 4
+        # the price of each hour (00:00 to 23:00) of each day, from the weekday or weekend hours as appropriate
+        day_prices = np.where(weekend[:, np.newaxis], input_prices[:, 24:], input_prices[:, :24])
+        hours = np.arange(48)
+        block_prices = []
+        for load_shape in self.intraday_shape_calibration.load_shapes:
+            in_block = (load_shape.bitmap >> hours & 1) == 1
+            in_block = np.where(weekend[:, np.newaxis], in_block[24:], in_block[:24])
+            missing = np.any(np.isnan(day_prices) & in_block, axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                prices = np.where(in_block, day_prices, 0).sum(axis=1) / in_block.sum(axis=1)
+            block_prices.append(np.where(missing, np.nan, prices))
+        return np.stack(block_prices)
 
     def _hourly_price(self, hour_time_period):
         denominator_period, ratio = self.intraday_shape_calibration.extract_shape_ratio(hour_time_period)
@@ -128,18 +365,31 @@ class DailyShapeRatioCurve(AbstractContinuousForwardCurve):
                 M_{i,j} = (duration of disjoint_time_period[j] intersecting quoted_time_period[i]) /
                                 (duration of quoted_time_period[i])
         """
-        matrix = []
-        for quoted_time_period in quoted_time_periods:
-            quoted_duration = quoted_time_period.duration
-            matrix_row = []
-            for disjoint_time_period in disjoint_time_periods:
-                intersecting_duration = 0 * DAY
-                for atomic_period in disjoint_time_period:
-                    if atomic_period.intersects(quoted_time_period):
-                        intersecting_duration += atomic_period.duration
-                matrix_row.append(intersecting_duration / quoted_duration)
-            matrix.append(matrix_row)
-        return np.array(matrix)
+        return self._transformation_matrix(quoted_time_periods, disjoint_time_periods, _durations, _durations)
+
+    def calibrated_span(self, time_period_set=None):
+        """the first and last ordinals of the quoted time periods"""
+        return (min(time_period.start for time_period in self._quoted_time_periods).toordinal(),
+                max(time_period.end for time_period in self._quoted_time_periods).toordinal())
+
+    def hourly_relative_prices(self, first, last):
+        """
+        :param first: int, the ordinal of the first day
+        :param last: int, the ordinal of the last day
+        :return: numpy (days x 48) array of the relative price of each hour of each day, where column h is the hour with
+                 LoadShape bitmap 1 << h, with NaN for the hours that aren't quoted
+        """
+        values = np.full((last - first + 1, 48), np.nan)
+        hours = np.arange(48)
+        for time_period_set in self._time_period_partition_set:
+            price = self._prices[time_period_set]
+            for time_period in time_period_set:
+                start = max(time_period.start.toordinal(), first) - first
+                end = min(time_period.end.toordinal(), last) - first
+                bitmap = getattr(time_period, "load_shape", BASE).bitmap
+                if start <= end:
+                    values[start:end + 1, (bitmap >> hours & 1) == 1] = price
+        return values
 
     def _new_price(self, required_time_period):
         known_time_period_sets = set(partition for partition in self._time_period_partition_set
@@ -166,3 +416,36 @@ class DailyShapeRatioCurve(AbstractContinuousForwardCurve):
             return total_price / total_time
         except Exception:
             raise MissingPriceError("Couldn't calculate price (null delivery?): {}".format(str(required_time_period)))
+
+
+_HOUR_BITMAPS = [1 << hour for hour in range(48)]
+
+
+def _hourly_weights(first, last):
+    """numpy (days x 48) array of the duration, in days, of each hour of the week on each day from first to last"""
+    weekend = (np.arange(first, last + 1) - 1) % 7 > 4
+    return np.concatenate([np.repeat(~weekend[:, np.newaxis], 24, axis=1),
+                           np.repeat(weekend[:, np.newaxis], 24, axis=1)], axis=1) / 24
+
+
+def _table_average(table, time_period_set):
+    """the duration weighted average relative price of a time period set from a ratio table, or None"""
+    time_periods = list(time_period_set)
+    if not time_periods:
+        return None
+    values, weights, valid = table.sums_many(*AbstractForwardCurve._period_arrays(time_periods))
+    if not valid.all() or weights.sum() <= 0:
+        return None
+    return values.sum() / weights.sum()
+
+
+def _calendar_year_span(time_period_set):
+    """the first and last ordinals of the calendar years spanned by a time period set"""
+    start = min(time_period.start for time_period in time_period_set)
+    end = max(time_period.end for time_period in time_period_set)
+    return dt.date(start.year, 1, 1).toordinal(), dt.date(end.year, 12, 31).toordinal()
+
+
+def _durations(time_periods):
+    """numpy array of the durations, in days, of a list of time periods"""
+    return np.array([time_period.duration.value for time_period in time_periods], np.float64)
@@ -1,5 +1,7 @@
 import datetime as dt
 
+import numpy as np
+
 from core.base.quantity import GBP
 from core.forward_curves.fx_rates_forward_curves import DiscountCurve
 from core.time_period.date_range import DateRange, LoadShapedDateRange
@@ -10,6 +12,11 @@ class MockDiscountCurve(DiscountCurve):
     def __init__(self, dates_to_df):
         self.data = dates_to_df
         self.currency = GBP
+        self._fingerprint = hash(tuple(sorted(self.data.items())))
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
 
     def price(self, date):
         if isinstance(date, (DateRange, LoadShapedDateRange)):
@@ -17,6 +24,9 @@ class MockDiscountCurve(DiscountCurve):
             date = date.start
         return self.data[date]
 
+    def discount_factors(self, ordinals):
+        return np.array([self.data[dt.date.fromordinal(int(ordinal))] for ordinal in ordinals], np.float64)
+
 dates_to_df = {dt.date(2012, 11, 14): 0.995,
                dt.date(2012, 11, 20): 0.99,
                dt.date(2012, 12, 14): 0.985,
@@ -40,8 +50,16 @@ class MockNullDiscountCurve(DiscountCurve):
     def __init__(self):
         self.currency = GBP
 
+    @property
+    def fingerprint(self):
+        return "null"
+
     @staticmethod
     def price(date):
         return 1
 
+    @staticmethod
+    def discount_factors(ordinals):
+        return np.ones(len(ordinals))
+
 null_discount_curve = MockNullDiscountCurve()
\ No newline at end of file
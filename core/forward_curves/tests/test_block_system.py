@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+
+from core.forward_curves.block_system import BlockSystem, _TriangularFactor, _LUFactor
+
+
+class BlockSystemTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # a quarter and its three months, plus two other months, as in a curve transformation matrix
+        self.matrix = np.array([[1 / 3, 1 / 3, 0, 1 / 3, 0, 0],
+                                [1, 0, 0, 0, 0, 0],
+                                [0, 0, 1, 0, 0, 0],
+                                [0, 1, 0, 0, 0, 0],
+                                [0, 0, 0, 0, 0, 1],
+                                [0, 0, 0, 0, 1, 0]])
+        self.rhs = np.array([10., 9., 8., 11., 7., 6.])
+
+    def test_blocks(self):
+        system = BlockSystem(self.matrix)
+        self.assertEqual([3, 1, 1, 1], sorted((len(rows) for rows, _, _ in system.blocks), reverse=True))
+
+    def test_solve(self):
+        system = BlockSystem(self.matrix)
+        self.assertTrue(np.allclose(np.linalg.solve(self.matrix, self.rhs), system.solve(self.rhs), rtol=1e-14))
+        rhs = np.stack([self.rhs, 2 * self.rhs, self.rhs + 1], axis=1)
+        self.assertTrue(np.allclose(np.linalg.solve(self.matrix, rhs), system.solve(rhs), rtol=1e-14))
+
+    def test_solve_rows(self):
+        system = BlockSystem(self.matrix)
+        solution = system.solve(self.rhs)
+        rhs = self.rhs.copy()
+        rhs[1] = 12.
+        changed = system.solve_rows(rhs, solution, [1])
+        self.assertEqual([0, 1, 3], sorted(changed))
+        self.assertTrue(np.allclose(np.linalg.solve(self.matrix, rhs), solution, rtol=1e-14))
+
+    def test_nested_tenors(self):
+        # a chain of 8 nested tenors, each a tiny residual piece plus the next, quoted in a shuffled order, so that the
+        # transformation matrix is one ill-conditioned block, which can be ordered to be triangular
+        durations = np.array([2e-6, 1e-6, 3e-6, 1e-6, 2e-6, 1e-6, 2e-6, 1.])
+        matrix = np.zeros((8, 8))
+        for row in range(8):
+            matrix[row, row:] = durations[row:] / durations[row:].sum()
+        matrix = matrix[[3, 7, 0, 5, 1, 6, 2, 4]]
+        self.assertGreater(np.linalg.cond(matrix), 1e6)
+        system = BlockSystem(matrix)
+        self.assertEqual(1, len(system.blocks))
+        self.assertIsInstance(system.blocks[0][2], _TriangularFactor)
+        rhs = np.array([50., 52., 49., 55., 51., 53., 48., 54.])
+        solution = system.solve(rhs)
+        self.assertLess(np.max(np.abs(matrix.dot(solution) - rhs)), 1e-13)
+        self.assertTrue(np.allclose(np.linalg.solve(matrix, rhs), solution, rtol=1e-8))
+
+    def test_overlapping(self):
+        # periods that overlap without nesting can't be ordered to be triangular, so are LU factorised
+        matrix = np.array([[0.5, 0.5, 0, 0],
+                           [0, 0.5, 0.5, 0],
+                           [0, 0, 0.5, 0.5],
+                           [0.1, 0.2, 0.3, 0.4]])
+        system = BlockSystem(matrix)
+        self.assertIsInstance(system.blocks[0][2], _LUFactor)
+        rhs = np.stack([self.rhs[:4], self.rhs[2:]], axis=1)
+        self.assertTrue(np.allclose(np.linalg.solve(matrix, rhs), system.solve(rhs), rtol=1e-14))
+
+    def test_singular(self):
+        with self.assertRaises(np.linalg.LinAlgError):
+            BlockSystem(np.array([[1., 1.], [0., 0.]]))
+        with self.assertRaises(np.linalg.LinAlgError):
+            BlockSystem(np.array([[1., 1.], [1., 1.]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import datetime as dt
+import unittest
+
+import numpy as np
+
+from core.base.quantity import PENCE, THERM, GBP, MWH
+from core.forward_curves.bumped_curve_set import BumpedCurveSet
+from core.forward_curves.commodity_forward_curve import CommodityForwardCurve
+from core.forward_curves.fx_rates_forward_curves import DiscountCurve
+from core.forward_curves.tests.mock_curves import null_discount_curve
+from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import BASE, PEAK, OFFPEAK
+from core.time_period.settlement_rules import GasSettlementRule, UKPowerSettlementRule
+from inputs.market_data.forwards.quotes import ContinuousQuotes, RatesQuotes
+
+
+class BumpedCurveSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        quotes = ContinuousQuotes({DateRange("2015-M1"): 70 * PENCE / THERM,
+                                   DateRange("2015-M2"): 60 * PENCE / THERM,
+                                   DateRange("2015-M3"): 55 * PENCE / THERM}, GasSettlementRule)
+        self.curve = CommodityForwardCurve(quotes, null_discount_curve)
+        self.buckets = [DateRange("2015-M1"), DateRange("2015-M2"), DateRange("2015-M3")]
+        self.periods = [DateRange("2015-M1"), DateRange("2015-Q1"), DateRange(dt.date(2015, 1, 20),
+                                                                               dt.date(2015, 2, 10))]
+
+    def test_prices(self):
+        bumped_curve_set = BumpedCurveSet(self.curve, self.buckets)
+        prices = bumped_curve_set.prices(self.periods, 1.1)
+        self.assertEqual(PENCE / THERM, prices.unit)
+        self.assertEqual((3, 3), prices.value.shape)
+        for bucket, bucket_prices in zip(self.buckets, prices.value):
+            shifted_curve = self.curve.shift(bucket, 1.1)
+            for period, price in zip(self.periods, bucket_prices):
+                self.assertAlmostEqual(shifted_curve.price(period).value, price, 12)
+
+    def test_exposures(self):
+        # the buckets partition the periods, so the exposures add up to the unshifted prices
+        exposures = BumpedCurveSet(self.curve, self.buckets).exposures(self.periods)
+        expected = self.curve.price_many(self.periods).value
+        self.assertTrue(np.allclose(expected, exposures.sum(axis=0), rtol=1e-12))
+        self.assertEqual(0, exposures[2, 0])
+
+    def test_power(self):
+        quotes = {LoadShapedDateRange("2015-M{}".format(month), BASE): 50 + month for month in range(1, 4)}
+        quotes.update({LoadShapedDateRange("2015-M{}".format(month), PEAK): 60 + month for month in range(1, 4)})
+        curve = CommodityForwardCurve(ContinuousQuotes(quotes, UKPowerSettlementRule, GBP / MWH), null_discount_curve)
+        buckets = [LoadShapedDateRange("2015-M1", BASE), LoadShapedDateRange("2015-Q1", PEAK)]
+        periods = [LoadShapedDateRange("2015-Q1", BASE), LoadShapedDateRange("2015-M1", OFFPEAK),
+                   LoadShapedDateRange("2015-M2", PEAK)]
+        prices = BumpedCurveSet(curve, buckets).prices(periods, 0.9)
+        for bucket, bucket_prices in zip(buckets, prices.value):
+            shifted_curve = curve.shift(bucket, 0.9)
+            for period, price in zip(periods, bucket_prices):
+                self.assertAlmostEqual(shifted_curve.price(period).value, price, 12)
+
+    def test_discounted(self):
+        """the prices match shift() when the discount factors vary across the buckets"""
+        discount_curve = DiscountCurve(RatesQuotes(GBP, {dt.date(2014, 12, 1): 0.05, dt.date(2015, 2, 1): 0.3,
+                                                         dt.date(2015, 6, 1): 0.5}, value_date=dt.date(2014, 12, 1)))
+        quotes = {LoadShapedDateRange("2015-M{}".format(month), BASE): 50 + month for month in range(1, 4)}
+        quotes.update({LoadShapedDateRange("2015-M{}".format(month), PEAK): 60 + month for month in range(1, 4)})
+        quotes[LoadShapedDateRange("2015-Q1", BASE)] = 52
+        del quotes[LoadShapedDateRange("2015-M3", BASE)]
+        curve = CommodityForwardCurve(ContinuousQuotes(quotes, UKPowerSettlementRule, GBP / MWH), discount_curve)
+        buckets = [LoadShapedDateRange("2015-M1", BASE), LoadShapedDateRange("2015-M2", PEAK),
+                   DateRange(dt.date(2015, 2, 10), dt.date(2015, 3, 10))]
+        periods = [LoadShapedDateRange("2015-Q1", BASE), LoadShapedDateRange("2015-M1", OFFPEAK),
+                   LoadShapedDateRange("2015-M2", PEAK), LoadShapedDateRange("2015-M2", BASE),
+                   DateRange(dt.date(2015, 1, 20), dt.date(2015, 2, 20))]
+        for shift_factor in (0.9, 1, 1.5):
+            prices = BumpedCurveSet(curve, buckets).prices(periods, shift_factor)
+            for bucket, bucket_prices in zip(buckets, prices.value):
+                shifted_curve = curve.shift(bucket, shift_factor)
+                for period, price in zip(periods, bucket_prices):
+                    self.assertAlmostEqual(shifted_curve.price(period).value, price, 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,21 @@
 import datetime as dt
 import unittest
 
+import numpy as np
+
 from inputs.market_data.forwards.daily_shape_calibration import SeasonBasedDailyShapeCalibration
 
 from core.base.quantity import PENCE, THERM, GBP, MWH, DAY
-from core.forward_curves.commodity_forward_curve import CommodityForwardCurve
+from core.forward_curves.commodity_forward_curve import CommodityForwardCurve, ScenarioForwardCurve
+from core.forward_curves.fx_rates_forward_curves import DiscountCurve
 from core.forward_curves.shape_ratio import ShapeAlgorithm
 from core.forward_curves.tests.mock_curves import mock_discount_curve, null_discount_curve
 from core.time_period.date_range import DateRange, LoadShapedDateRange
-from core.time_period.load_shape import BASE, PEAK, OFFPEAK, WEEKEND, WEEKDAY
+from core.time_period.load_shape import BASE, PEAK, OFFPEAK, WEEKEND, WEEKDAY, WEEKDAY_HOURS, WEEKEND_HOURS
 from core.time_period.settlement_rules import GasSettlementRule, UKPowerSettlementRule
-from inputs.market_data.forwards.quotes import ContinuousQuotes
+from inputs.market_data.forwards.quotes import ContinuousQuotes, RatesQuotes
 from inputs.market_data.forwards.quotes import MissingPriceError
+from inputs.market_data.forwards.tests.testing_data import intraday_shape_ratios
 
 
 class CommodityForwardCurveTest(unittest.TestCase):
@@ -177,5 +181,242 @@ class CommodityForwardCurveTest(unittest.TestCase):
         self.assertAlmostEqual(bom_price.value, 54.3, 12)
 
         # 5) Directly request BOM price, i.e. check that BOM price is arbitrage free
-        self.assertAlmostEqual(bom_price, curve.price(bom), 12)
+        self.assertAlmostEqual(bom_price.value, curve.price(bom).value, 12)
+
+
+    def test_materialise(self):
+        s_to_q = {BASE: [1.1, 0.9, 1, 1]}
+        q_to_m = {BASE: [1.2, 1.2, 0.6, 1.1, 1, 0.9, 1, 1, 1, 1, 1, 1]}
+        wdwe = {WEEKDAY: 1.1, WEEKEND: 1.0}
+        base_ratios = SeasonBasedDailyShapeCalibration(s_to_q, q_to_m, wdwe)
+        quotes = ContinuousQuotes({DateRange("2010-WIN"): 100,
+                                   DateRange("2011-Q1"): 105,
+                                   DateRange("2011-SUM"): 90}, GasSettlementRule, PENCE / THERM)
+        curve = CommodityForwardCurve(quotes, null_discount_curve, base_ratios)
+        materialised = CommodityForwardCurve(quotes, null_discount_curve, base_ratios, materialise=True)
+        for period in [DateRange("2011-SUM"), DateRange("2011-M2"), DateRange("2010-12-25"),
+                       LoadShapedDateRange("2011-M5", WEEKEND), LoadShapedDateRange("2011-M5", PEAK)]:
+            self.assertAlmostEqual(curve.price(period).value, materialised.price(period).value, 10)
+        self.assertEqual(PENCE / THERM, materialised.price(DateRange("2011-M2")).unit)
+        with self.assertRaises(MissingPriceError):
+            materialised.price(DateRange("2011-WIN"))
+
+    def test_price_many(self):
+        quotes = ContinuousQuotes({DateRange("2011-Q1"): 105, DateRange("2011-M2"): 100}, GasSettlementRule,
+                                  PENCE / THERM)
+        periods = [DateRange("2011-Q1"), DateRange("2011-M1"), dt.date(2011, 3, 5),
+                   LoadShapedDateRange("2011-M3", WEEKEND)]
+        curve = CommodityForwardCurve(quotes, null_discount_curve)
+        materialised = CommodityForwardCurve(quotes, null_discount_curve, materialise=True)
+        for prices in (curve.price_many(periods), materialised.price_many(periods)):
+            self.assertEqual(PENCE / THERM, prices.unit)
+            for period, price in zip(periods, prices.value):
+                self.assertAlmostEqual(curve.price(period).value, price, 10)
+        with self.assertRaises(MissingPriceError):
+            materialised.price_many([DateRange("2011-M1"), DateRange("2011-M4")])
+        with self.assertRaises(MissingPriceError):
+            curve.price_many([DateRange("2011-M1"), DateRange("2011-M4")])
+
+    def test_price_many_in_bulk(self):
+        """an unmaterialised curve prices in bulk from the partition, as price does one by one"""
+        s_to_q = {BASE: [1.1, 0.9, 1, 1]}
+        q_to_m = {BASE: [1.2, 1.2, 0.6, 1.1, 1, 0.9, 1, 1, 1, 1, 1, 1]}
+        wdwe = {WEEKDAY: 1.1, WEEKEND: 1.0}
+        base_ratios = SeasonBasedDailyShapeCalibration(s_to_q, q_to_m, wdwe)
+        discount_curve = DiscountCurve(RatesQuotes(GBP, {dt.date(2010, 9, 1): 0.05, dt.date(2011, 3, 1): 0.2,
+                                                         dt.date(2012, 12, 31): 0.3}, value_date=dt.date(2010, 9, 1)))
+        quotes = ContinuousQuotes({DateRange("2010-WIN"): 100,
+                                   DateRange("2011-Q1"): 105,
+                                   DateRange("2011-SUM"): 90}, GasSettlementRule, PENCE / THERM)
+        curve = CommodityForwardCurve(quotes, discount_curve, base_ratios)
+        periods = [DateRange("2011-M1"), DateRange("2011-Q2"), DateRange("2010-WIN"), dt.date(2011, 7, 4),
+                   DateRange(dt.date(2011, 3, 20), dt.date(2011, 4, 10)), LoadShapedDateRange("2011-M5", WEEKEND),
+                   LoadShapedDateRange("2011-6-1", PEAK)]
+        prices = curve.price_many(periods)
+        # none of the periods were priced one by one
+        self.assertEqual(0, len(curve._cache))
+        np.testing.assert_allclose([curve.price(period).value for period in periods], prices.value, rtol=1e-12)
+
+        discount_curve = DiscountCurve(RatesQuotes(GBP, {dt.date(2016, 9, 1): 0.05, dt.date(2017, 1, 1): 0.3,
+                                                         dt.date(2017, 12, 31): 0.5}, value_date=dt.date(2016, 9, 1)))
+        quotes = ContinuousQuotes({LoadShapedDateRange("2016-WIN", BASE): 45 * GBP / MWH,
+                                   LoadShapedDateRange("2016-WIN", PEAK): 50 * GBP / MWH,
+                                   LoadShapedDateRange("2016-Q4", PEAK): 52 * GBP / MWH}, UKPowerSettlementRule)
+        curve = CommodityForwardCurve(quotes, discount_curve, intraday_shape_calibration=intraday_shape_ratios)
+        periods = [LoadShapedDateRange("2016-M11", BASE), LoadShapedDateRange("2017-M2", OFFPEAK),
+                   LoadShapedDateRange("2016-12-15", PEAK), LoadShapedDateRange("2016-12-15", WEEKDAY_HOURS[9]),
+                   DateRange(dt.date(2016, 12, 20), dt.date(2017, 1, 10))]
+        prices = curve.price_many(periods)
+        self.assertEqual(0, len(curve._cache))
+        np.testing.assert_allclose([curve.price(period).value for period in periods], prices.value, rtol=1e-12)
+
+    def test_update(self):
+        quotes = {DateRange("2011-Q1"): 105, DateRange("2011-M2"): 100, DateRange("2011-M4"): 90,
+                  DateRange("2011-M5"): 80}
+        new_quotes = dict(quotes)
+        new_quotes.update({DateRange("2011-M2"): 110, DateRange("2011-M4"): 95})
+        expected = CommodityForwardCurve(ContinuousQuotes(new_quotes, GasSettlementRule, PENCE / THERM),
+                                         null_discount_curve)
+        periods = [DateRange("2011-M1"), DateRange("2011-M3"), DateRange("2011-M4"), DateRange("2011-M5")]
+        for materialise in (False, True):
+            curve = CommodityForwardCurve(ContinuousQuotes(quotes, GasSettlementRule, PENCE / THERM),
+                                          null_discount_curve, materialise=materialise)
+            for period in periods:
+                curve.price(period)
+            curve.update({DateRange("2011-M2"): 110 * PENCE / THERM, DateRange("2011-M4"): 95})
+            # only the prices that depend on the changed quotes are discarded from the cache
+            hits = curve.cache_statistics["hits"]
+            for period in periods:
+                self.assertAlmostEqual(expected.price(period).value, curve.price(period).value, 10)
+            self.assertEqual(hits + 1, curve.cache_statistics["hits"])
+            with self.assertRaises(ValueError):
+                curve.update({DateRange("2011-M6"): 70})
 
+    def test_shared_structure(self):
+        tenors = [DateRange("2012-Q4"), DateRange("2012-M11"), DateRange("2012-M12")]
+        curve = CommodityForwardCurve(ContinuousQuotes(dict(zip(tenors, [9, 10, 8])), GasSettlementRule,
+                                                       PENCE / THERM), mock_discount_curve)
+        sister_curve = CommodityForwardCurve(ContinuousQuotes(dict(zip(tenors, [19, 20, 18])), GasSettlementRule,
+                                                              PENCE / THERM), mock_discount_curve)
+        # the structure is reused, but the prices are the curve's own
+        self.assertIs(curve._system, sister_curve._system)
+        self.assertAlmostEqual(10, curve.price(DateRange("2012-M11")).value, 12)
+        self.assertAlmostEqual(20, sister_curve.price(DateRange("2012-M11")).value, 12)
+        undiscounted_curve = CommodityForwardCurve(ContinuousQuotes(dict(zip(tenors, [9, 10, 8])), GasSettlementRule,
+                                                                    PENCE / THERM), null_discount_curve)
+        self.assertIsNot(curve._system, undiscounted_curve._system)
+
+    def test_scenarios(self):
+        s_to_q = {BASE: [1.1, 0.9, 1, 1]}
+        q_to_m = {BASE: [1.2, 1.2, 0.6, 1.1, 1, 0.9, 1, 1, 1, 1, 1, 1]}
+        wdwe = {WEEKDAY: 1.1, WEEKEND: 1.0}
+        base_ratios = SeasonBasedDailyShapeCalibration(s_to_q, q_to_m, wdwe)
+        tenors = [DateRange("2011-Q1"), DateRange("2011-M2"), DateRange("2011-Q2")]
+        curve = CommodityForwardCurve(ContinuousQuotes(dict(zip(tenors, [105, 100, 90])), GasSettlementRule,
+                                                       PENCE / THERM), null_discount_curve, base_ratios)
+        scenario_quotes = np.array([[105, 100], [110, 95], [100, 101]])
+        scenario_curve = ScenarioForwardCurve(curve, tenors[:2], scenario_quotes)
+        periods = [DateRange("2011-M1"), DateRange("2011-M3"), DateRange("2011-M4"), dt.date(2011, 1, 5)]
+        prices = scenario_curve.prices(periods)
+        self.assertEqual(PENCE / THERM, prices.unit)
+        self.assertEqual((3, 4), prices.value.shape)
+        for quotes, scenario_prices in zip(scenario_quotes, prices.value):
+            expected_curve = CommodityForwardCurve(ContinuousQuotes(dict(zip(tenors, list(quotes) + [90])),
+                                                                    GasSettlementRule, PENCE / THERM),
+                                                   null_discount_curve, base_ratios)
+            for period, price in zip(periods, scenario_prices):
+                self.assertAlmostEqual(expected_curve.price(period).value, price, 10)
+        with self.assertRaises(ValueError):
+            ScenarioForwardCurve(curve, [DateRange("2011-M6")], np.array([[1.]]))
+
+    def test_materialise_with_discount_curve(self):
+        quotes = ContinuousQuotes({DateRange("2012-Q4"): 9 * PENCE / THERM,
+                                   DateRange("2012-M12"): 12 * PENCE / THERM}, GasSettlementRule)
+        curve = CommodityForwardCurve(quotes, mock_discount_curve)
+        materialised = CommodityForwardCurve(quotes, mock_discount_curve).materialise()
+        for period in [DateRange("2012-Q4"), DateRange("2012-M11"), DateRange(dt.date(2012, 11, 30),
+                                                                             dt.date(2012, 12, 2))]:
+            self.assertAlmostEqual(curve.price(period).value, materialised.price(period).value, 10)
+
+    def test_materialise_reprices_quotes(self):
+        """the shaped grid reprices its quotes once discounting is non-trivial"""
+        s_to_q = {BASE: [1.1, 0.9, 1, 1]}
+        q_to_m = {BASE: [1.2, 1.2, 0.6, 1.1, 1, 0.9, 1, 1, 1, 1, 1, 1]}
+        wdwe = {WEEKDAY: 1.1, WEEKEND: 1.0}
+        base_ratios = SeasonBasedDailyShapeCalibration(s_to_q, q_to_m, wdwe)
+        discount_curve = DiscountCurve(RatesQuotes(GBP, {dt.date(2010, 9, 1): 0.05, dt.date(2011, 3, 1): 0.2,
+                                                         dt.date(2012, 12, 31): 0.3}, value_date=dt.date(2010, 9, 1)))
+        quotes = ContinuousQuotes({DateRange("2010-WIN"): 100,
+                                   DateRange("2011-Q1"): 105,
+                                   DateRange("2011-SUM"): 90}, GasSettlementRule, PENCE / THERM)
+        curve = CommodityForwardCurve(quotes, discount_curve, base_ratios, materialise=True)
+        periods = list(quotes.price_dict)
+        for period, price in zip(periods, curve.price_many(periods).value):
+            self.assertAlmostEqual(quotes.price_dict[period], price, 10)
+            self.assertAlmostEqual(quotes.price_dict[period], curve.price(period).value, 10)
+
+        discount_curve = DiscountCurve(RatesQuotes(GBP, {dt.date(2016, 9, 1): 0.05, dt.date(2017, 1, 1): 0.3,
+                                                         dt.date(2017, 12, 31): 0.5}, value_date=dt.date(2016, 9, 1)))
+        quotes = ContinuousQuotes({LoadShapedDateRange("2016-WIN", BASE): 45 * GBP / MWH,
+                                   LoadShapedDateRange("2016-WIN", PEAK): 50 * GBP / MWH,
+                                   LoadShapedDateRange("2016-Q4", PEAK): 52 * GBP / MWH}, UKPowerSettlementRule)
+        curve = CommodityForwardCurve(quotes, discount_curve, intraday_shape_calibration=intraday_shape_ratios,
+                                      materialise=True)
+        for period, price in quotes.price_dict.items():
+            self.assertAlmostEqual(price, curve.price(period).value, 10)
+
+    def test_materialise_matches_partition(self):
+        """the materialised grid is a cache: sub-periods price as they do from the partition, as do scenarios"""
+        s_to_q = {BASE: [1.1, 0.9, 1, 1]}
+        q_to_m = {BASE: [1.2, 1.2, 0.6, 1.1, 1, 0.9, 1, 1, 1, 1, 1, 1]}
+        wdwe = {WEEKDAY: 1.1, WEEKEND: 1.0}
+        base_ratios = SeasonBasedDailyShapeCalibration(s_to_q, q_to_m, wdwe)
+        discount_curve = DiscountCurve(RatesQuotes(GBP, {dt.date(2010, 9, 1): 0.05, dt.date(2011, 3, 1): 0.2,
+                                                         dt.date(2012, 12, 31): 0.3}, value_date=dt.date(2010, 9, 1)))
+        quotes = ContinuousQuotes({DateRange("2010-WIN"): 100,
+                                   DateRange("2011-Q1"): 105,
+                                   DateRange("2011-SUM"): 90}, GasSettlementRule, PENCE / THERM)
+        periods = [DateRange("2011-M1"), DateRange("2011-Q2"), DateRange("2010-M12"), DateRange("2011-7-4"),
+                   DateRange("2011-3-5"), LoadShapedDateRange("2011-M5", WEEKEND)]
+        curve = CommodityForwardCurve(quotes, discount_curve, base_ratios)
+        expected = [curve.price(period).value for period in periods]
+        scenarios = ScenarioForwardCurve(curve, list(quotes.price_dict), [list(quotes.price_dict.values())])
+        np.testing.assert_allclose(expected, scenarios.prices(periods).value[0], rtol=1e-12)
+        curve.materialise()
+        np.testing.assert_allclose(expected, [curve.price(period).value for period in periods], rtol=1e-12)
+        np.testing.assert_allclose(expected, curve.price_many(periods).value, rtol=1e-12)
+
+        discount_curve = DiscountCurve(RatesQuotes(GBP, {dt.date(2016, 9, 1): 0.05, dt.date(2017, 1, 1): 0.3,
+                                                         dt.date(2017, 12, 31): 0.5}, value_date=dt.date(2016, 9, 1)))
+        quotes = ContinuousQuotes({LoadShapedDateRange("2016-WIN", BASE): 45 * GBP / MWH,
+                                   LoadShapedDateRange("2016-WIN", PEAK): 50 * GBP / MWH,
+                                   LoadShapedDateRange("2016-Q4", PEAK): 52 * GBP / MWH}, UKPowerSettlementRule)
+        periods = [LoadShapedDateRange("2016-M11", BASE), LoadShapedDateRange("2017-M2", OFFPEAK),
+                   LoadShapedDateRange("2016-12-15", PEAK), LoadShapedDateRange("2017-1-7", WEEKEND),
+                   LoadShapedDateRange("2016-12-15", WEEKDAY_HOURS[9]), DateRange("2017-3-1")]
+        curve = CommodityForwardCurve(quotes, discount_curve, intraday_shape_calibration=intraday_shape_ratios)
+        expected = [curve.price(period).value for period in periods]
+        curve.materialise()
+        np.testing.assert_allclose(expected, [curve.price(period).value for period in periods], rtol=1e-12)
+        np.testing.assert_allclose(expected, curve.price_many(periods).value, rtol=1e-12)
+
+    def test_materialise_power(self):
+        dec_12_base = LoadShapedDateRange("2012-M12", BASE)
+        dec_12_peak = LoadShapedDateRange("2012-M12", PEAK)
+        quotes = ContinuousQuotes({dec_12_base: 90 * GBP / MWH, dec_12_peak: 120 * GBP / MWH}, UKPowerSettlementRule)
+        curve = CommodityForwardCurve(quotes, null_discount_curve, materialise=True)
+        offpeak_price = (90 * dec_12_base.duration - 120 * dec_12_peak.duration) / (dec_12_base.duration -
+                                                                                     dec_12_peak.duration)
+        self.assertAlmostEqual(curve.price(LoadShapedDateRange("2012-M12", OFFPEAK)).value, offpeak_price)
+        self.assertAlmostEqual(curve.price(LoadShapedDateRange("2012-12-25", PEAK)).value, 120)
+        self.assertAlmostEqual(curve.price(LoadShapedDateRange("2012-12-23", WEEKEND)).value, offpeak_price)
+
+    def test_hourly_export(self):
+        dec_12_base = LoadShapedDateRange("2012-M12", BASE)
+        dec_12_peak = LoadShapedDateRange("2012-M12", PEAK)
+        quotes = ContinuousQuotes({dec_12_base: 90 * GBP / MWH, dec_12_peak: 120 * GBP / MWH}, UKPowerSettlementRule)
+        curve = CommodityForwardCurve(quotes, null_discount_curve, intraday_shape_calibration=intraday_shape_ratios)
+        chunks = list(curve.iter_hourly_chunks(chunk_days=7))
+        self.assertEqual([7 * 24] * 4 + [3 * 24], [len(prices) for _, prices in chunks])
+        # exporting the hours doesn't materialise the curve, so doesn't change how it prices
+        self.assertIsNone(curve._grid)
+        frame = curve.to_hourly_frame()
+        self.assertEqual(31 * 24, len(frame))
+        self.assertEqual(np.datetime64("2012-12-01T00"), frame.index[0])
+        for date, hour in [(dt.date(2012, 12, 3), 0), (dt.date(2012, 12, 4), 9), (dt.date(2012, 12, 29), 13)]:
+            hours = WEEKEND_HOURS if date.weekday() > 4 else WEEKDAY_HOURS
+            expected = curve.price(LoadShapedDateRange(date, hours[hour])).value
+            self.assertAlmostEqual(expected, frame["price"][np.datetime64(date) + np.timedelta64(hour, "h")], 10)
+        december = curve.to_hourly_frame(dt.date(2012, 12, 24), dt.date(2012, 12, 24))
+        self.assertAlmostEqual(120, december["price"].values[8:20].mean(), 10)
+        with self.assertRaises(MissingPriceError):
+            list(curve.iter_hourly_chunks(start=dt.date(2012, 11, 30)))
+
+    def test_hourly_export_unshaped(self):
+        dec_12_base = LoadShapedDateRange("2012-M12", BASE)
+        dec_12_peak = LoadShapedDateRange("2012-M12", PEAK)
+        quotes = ContinuousQuotes({dec_12_base: 90 * GBP / MWH, dec_12_peak: 120 * GBP / MWH}, UKPowerSettlementRule)
+        curve = CommodityForwardCurve(quotes, null_discount_curve)
+        prices = curve.to_hourly_frame(dt.date(2012, 12, 3), dt.date(2012, 12, 3))["price"].values
+        offpeak_price = curve.price(LoadShapedDateRange("2012-12-3", OFFPEAK)).value
+        np.testing.assert_allclose(prices, [offpeak_price] * 8 + [120] * 12 + [offpeak_price] * 4)
@@ -0,0 +1,57 @@
+import datetime as dt
+import unittest
+
+import numpy as np
+
+from core.forward_curves.cumulative_curve import CumulativeCurve
+from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import LoadShape, PEAK, WEEKEND, BASE
+
+
+class TestCumulativeCurve(unittest.TestCase):
+
+    def setUp(self):
+        self.first = dt.date(2016, 1, 1)
+        self.prices = np.arange(1., 32.)
+        self.curve = CumulativeCurve.from_daily(self.first.toordinal(), self.prices)
+
+    def test_daily_average(self):
+        date_range = DateRange(dt.date(2016, 1, 4), dt.date(2016, 1, 10))
+        self.assertAlmostEqual(self.curve.average(date_range), np.mean(self.prices[3:10]), 12)
+
+    def test_load_shaped_average(self):
+        # PEAK only has weekday hours, so weekend days carry no weight
+        lsdr = LoadShapedDateRange(DateRange(dt.date(2016, 1, 4), dt.date(2016, 1, 10)), PEAK)
+        self.assertAlmostEqual(self.curve.average(lsdr), np.mean(self.prices[3:8]), 12)
+        value, weight = self.curve.sums(lsdr)
+        self.assertAlmostEqual(weight, 5 * 12 / 24, 12)
+        lsdr = LoadShapedDateRange(DateRange(dt.date(2016, 1, 4), dt.date(2016, 1, 10)), WEEKEND)
+        self.assertAlmostEqual(self.curve.average(lsdr), np.mean(self.prices[8:10]), 12)
+
+    def test_covers(self):
+        self.assertTrue(self.curve.covers(DateRange("2016-M1")))
+        self.assertFalse(self.curve.covers(DateRange("2016-Q1")))
+        with self.assertRaises(ValueError):
+            self.curve.sums(DateRange("2016-Q1"))
+
+    def test_missing(self):
+        prices = self.prices.copy()
+        prices[5] = np.nan
+        curve = CumulativeCurve.from_daily(self.first.toordinal(), prices)
+        self.assertIsNone(curve.average(DateRange("2016-M1")))
+        self.assertAlmostEqual(curve.average(DateRange(dt.date(2016, 1, 7), dt.date(2016, 1, 31))),
+                               np.mean(self.prices[6:]), 12)
+
+    def test_indivisible_blocks(self):
+        bitmaps = [hour.bitmap for hour in BASE]
+        values = np.tile(np.arange(48.), (3, 1))
+        weights = np.ones((3, 48))
+        curve = CumulativeCurve(self.first.toordinal(), bitmaps, values, weights)
+        lsdr = LoadShapedDateRange(DateRange(dt.date(2016, 1, 1), dt.date(2016, 1, 3)), LoadShape(3))
+        self.assertAlmostEqual(curve.average(lsdr), 0.5, 12)
+        coarse = CumulativeCurve(self.first.toordinal(), [PEAK.bitmap], np.ones((3, 1)), np.ones((3, 1)))
+        self.assertIsNone(coarse.sums(LoadShapedDateRange(DateRange(self.first, self.first), LoadShape(1 << 10))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,8 +4,11 @@ import unittest
 import numpy as np
 
 from core.base.quantity import USD, GBP, EUR
-from core.forward_curves.fx_rates_forward_curves import FxForwardCurve, DiscountCurve, ForeignDiscountCurve
+from core.forward_curves.fx_rates_forward_curves import FxForwardCurve, DiscountCurve, ForeignDiscountCurve, \
+    triangulate
+from core.forward_curves.interpolation import LogLinearInterpolator, MonotoneCubicInterpolator
 from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import PEAK
 from inputs.market_data.forwards.quotes import MissingPriceError, FxQuotes, RatesQuotes
 
 
@@ -39,6 +42,42 @@ class FxForwardCurveTestCase(unittest.TestCase):
         with self.assertRaises(MissingPriceError):
             self.curve.price(DateRange("2015, 8, 1"))
 
+    def test_price_cache(self):
+        date = dt.date(2014, 8, 1)
+        price = self.curve.price(date)
+        # the date is parsed before the cache lookup, so the equivalent DateRange is a hit
+        self.assertEqual(self.curve.price(DateRange(date, date)), price)
+        statistics = self.curve.cache_statistics
+        self.assertEqual((1, 1, 1), (statistics["size"], statistics["hits"], statistics["misses"]))
+        self.curve.set_cache_policy(1)
+        self.curve.price(date)
+        self.curve.price(dt.date(2014, 8, 2))
+        self.assertEqual((1, 1), (self.curve.cache_statistics["size"], self.curve.cache_statistics["evictions"]))
+        self.curve.set_cache_policy(0)
+        self.assertEqual(self.curve.price(date), price)
+        self.assertEqual(0, self.curve.cache_statistics["size"])
+
+    def test_price_many(self):
+        periods = [dt.date(2014, 8, 1), DateRange("2014-M8"), LoadShapedDateRange("2014-M8", PEAK),
+                   DateRange("2014-Q2")]
+        prices = self.curve.price_many(periods)
+        self.assertEqual(USD / GBP, prices.unit)
+        for period, price in zip(periods, prices.value):
+            self.assertAlmostEqual(self.curve.price(period).value, price, 14)
+        ordinals = np.arange(dt.date(2014, 1, 1).toordinal(), dt.date(2014, 10, 2).toordinal())
+        self.assertEqual(len(ordinals), len(self.curve.price_many(ordinals)))
+        inverse_prices = self.curve.inverse.price_many(periods)
+        self.assertEqual(GBP / USD, inverse_prices.unit)
+        self.assertTrue(np.allclose(1 / prices.value, inverse_prices.value, rtol=1e-14))
+        with self.assertRaises(MissingPriceError):
+            self.curve.price_many([DateRange("2014-M8"), DateRange("2015-M8")])
+
+    def test_interpolator(self):
+        curve = FxForwardCurve(self.quotes, MonotoneCubicInterpolator)
+        self.assertAlmostEqual(1.27, curve.price(DateRange("2014-7-1")).value, 14)
+        self.assertTrue(1.27 < curve.price(DateRange("2014-8-1")).value < 1.28)
+        self.assertNotEqual(curve.fingerprint, self.curve.fingerprint)
+
     def test_compute_fx_forward_on_lsdr(self):
         """
         Test that we can compute an everage FX rate over a non-trivial LoadShapedDateRange
@@ -48,7 +87,9 @@ class FxForwardCurveTestCase(unittest.TestCase):
                                            "offpeak").duration
                        * np.exp((np.log(1.27) * (92 - i) + np.log(1.28) * i) / 92)
                        for i in range(92))
-        self.assertEqual(self.curve.price(lsdr), expected / lsdr.duration * USD / GBP)
+        # the curve averages from cumulative sums, so only agrees with the day by day sum to rounding
+        self.assertAlmostEqual(self.curve.price(lsdr).value, expected / lsdr.duration, 14)
+        self.assertEqual(self.curve.price(lsdr).unit, USD / GBP)
         # sanity check: we expect the price to be close to 1.275
         self.assertTrue(1.2748 < self.curve.price(lsdr).value < 1.2752)
 
@@ -61,7 +102,9 @@ class RateCurveTestCase(unittest.TestCase):
                               dt.date(2014, 7, 1): 0.04,
                               dt.date(2014, 10, 1): 0.06},
                              value_date=dt.date(2013, 12, 31))
+        self.quotes = quotes
         self.curve = DiscountCurve(quotes)
+        self.materialised_curve = DiscountCurve(quotes, materialise=True)
 
     def test_is_null(self):
         quotes = RatesQuotes(USD,
@@ -87,6 +130,33 @@ class RateCurveTestCase(unittest.TestCase):
         expected = (1 + expected_rate) ** ((self.curve.value_date - dt.date(2014, 9, 1).toordinal()) / 365)
         self.assertEqual(self.curve.price(DateRange("2014-9-1")), expected)
 
+    def test_price_many(self):
+        dates = [dt.date(2013, 12, 31), dt.date(2014, 1, 1), dt.date(2014, 9, 1), DateRange("2014-10-1")]
+        prices = self.curve.price_many(dates)
+        for date, price in zip(dates, prices.value):
+            self.assertAlmostEqual(self.curve.price(date), price, 14)
+        ordinals = np.array([date.toordinal() for date in dates[:3]])
+        self.assertTrue(np.array_equal(prices.value[:3], self.curve.price_many(ordinals).value))
+        with self.assertRaises(MissingPriceError):
+            self.curve.price_many([dt.date(2015, 1, 1)])
+
+    def test_discount_factors(self):
+        ordinals = np.arange(dt.date(2013, 12, 31).toordinal(), dt.date(2014, 10, 2).toordinal())
+        expected = [self.curve.price(int(ordinal)) for ordinal in ordinals]
+        for curve in self.curve, self.materialised_curve:
+            self.assertTrue(np.allclose(expected, curve.discount_factors(ordinals), rtol=1e-14, atol=0))
+            with self.assertRaises(MissingPriceError):
+                curve.discount_factors(np.array([dt.date(2014, 10, 2).toordinal()]))
+
+    def test_interpolator(self):
+        curve = DiscountCurve(self.quotes, interpolator=LogLinearInterpolator)
+        self.assertAlmostEqual(self.curve.price(dt.date(2014, 7, 1)), curve.price(dt.date(2014, 7, 1)), 14)
+        # log-linear discount factors mean a flat forward rate between the quoted dates
+        dfs = curve.discount_factors(np.arange(dt.date(2014, 7, 1).toordinal(), dt.date(2014, 10, 2).toordinal()))
+        forward_rates = np.log(dfs[:-1] / dfs[1:])
+        self.assertTrue(np.allclose(forward_rates, forward_rates[0], rtol=1e-10))
+        self.assertAlmostEqual(curve.price(dt.date(2014, 8, 1)), dfs[31], 14)
+
     def test_forward_discount_factor(self):
         days_offset = (dt.date(2014, 9, 1) - dt.date(2014, 7, 1)).days
         expected_rate = 0.04 + (0.06 - 0.04) / 92 * days_offset
@@ -156,6 +226,16 @@ class ForeignDiscountCurveTestCase(unittest.TestCase):
         with self.assertRaises(TypeError):
             ForeignDiscountCurve(self.domestic_curve, self.usdeur_curve)
 
+    def test_discount_factors(self):
+        dates = [dt.date(2013, 12, 18), dt.date(2014, 1, 15), dt.date(2014, 2, 15), dt.date(2014, 4, 1)]
+        ordinals = np.array([date.toordinal() for date in dates])
+        for curve in (self.foreign_discount_curve, ForeignDiscountCurve(self.domestic_curve, self.inverse_fx_curve)):
+            discount_factors = curve.discount_factors(ordinals)
+            for date, discount_factor in zip(dates, discount_factors):
+                self.assertAlmostEqual(getattr(curve.price(date), "value", curve.price(date)), discount_factor, 14)
+        with self.assertRaises(MissingPriceError):
+            self.foreign_discount_curve.discount_factors(np.array([dt.date(2014, 4, 2).toordinal()]))
+
 class InverseFxCurveTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -176,4 +256,65 @@ class InverseFxCurveTestCase(unittest.TestCase):
 
     def test_inverse(self):
         self.assertAlmostEqual(self.fx_curve.inverse.price(dt.date(2014, 2, 20)).value,
-                               self.inverse_fx_curve.price(dt.date(2014, 2, 20)).value)
\ No newline at end of file
+                               self.inverse_fx_curve.price(dt.date(2014, 2, 20)).value)
+
+    def test_forwards(self):
+        ordinals = np.arange(dt.date(2013, 12, 18).toordinal(), dt.date(2014, 4, 2).toordinal())
+        forwards = self.fx_curve.forwards(ordinals)
+        np.testing.assert_allclose(1 / forwards, self.fx_curve.inverse.forwards(ordinals), rtol=1e-14)
+        np.testing.assert_allclose(forwards, self.fx_curve.price_many(ordinals).value, rtol=1e-14)
+        self.assertEqual(self.fx_curve.price(dt.date(2014, 2, 20)).value,
+                         forwards[dt.date(2014, 2, 20).toordinal() - ordinals[0]])
+        self.assertIs(self.fx_curve, self.fx_curve.inverse.inverse)
+        with self.assertRaises(MissingPriceError):
+            self.fx_curve.forwards(ordinals + 1)
+
+
+class CrossFxCurveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        value_date = dt.date(2013, 12, 18)
+        self.usd_per_eur = FxForwardCurve(FxQuotes({dt.date(2013, 12, 18): 1.35,
+                                                    dt.date(2014, 6, 1): 1.36,
+                                                    dt.date(2014, 12, 1): 1.38},
+                                                   value_date=value_date, unit=USD / EUR))
+        self.usd_per_gbp = FxForwardCurve(FxQuotes({dt.date(2013, 12, 18): 1.6,
+                                                    dt.date(2014, 3, 1): 1.62,
+                                                    dt.date(2015, 3, 1): 1.65},
+                                                   value_date=value_date, unit=USD / GBP))
+
+    def test_triangulate(self):
+        eur_per_gbp = triangulate(self.usd_per_eur.inverse, self.usd_per_gbp)
+        self.assertEqual(EUR / GBP, eur_per_gbp.unit)
+        self.assertEqual((dt.date(2013, 12, 18).toordinal(), dt.date(2014, 12, 1).toordinal()), eur_per_gbp.horizon)
+        ordinals = np.arange(dt.date(2013, 12, 18).toordinal(), dt.date(2014, 12, 2).toordinal())
+        np.testing.assert_allclose(self.usd_per_gbp.forwards(ordinals) / self.usd_per_eur.forwards(ordinals),
+                                   eur_per_gbp.forwards(ordinals), rtol=1e-14)
+        date = dt.date(2014, 5, 1)
+        self.assertAlmostEqual((self.usd_per_gbp.price(date) / self.usd_per_eur.price(date)).value,
+                               eur_per_gbp.price(date).value, 14)
+        # a period is the average of the daily cross rates
+        period = DateRange("2014-Q2")
+        days = np.arange(period.start.toordinal(), period.end.toordinal() + 1)
+        self.assertAlmostEqual(np.mean(eur_per_gbp.forwards(days)), eur_per_gbp.price(period).value, 14)
+        prices = eur_per_gbp.price_many([date, period])
+        self.assertEqual(EUR / GBP, prices.unit)
+        with self.assertRaises(MissingPriceError):
+            eur_per_gbp.price(dt.date(2015, 1, 1))
+
+    def test_orientation(self):
+        """each leg is inverted as needed, whichever way round the quoted curves are"""
+        eur_per_gbp = triangulate(self.usd_per_eur, self.usd_per_gbp)
+        self.assertEqual(EUR / GBP, eur_per_gbp.unit)
+        gbp_per_eur = triangulate(self.usd_per_gbp.inverse, self.usd_per_eur.inverse)
+        self.assertEqual(GBP / EUR, gbp_per_eur.unit)
+        date = dt.date(2014, 5, 1)
+        self.assertAlmostEqual(1 / eur_per_gbp.price(date).value, gbp_per_eur.price(date).value, 14)
+        with self.assertRaises(TypeError):
+            triangulate(self.usd_per_gbp, self.usd_per_gbp)
+
+    def test_cache(self):
+        self.assertIs(triangulate(self.usd_per_eur, self.usd_per_gbp), triangulate(self.usd_per_eur, self.usd_per_gbp))
+        other = FxForwardCurve(FxQuotes({dt.date(2013, 12, 18): 1.5, dt.date(2014, 12, 1): 1.7},
+                                        value_date=dt.date(2013, 12, 18), unit=USD / GBP))
+        self.assertIsNot(triangulate(self.usd_per_eur, self.usd_per_gbp), triangulate(self.usd_per_eur, other))
\ No newline at end of file
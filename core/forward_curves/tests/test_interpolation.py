@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from core.forward_curves.interpolation import LinearInterpolator, LogLinearInterpolator, StepInterpolator, \
+    MonotoneCubicInterpolator
+
+
+class InterpolationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.array([0., 1., 3., 4.])
+        self.y = np.array([1., 2., 2.5, 5.])
+        self.points = np.linspace(-1, 5, 25)
+
+    def test_pillars(self):
+        for interpolator_class in (LinearInterpolator, LogLinearInterpolator, StepInterpolator,
+                                   MonotoneCubicInterpolator):
+            interpolator = interpolator_class(self.x, self.y)
+            self.assertTrue(np.allclose(self.y, interpolator(self.x), rtol=1e-14))
+            # outside the pillars the end values are held flat
+            self.assertAlmostEqual(self.y[0], interpolator(-1.), 14)
+            self.assertAlmostEqual(self.y[-1], interpolator(5.), 14)
+
+    def test_linear(self):
+        self.assertTrue(np.array_equal(np.interp(self.points, self.x, self.y),
+                                       LinearInterpolator(self.x, self.y)(self.points)))
+        expected = np.exp(np.interp(self.points, self.x, np.log(self.y)))
+        self.assertTrue(np.allclose(expected, LogLinearInterpolator(self.x, self.y)(self.points), rtol=1e-14))
+
+    def test_step(self):
+        interpolator = StepInterpolator(self.x, self.y)
+        self.assertTrue(np.array_equal([1., 2., 2., 2.5, 5.], interpolator(np.array([0.5, 1., 2.9, 3.5, 4.]))))
+
+    def test_monotone_cubic(self):
+        interpolator = MonotoneCubicInterpolator(self.x, self.y - 1)
+        self.assertAlmostEqual(135 / 224, interpolator(0.5), 14)
+        self.assertAlmostEqual(69 / 56, interpolator(2.), 14)
+        # monotone pillars give a monotone curve, with no overshoot
+        values = interpolator(np.linspace(0, 4, 401))
+        self.assertTrue(np.all(np.diff(values) >= 0))
+        flat = MonotoneCubicInterpolator(self.x, np.array([1., 2., 2., 1.]))
+        self.assertTrue(np.all(flat(np.linspace(1, 3, 21)) == 2.))
+        self.assertEqual(3., MonotoneCubicInterpolator(np.array([1.]), np.array([3.]))(2.))
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            LinearInterpolator(np.array([0., 0.]), np.array([1., 2.]))
+        with self.assertRaises(ValueError):
+            LinearInterpolator(np.array([0., 1.]), np.array([1.]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,15 @@
 import datetime as dt
 import unittest
 
+import numpy as np
+
 from core.forward_curves.shape_ratio import IntradayShapeRatioCurve, DailyShapeRatioCurve
-from core.time_period.date_range import LoadShapedDateRange
-from core.time_period.load_shape import HOURS, DAYTIME, NIGHTTIME, EFAS
-from inputs.market_data.forwards.quotes import AbstractContinuousQuotes
+from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import HOURS, WEEKDAY_HOURS, WEEKEND_HOURS, DAYTIME, NIGHTTIME, EFAS, \
+    EFA_DAY_BLOCKS
+from inputs.market_data.forwards.quotes import AbstractContinuousQuotes, MissingPriceError
+from inputs.market_data.forwards.intraday_shape_calibration import EfaIntradayShapeCalibration, \
+    HalfHourlyPowerIntradayShapeCalibration
 from inputs.market_data.forwards.tests.testing_data import intraday_shape_ratios
 
 
@@ -32,4 +37,35 @@ class IntraDayShapedForwardCurveTestCase(unittest.TestCase):
         time_period = LoadShapedDateRange(dt.date(2015, 5, 5), EFAS[0])
         denominator_period = ratio_denominator_period[0][0]
         self.assertAlmostEqual(self.intraday_shaped_curve.price(time_period),
-                               ratio * self.curve.price(denominator_period))
\ No newline at end of file
+                               ratio * self.curve.price(denominator_period))
+
+    def test_hourly_prices(self):
+        prices = self.intraday_shaped_curve.hourly_prices(DateRange(dt.date(2015, 5, 1), dt.date(2015, 5, 10)))
+        self.assertEqual((10, 24), prices.shape)
+        for day in range(10):
+            date = dt.date(2015, 5, 1) + dt.timedelta(day)
+            for hour in range(24):
+                hours = WEEKEND_HOURS if date.weekday() > 4 else WEEKDAY_HOURS
+                expected = self.intraday_shaped_curve._hourly_price(LoadShapedDateRange(date, hours[hour]))
+                self.assertAlmostEqual(getattr(expected, "value", expected), prices[day, hour], 12)
+        with self.assertRaises(MissingPriceError):
+            self.intraday_shaped_curve.hourly_prices(DateRange(dt.date(2015, 5, 10), dt.date(2015, 5, 11)))
+
+    def test_efa_hourly_prices(self):
+        data = [[[1.3, 0.9, 0.9, 0.9] for _ in range(12)] for _ in range(6)]
+        curve = IntradayShapeRatioCurve(self.curve, EfaIntradayShapeCalibration(data))
+        prices = curve.hourly_prices(DateRange(dt.date(2015, 5, 4), dt.date(2015, 5, 4)))
+        self.assertAlmostEqual(1.3 * self.curve.price(LoadShapedDateRange("2015-5-4", NIGHTTIME)), prices[0, 23], 12)
+        self.assertAlmostEqual(1.3 * self.curve.price(LoadShapedDateRange("2015-5-4", DAYTIME)), prices[0, 11], 12)
+        self.assertAlmostEqual(curve.price(LoadShapedDateRange("2015-5-4", EFA_DAY_BLOCKS[0])),
+                               self.curve.price(LoadShapedDateRange("2015-5-4", NIGHTTIME)), 12)
+
+    def test_settlement_period_prices(self):
+        data = [[[ratio * factor for ratio in ratios for factor in (1.05, 0.95)] for ratios in block]
+                for block in intraday_shape_ratios.ratios]
+        curve = IntradayShapeRatioCurve(self.curve, HalfHourlyPowerIntradayShapeCalibration(data))
+        date_range = DateRange(dt.date(2015, 5, 1), dt.date(2015, 5, 10))
+        prices = curve.settlement_period_prices(date_range)
+        self.assertEqual((10, 48), prices.shape)
+        np.testing.assert_allclose(self.intraday_shaped_curve.hourly_prices(date_range),
+                                   prices.reshape(10, 24, 2).mean(axis=2))
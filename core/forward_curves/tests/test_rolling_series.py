@@ -0,0 +1,70 @@
+import datetime as dt
+import unittest
+
+import numpy as np
+
+from core.base.quantity import USD, GBP
+from core.forward_curves.abstract_forward_curve import AbstractForwardCurve
+from core.forward_curves.fx_rates_forward_curves import FxForwardCurve
+from core.forward_curves.rolling_series import RollingSeries
+from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import PEAK
+from core.time_period.relative_date_range import RelativeDateRange
+from inputs.market_data.forwards.quotes import FxQuotes, MissingPriceError
+
+
+class CountingCurve(AbstractForwardCurve):
+
+    def __init__(self, curve):
+        super().__init__()
+        self.curve = curve
+        self.count = 0
+
+    def _new_price(self, period):
+        self.count += 1
+        return self.curve.price(period)
+
+
+class RollingSeriesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        quotes = FxQuotes({dt.date(2014, 1, 1): 1.25,
+                           dt.date(2014, 4, 1): 1.26,
+                           dt.date(2014, 7, 1): 1.27,
+                           dt.date(2014, 10, 1): 1.28},
+                          value_date=dt.date(2013, 12, 31),
+                          unit=USD / GBP)
+        self.curve = FxForwardCurve(quotes)
+        self.obs_dates = [dt.date(2014, 1, 1) + dt.timedelta(i) for i in range(200)]
+
+    def test_build(self):
+        series = RollingSeries(RelativeDateRange('ma', 1))
+        prices = series.build(self.obs_dates, self.curve)
+        self.assertEqual(USD / GBP, prices.unit)
+        self.assertEqual(len(self.obs_dates), len(prices))
+        for obs_date, price in zip(self.obs_dates, prices.value):
+            self.assertEqual(self.curve.price(RelativeDateRange('ma', 1).fix(obs_date)).value, price)
+
+    def test_each_contract_priced_once(self):
+        curve = CountingCurve(self.curve)
+        RollingSeries('qa').build(self.obs_dates, curve)
+        self.assertEqual(3, curve.count)
+        curves = [CountingCurve(self.curve), CountingCurve(self.curve)]
+        RollingSeries('ma').build(self.obs_dates, [curves[i % 2] for i in range(len(self.obs_dates))])
+        self.assertEqual([7, 7], [curve.count for curve in curves])
+        with self.assertRaises(ValueError):
+            RollingSeries('ma').build(self.obs_dates, curves)
+
+    def test_load_shape(self):
+        series = RollingSeries(RelativeDateRange('ma', 2), 'peak')
+        self.assertEqual([LoadShapedDateRange('2014-M3', PEAK), LoadShapedDateRange('2014-M4', PEAK)],
+                         series.contracts([dt.date(2014, 1, 31), dt.date(2014, 2, 1)]))
+        prices = series.build([dt.date(2014, 1, 31)], self.curve)
+        self.assertEqual(self.curve.price(LoadShapedDateRange('2014-M3', PEAK)), prices[0])
+
+    def test_missing_prices(self):
+        prices = RollingSeries('ma').build([dt.date(2014, 8, 1), dt.date(2014, 9, 1)], self.curve)
+        self.assertEqual(self.curve.price(DateRange('2014-M9')).value, prices.value[0])
+        self.assertTrue(np.isnan(prices.value[1]))
+        with self.assertRaises(MissingPriceError):
+            RollingSeries('ma').build([dt.date(2015, 8, 1)], self.curve)
@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+
+from core.forward_curves.abstract_forward_curve import AbstractForwardCurve
+from core.forward_curves.shape_ratio import ShapeAlgorithm
+from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import BASE, PEAK, WEEKDAY, WEEKEND, HOURS
+from core.time_period.time_period_sets import TimePeriodSet
+from inputs.market_data.forwards.daily_shape_calibration import SeasonBasedDailyShapeCalibration
+from inputs.market_data.forwards.quotes import MissingPriceError
+from inputs.market_data.forwards.tests.testing_data import intraday_shape_ratios
+
+
+class ShapeAlgorithmTestCase(unittest.TestCase):
+
+    def setUp(self):
+        s_to_q = {BASE: [1.1, 0.9, 1, 1]}
+        q_to_m = {BASE: [1.2, 1.2, 0.6, 1.1, 1, 0.9, 1, 1, 1, 1, 1, 1]}
+        wdwe = {WEEKDAY: 1.1, WEEKEND: 1.0}
+        self.daily = SeasonBasedDailyShapeCalibration(s_to_q, q_to_m, wdwe)
+
+    def assert_matches_curve(self, shape, numerator, denominator):
+        """the shape ratio from the ratio table matches pricing each time period off the shape ratio curve"""
+        curve = shape._shape_ratio_curve(denominator)
+        expected = shape.price_time_period_set(curve, numerator) / shape.price_time_period_set(curve, denominator)
+        self.assertAlmostEqual(expected, shape.shape_ratio(numerator, denominator), 12)
+
+    def test_daily_shape_ratio(self):
+        shape = ShapeAlgorithm(self.daily)
+        denominator = TimePeriodSet([DateRange("2011-SUM")])
+        for numerator in [DateRange("2011-Q2"), DateRange("2011-M5"), DateRange("2011-5-7"),
+                          LoadShapedDateRange("2011-M8", PEAK), LoadShapedDateRange("2011-M8", WEEKEND)]:
+            self.assert_matches_curve(shape, TimePeriodSet([numerator]), denominator)
+        self.assert_matches_curve(shape, TimePeriodSet([DateRange("2011-M4"), DateRange("2011-M9")]), denominator)
+
+    def test_intraday_shape_ratio(self):
+        shape = ShapeAlgorithm(intraday_shape_calibration=intraday_shape_ratios)
+        denominator = TimePeriodSet([LoadShapedDateRange("2016-M8", PEAK)])
+        for numerator in [LoadShapedDateRange("2016-8-2", HOURS[9]), LoadShapedDateRange("2016-M8", HOURS[19])]:
+            self.assert_matches_curve(shape, TimePeriodSet([numerator]), denominator)
+        ratios = shape.shape_ratios([LoadShapedDateRange("2016-8-2", HOURS[9]), DateRange("2016-8-3")], denominator)
+        self.assertAlmostEqual(shape.shape_ratio(TimePeriodSet([DateRange("2016-8-3")]), denominator), ratios[1], 12)
+
+    def test_tables_shared_across_season(self):
+        shape = ShapeAlgorithm(self.daily)
+        shape.shape_ratio(TimePeriodSet([DateRange("2011-M5")]), TimePeriodSet([DateRange("2011-Q2")]))
+        shape.shape_ratio(TimePeriodSet([DateRange("2011-M8")]), TimePeriodSet([DateRange("2011-SUM")]))
+        self.assertEqual(1, len(shape._ratio_tables))
+
+    def test_outside_calibration(self):
+        shape = ShapeAlgorithm(self.daily)
+        with self.assertRaises(MissingPriceError):
+            shape.shape_ratio(TimePeriodSet([DateRange("2011-M10")]), TimePeriodSet([DateRange("2011-SUM")]))
+
+    def test_unshaped(self):
+        """without calibrations every shape ratio is 1, and no hourly tables are built"""
+        shape = ShapeAlgorithm(day_weights=lambda first, last: np.linspace(1, 0.5, last - first + 1))
+        denominator = TimePeriodSet([DateRange("2011-SUM")])
+        self.assertEqual(1, shape.shape_ratio(TimePeriodSet([DateRange("2011-M5")]), denominator))
+        ratios = shape.shape_ratios([DateRange("2011-M5"), DateRange("2011-5-7")], denominator)
+        np.testing.assert_array_equal([1, 1], ratios)
+        self.assertEqual(0, len(shape._ratio_tables))
+
+        # the weights are still summed in bulk, from a table of weekday and weekend blocks
+        first, last = DateRange("2011-SUM").start.toordinal(), DateRange("2011-SUM").end.toordinal()
+        day_weights = np.linspace(1, 0.5, last - first + 1)
+        ordinals = np.arange(DateRange("2011-M5").start.toordinal(), DateRange("2011-M5").end.toordinal() + 1)
+        weekdays = ordinals[(ordinals - 1) % 7 < 5]
+        expected = (day_weights[weekdays - first] * 12 / 24).sum()
+        period = LoadShapedDateRange("2011-M5", PEAK)
+        values, weights, valid = shape.shaped_sums(*AbstractForwardCurve._period_arrays([period]), denominator)
+        self.assertTrue(valid[0])
+        self.assertAlmostEqual(expected, weights[0], 12)
+        self.assertAlmostEqual(expected, values[0], 12)
+        table, = shape._ratio_tables.values()
+        self.assertEqual(2, len(table.block_bitmaps))
@@ -62,4 +62,31 @@ class ShifftedForwardCurveTestCase(unittest.TestCase):
         check_period = DateRange(dt.date(2015, 1, 1), dt.date(2015, 1, 14))
         for day in check_period:
             ratio = shifted_curve.price(day) / base_curve.price(day)
-            self.assertEqual(ratio, self.shift if day in shift_period else 1.0)
\ No newline at end of file
+            self.assertEqual(ratio, self.shift if day in shift_period else 1.0)
+
+    def test_price_many(self):
+        jan = DateRange("2015-M1")
+        base_curve = CommodityForwardCurve(self.monthly_quotes, null_discount_curve)
+        shifted_curve = base_curve.shift(jan, self.shift)
+        periods = [jan, DateRange("2015-M2"), DateRange("2015-Q1"), dt.date(2015, 1, 10)]
+        prices = shifted_curve.price_many(periods)
+        self.assertEqual(PENCE / THERM, prices.unit)
+        for period, price in zip(periods, prices.value):
+            self.assertAlmostEqual(shifted_curve.price(period).value, price, 12)
+
+    def test_stacked_shifts(self):
+        jan = DateRange("2015-M1")
+        feb = DateRange("2015-M2")
+        q1 = DateRange("2015-Q1")
+        base_curve = CommodityForwardCurve(self.monthly_quotes, null_discount_curve)
+        shifted_curve = base_curve.shift(jan, self.shift).shift(q1, 1.2).shift(DateRange("2015-M6"), 0.5)
+        # the shifts are folded into one profile over the base curve
+        self.assertIs(shifted_curve.input_curve, base_curve)
+        self.assertEqual(3, len(shifted_curve.layers))
+        self.assertAlmostEqual(shifted_curve.price(jan).value, 70 * self.shift * 1.2, 12)
+        self.assertAlmostEqual(shifted_curve.price(feb).value, 60 * 1.2, 12)
+        expected = (70 * self.shift * 31 + 60 * 28 + 55 * 31) * 1.2 / 90
+        self.assertAlmostEqual(shifted_curve.price(q1).value, expected, 12)
+        periods = [jan, q1, DateRange(dt.date(2015, 1, 30), dt.date(2015, 2, 2))]
+        for period, price in zip(periods, shifted_curve.price_many(periods).value):
+            self.assertAlmostEqual(shifted_curve.price(period).value, price, 12)
@@ -1,6 +1,7 @@
 # TODO: improve docstrings
 # TODO: see if there's a better place structurally to keep NEVER_DR, ALWAYS_DR, NEVER_LSDR
 
+from core.base.cache import LRUCache
 from core.base.quantity import DAY
 from core.time_period.load_shape import LoadShape, BASE
 from core.time_period.time_utilities import workdays
@@ -8,9 +9,13 @@ from inputs.static_data.time_constants import END_OF_WORLD, START_OF_WORLD
 
 import datetime as dt
 import math
+import numpy as np
 import pandas as pd
 from abc import abstractmethod, abstractproperty, abstractstaticmethod
 
+# discounted durations, keyed on (settlement rule, time period, discount curve fingerprint)
+_discounted_duration_cache = LRUCache(maxsize=100000, name="discounted_duration")
+
 
 class AbstractDateRange(object):
 
@@ -44,11 +49,39 @@ class AbstractDateRange(object):
         Calculates the discounted duration of a time period, given a settlement rule and a discount curve.
         Used e.g. for curve construction.
 
+        The days are grouped by settlement date, so the discount factors are looked up in bulk, once per settlement
+        date, and the discounted duration is the dot product of the duration settled on each date with the discount
+        factors.
+
         :param settlement_rule: a concrete subclass of AbstractSettlementRule object.
         :param discount_curve: a DiscountCurve or ForwardDiscountCurve object
         :return: the discounted duration of the time period
         """
-        return settlement_rule(self).discounted_duration(discount_curve)
+        # the cache is keyed on the discount curve's fingerprint, a short digest of its data computed when it's built
+        fingerprint = getattr(discount_curve, "fingerprint", None)
+        key = (settlement_rule, self, fingerprint)
+        if fingerprint is not None:
+            discounted_duration = _discounted_duration_cache.get(key)
+            if discounted_duration is not None:
+                return discounted_duration
+        ordinals = self.ordinals
+        schedule = settlement_rule.settlement_schedule(self.start.toordinal(), self.end.toordinal())
+        settlement_ordinals, inverse = np.unique(schedule, return_inverse=True)
+        weekend = (ordinals - 1) % 7 > 4
+        weekdays = np.bincount(inverse[~weekend], minlength=len(settlement_ordinals))
+        weekends = np.bincount(inverse[weekend], minlength=len(settlement_ordinals))
+        weekday_load_factor, weekend_load_factor = self.load_factors
+        durations = weekdays * weekday_load_factor + weekends * weekend_load_factor
+        # don't look up discount factors for settlement dates with nothing to settle
+        settled = durations > 0
+        if settled.any():
+            discount_factors = discount_curve.discount_factors(settlement_ordinals[settled])
+            discounted_duration = (durations[settled] * discount_factors).sum() * DAY
+        else:
+            discounted_duration = 0 * DAY
+        if fingerprint is not None:
+            _discounted_duration_cache[key] = discounted_duration
+        return discounted_duration
 
     def settlement_dates(self, settlement_rule):
         """
@@ -68,6 +101,14 @@ class AbstractDateRange(object):
         """
         return sum(function(d) * d.duration for d in self) / self.duration
 
+    @abstractproperty
+    def ordinals(self):
+        """numpy array of the ordinals of each day in the date range"""
+
+    @abstractproperty
+    def load_factors(self):
+        """tuple of the fraction of each weekday and of each weekend day within the time period"""
+
     @abstractmethod
     def split_by_range_type(self, range_type):
         """splits the date range into components each having the desired range_type"""
@@ -189,6 +230,16 @@ class DateRange(AbstractDateRange):
             return (self.end - self.start).days + 1
         return 0
 
+    @property
+    def ordinals(self):
+        """Returns a numpy array of the ordinals of each day in self"""
+        return np.arange(self.start.toordinal(), self.end.toordinal() + 1, dtype=np.int64)
+
+    @property
+    def load_factors(self):
+        """Every hour of every day is in a DateRange"""
+        return 1, 1
+
     def __contains__(self, lhs):
         if isinstance(lhs, dt.date):
             return self.start <= lhs <= self.end
@@ -910,6 +961,16 @@ class LoadShapedDateRange(AbstractDateRange):
     def offset(self, shift=1):
         return LoadShapedDateRange(self.date_range.offset(shift), self.load_shape)
 
+    @property
+    def ordinals(self):
+        """returns a numpy array of the ordinals of each day in the date range"""
+        return self.date_range.ordinals
+
+    @property
+    def load_factors(self):
+        """returns the weekday and weekend load factors of the load shape"""
+        return self.load_shape.weekday_load_factor, self.load_shape.weekend_load_factor
+
     @property
     def duration(self):
         """returns the duration in days"""
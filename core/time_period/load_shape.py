@@ -210,3 +210,9 @@ EFAS = [LoadShape(LoadShape.create_bitmap(4*i, 4*(i+1), True, True),
                   'EFA{:d}'.format(i+1)) for i in range(6)]
 WEEKDAY_EFAS = [efa.intersection(WEEKDAY, 'Weekday-'+efa.name) for efa in EFAS]
 WEEKEND_EFAS = [efa.intersection(WEEKEND, 'Weekend-'+efa.name) for efa in EFAS]
+# EFA blocks of the traded EFA day, which starts at 23:00. Load shapes are within a calendar day, so the first block is
+# 23:00 to midnight and midnight to 03:00 of the same day.
+EFA_DAY_BLOCKS = [LoadShape(LoadShape.create_bitmap(23, 24, True, True) | LoadShape.create_bitmap(0, 3, True, True),
+                            'EFA Day Block1')]
+EFA_DAY_BLOCKS += [LoadShape(LoadShape.create_bitmap(4*i - 1, 4*i + 3, True, True),
+                             'EFA Day Block{:d}'.format(i+1)) for i in range(1, 6)]
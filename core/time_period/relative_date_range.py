@@ -1,7 +1,14 @@
 # TODO: improve docstrings
 
 import datetime as dt
+import numpy as np
+
+from core.base.cache import LRUCache
 from core.time_period.date_range import DateRange
+from core.time_period.time_utilities import EPOCH_ORDINAL, month_indices, month_start_ordinals
+
+# fixed (start, end) ordinal tables of the vectorised range types, keyed on (range_type, offset), see _fix_table
+_fix_tables = LRUCache(maxsize=64, name="relative_date_range_fixes")
 
 
 class RelativeDateRange(object):
@@ -21,6 +28,33 @@ class RelativeDateRange(object):
     def fix(self, obs_date):
         return self.range_type.fix(obs_date, self.offset)
 
+    def fix_many(self, obs_dates):
+        """
+        Fixes the RelativeDateRange for each of an array of observation dates. For range types with a vectorised
+        fix_many, the fixes are read from a table of ordinals that's cached per (range_type, offset), and extended
+        whenever obs_dates fall outside of it, so rolling windows over the same dates are only ever computed once.
+        Other range types loop over fix, so only the distinct obs_dates are fixed, and nothing is cached.
+
+        :param obs_dates: iterable of dt.date objects, or a numpy array of ordinals or datetime64 values
+        :return: tuple of numpy int64 arrays, the start and (inclusive) end ordinals of each fixed DateRange
+        """
+        ordinals = _to_ordinals(obs_dates)
+        if not len(ordinals):
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        if _is_vectorised(self.range_type):
+            first, starts, ends = _fix_table(self.range_type, self.offset, ordinals.min(), ordinals.max())
+            starts = starts[ordinals - first]
+            ends = ends[ordinals - first]
+        else:
+            distinct_ordinals, inverse = np.unique(ordinals, return_inverse=True)
+            starts, ends = self.range_type.fix_many(distinct_ordinals, self.offset)
+            starts = starts[inverse.ravel()]
+            ends = ends[inverse.ravel()]
+        if not starts.all():
+            invalid = dt.date.fromordinal(int(ordinals[np.argmin(starts)]))
+            raise ValueError("cannot fix {} for obs_date {}".format(self, invalid))
+        return starts, ends
+
     def __str__(self):
         return self.range_type.str + "(offset={})".format(self.offset)
 
@@ -31,6 +65,27 @@ class RelativeRangeType(object):
     def fix(obs_date, offset):
         raise NotImplementedError
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        """
+        Fixes the range type for an array of observation date ordinals. This default implementation loops over fix,
+        subclasses override it with vectorised versions.
+
+        :param ordinals: numpy int64 array of observation date ordinals
+        :param offset: int
+        :return: tuple of numpy int64 arrays of start and (inclusive) end ordinals, zero where fix is invalid
+        """
+        starts = np.zeros(len(ordinals), np.int64)
+        ends = np.zeros(len(ordinals), np.int64)
+        for i, ordinal in enumerate(ordinals):
+            try:
+                date_range = cls.fix(dt.date.fromordinal(int(ordinal)), offset)
+            except (ValueError, OverflowError):
+                continue
+            starts[i] = date_range.start.toordinal()
+            ends[i] = date_range.end.toordinal()
+        return starts, ends
+
 
 class CalendarDayAheadType(RelativeRangeType):
 
@@ -45,6 +100,11 @@ class CalendarDayAheadType(RelativeRangeType):
         date = obs_date + dt.timedelta(offset)
         return DateRange(date, date)
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        ordinals = ordinals + offset
+        return ordinals, ordinals.copy()
+
 
 class DayAheadType(RelativeRangeType):
 
@@ -77,6 +137,27 @@ class DayAheadType(RelativeRangeType):
         obs_date += dt.timedelta(offset + 2 * direction * weekends)
         return DateRange(obs_date, obs_date)
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        direction = -1 if offset < 0 else 1
+        weekday = (ordinals - 1) % 7
+        in_weekend = weekday > 4
+        offsets = np.full(len(ordinals), offset, np.int64)
+        if offset > 0:
+            ordinals = np.where(in_weekend, ordinals + 7 - weekday, ordinals)
+            offsets -= in_weekend
+        elif offset < 0:
+            ordinals = np.where(in_weekend, ordinals + 4 - weekday, ordinals)
+            offsets += in_weekend
+        weekends = np.abs(offsets) // 5
+        weekday = (ordinals - 1) % 7 + direction * (np.abs(offsets) % 5)
+        weekends += (weekday < 0) | (weekday > 4)
+        ordinals = ordinals + offsets + 2 * direction * weekends
+        if offset == 0:
+            # an offset of zero is ambiguous for obs_dates falling in a weekend
+            ordinals = np.where(in_weekend, 0, ordinals)
+        return ordinals, ordinals.copy()
+
 
 class WeekendAheadType(RelativeRangeType):
 
@@ -122,6 +203,12 @@ class WeekAheadType(RelativeRangeType):
         if offset != 0:
             return DateRange(start=obs_date, range_type='W').offset(offset)
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        # weeks start on a Monday, and ordinal 1 is a Monday
+        starts = ordinals - (ordinals - 1) % 7 + 7 * offset
+        return starts, starts + 6
+
 
 class MonthAheadType(RelativeRangeType):
 
@@ -138,6 +225,10 @@ class MonthAheadType(RelativeRangeType):
         if offset != 0:
             return DateRange(start=obs_date, range_type='M').offset(offset)
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        return _fix_months(ordinals, offset, 0, 1)
+
 
 class QuarterAheadType(RelativeRangeType):
 
@@ -154,6 +245,10 @@ class QuarterAheadType(RelativeRangeType):
         if offset != 0:
             return DateRange(start=obs_date, range_type='Q').offset(offset)
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        return _fix_months(ordinals, offset, 0, 3)
+
 
 class SeasonAheadType(RelativeRangeType):
 
@@ -176,6 +271,11 @@ class SeasonAheadType(RelativeRangeType):
         if offset != 0:
             return output.offset(offset)
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        # summer starts in April, winter in October
+        return _fix_months(ordinals, offset, 3, 6)
+
 
 class SummerAheadType(RelativeRangeType):
 
@@ -254,6 +354,10 @@ class YearAheadType(RelativeRangeType):
         if offset != 0:
             return DateRange(start=obs_date, range_type='Y').offset(offset)
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        return _fix_months(ordinals, offset, 0, 12)
+
 
 class GasYearAheadType(RelativeRangeType):
 
@@ -271,6 +375,10 @@ class GasYearAheadType(RelativeRangeType):
         if offset != 0:
             return DateRange(start=obs_date, range_type='GY').offset(offset)
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        return _fix_months(ordinals, offset, 9, 12)
+
 
 class BalanceOfMonthType(RelativeRangeType):
 
@@ -291,6 +399,11 @@ class BalanceOfMonthType(RelativeRangeType):
         month_end = dt.date(year, month, 1) - dt.timedelta(1)
         return DateRange(obs_date, month_end)
 
+    @classmethod
+    def fix_many(cls, ordinals, offset):
+        _, ends = _fix_months(ordinals, 0, 0, 1)
+        return ordinals.copy(), ends
+
 
 class DecemberAhead(RelativeRangeType):
 
@@ -314,3 +427,52 @@ class DecemberAhead(RelativeRangeType):
             else:
                 output = dt.date(obs_date.year + offset, 12, 1)
             return DateRange(start=output, range_type='m')
+
+
+def _to_ordinals(obs_dates):
+    """Converts an iterable of dt.date objects, or an array of ordinals or datetime64 values, into int64 ordinals"""
+    if isinstance(obs_dates, np.ndarray):
+        if np.issubdtype(obs_dates.dtype, np.datetime64):
+            return obs_dates.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+        if np.issubdtype(obs_dates.dtype, np.integer):
+            return obs_dates.astype(np.int64)
+    return np.array([obs_date.toordinal() for obs_date in obs_dates], np.int64)
+
+
+def _fix_table(range_type, offset, first, last):
+    """
+    Returns the cached table of fixes for a (range_type, offset) pair, extending it to cover the ordinals from first
+    to last if required.
+
+    :return: tuple of the first ordinal in the table, and arrays of start and end ordinals for consecutive obs_dates
+    """
+    key = (range_type, offset)
+    table = _fix_tables.get(key)
+    if table is not None:
+        table_first, starts, ends = table
+        if table_first <= first and last < table_first + len(starts):
+            return table_first, starts, ends
+        first = min(first, table_first)
+        last = max(last, table_first + len(starts) - 1)
+    starts, ends = range_type.fix_many(np.arange(first, last + 1, dtype=np.int64), offset)
+    _fix_tables[key] = (first, starts, ends)
+    return first, starts, ends
+
+
+def _is_vectorised(range_type):
+    """True if the range type overrides the default fix_many, which loops over fix"""
+    return range_type.fix_many.__func__ is not RelativeRangeType.fix_many.__func__
+
+
+def _fix_months(ordinals, offset, first_month, months):
+    """
+    Vectorised fix for range types made of blocks of whole months, e.g. quarters or gas years.
+
+    :param ordinals: numpy int64 array of observation date ordinals
+    :param offset: int, the number of blocks ahead
+    :param first_month: int, the first month of a block, counting from zero for January
+    :param months: int, the number of months in a block
+    :return: tuple of numpy int64 arrays of start and (inclusive) end ordinals
+    """
+    block_start = first_month + months * ((month_indices(ordinals) - first_month) // months + offset)
+    return month_start_ordinals(block_start), month_start_ordinals(block_start + months) - 1
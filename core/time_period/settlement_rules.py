@@ -1,7 +1,13 @@
 from abc import abstractproperty, abstractmethod
+from core.base.cache import LRUCache
 from core.time_period.date_range import DateRange
+from core.time_period.time_utilities import month_indices, month_start_ordinals
 
 import datetime as dt
+import numpy as np
+
+# settlement ordinals of every day in a month, keyed on (settlement rule class, ordinal of the first day of the month)
+_settlement_cache = LRUCache(maxsize=10000, name="settlement_schedule")
 
 
 class AbstractSettlementRule(object):
@@ -9,25 +15,67 @@ class AbstractSettlementRule(object):
     def __init__(self, time_period):
         self.time_period = time_period
 
-    @abstractmethod
     def discounted_duration(self, discount_curve):
         """Computes the discounted duration of a time period"""
+        return self.time_period.discounted_duration(self.__class__, discount_curve)
 
     @abstractproperty
     def settlement_dates(self):
         """Returns a dict of settlement dates keyed by parts of the time_period"""
 
+    @classmethod
+    @abstractmethod
+    def settlement_ordinals(cls, starts, ends):
+        """
+        Vectorised settlement dates for arrays of delivery periods. Each delivery period must be settled on a single
+        date, e.g. a single day, or part of a single month for monthly settlement.
+
+        :param starts: numpy int64 array of the start ordinal of each delivery period
+        :param ends: numpy int64 array of the (inclusive) end ordinal of each delivery period
+        :return: numpy int64 array of settlement ordinals
+        """
+
+    @classmethod
+    def settlement_schedule(cls, start, end):
+        """
+        Returns the settlement ordinal of each day from start to end. The settlement ordinals of whole months are
+        cached, keyed on (settlement rule class, month), since the same months are settled over and over again while
+        building and pricing curves.
+
+        :param start: int, the ordinal of the first day
+        :param end: int, the (inclusive) ordinal of the last day
+        :return: numpy int64 array of settlement ordinals, one per day
+        """
+        if end < start:
+            return np.zeros(0, np.int64)
+        first_month, last_month = month_indices(np.array([start, end], np.int64))
+        month_starts = month_start_ordinals(np.arange(first_month, last_month + 2))
+        keys = [(cls, int(month_start)) for month_start in month_starts[:-1]]
+        cached = [_settlement_cache.get(key) for key in keys]
+        if all(months is not None for months in cached):
+            schedule = np.concatenate(cached)
+        else:
+            ordinals = np.arange(month_starts[0], month_starts[-1], dtype=np.int64)
+            schedule = cls.settlement_ordinals(ordinals, ordinals)
+            schedule.flags.writeable = False
+            bounds = month_starts - month_starts[0]
+            for key, lower, upper in zip(keys, bounds[:-1], bounds[1:]):
+                _settlement_cache[key] = schedule[lower:upper]
+        return schedule[start - month_starts[0]:end - month_starts[0] + 1]
+
 
 class DayOfDeliverySettlementRule(AbstractSettlementRule):
 
-    def discounted_duration(self, discount_curve):
-        discounted_duration = sum(discount_curve.price(date) * date.duration for date in self.time_period)
-        return discounted_duration
-
     @property
     def settlement_dates(self):
         return {date: date.start for date in self.time_period}
 
+    @classmethod
+    def settlement_ordinals(cls, starts, ends):
+        if np.any(starts != ends):
+            raise ValueError("each delivery period must be a single day for day of delivery settlement")
+        return np.asarray(starts, np.int64)
+
 
 class PeriodicSettlementRule(AbstractSettlementRule):
     """
@@ -46,10 +94,18 @@ class PeriodicSettlementRule(AbstractSettlementRule):
     def _settlement_date(self, period):
         """Defines how to get from the individual monthly delivery period to settlement date"""
 
-    def discounted_duration(self, discount_curve):
-        duration = sum(period.duration * discount_curve.price(settlement_date)
-                       for period, settlement_date in self.settlement_dates.items())
-        return duration
+    @classmethod
+    def settlement_ordinals(cls, starts, ends):
+        """
+        Default implementation, which finds the settlement date of each distinct delivery period using
+        _settlement_date. Subclasses override this with vectorised versions.
+        """
+        rule = cls(None)
+        periods, inverse = np.unique(np.stack([starts, ends], axis=1), axis=0, return_inverse=True)
+        settlement_ordinals = np.array([rule._settlement_date(DateRange(dt.date.fromordinal(int(start)),
+                                                                        dt.date.fromordinal(int(end)))).toordinal()
+                                        for start, end in periods], np.int64)
+        return settlement_ordinals[inverse.ravel()]
 
 
 class GasSettlementRule(PeriodicSettlementRule):
@@ -64,6 +120,11 @@ class GasSettlementRule(PeriodicSettlementRule):
         month_end = month.expand("month").end
         return month_end + dt.timedelta(20)
 
+    @classmethod
+    def settlement_ordinals(cls, starts, ends):
+        month_ends = month_start_ordinals(month_indices(np.asarray(ends)) + 1) - 1
+        return month_ends + 20
+
 
 class UKPowerSettlementRule(PeriodicSettlementRule):
 
@@ -80,6 +141,13 @@ class UKPowerSettlementRule(PeriodicSettlementRule):
         if day == 7:
             return month_end + dt.timedelta(12)
 
+    @classmethod
+    def settlement_ordinals(cls, starts, ends):
+        month_ends = month_start_ordinals(month_indices(np.asarray(ends)) + 1) - 1
+        # ordinal 1 is a Monday, so months ending on a Saturday (Sunday) settle a day (two days) early
+        weekday = (month_ends - 1) % 7
+        return month_ends + 14 - np.maximum(weekday - 4, 0)
+
 
 class EUASettlementRule(PeriodicSettlementRule):
     """
@@ -92,3 +160,8 @@ class EUASettlementRule(PeriodicSettlementRule):
     def _settlement_date(self, year):
         year_end = year.expand("year").end
         return year_end + dt.timedelta(1)
+
+    @classmethod
+    def settlement_ordinals(cls, starts, ends):
+        months = month_indices(np.asarray(ends))
+        return month_start_ordinals(months - months % 12 + 12)
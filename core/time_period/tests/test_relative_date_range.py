@@ -1,8 +1,10 @@
 import datetime as dt
 import unittest
 
+import numpy as np
+
 from core.time_period.date_range import DateRange
-from core.time_period.relative_date_range import RelativeDateRange
+from core.time_period.relative_date_range import RelativeDateRange, _fix_tables
 
 
 class TestRelativeDateRange(unittest.TestCase):
@@ -249,3 +251,38 @@ class TestRelativeDateRange(unittest.TestCase):
                          RelativeDateRange('deca', -1).fix(self.date))
         self.assertEqual(DateRange(start=new_date, range_type='m').offset(-12),
                          RelativeDateRange('deca', -1).fix(new_date))
+
+    def test_fix_many(self):
+        obs_dates = [self.date + dt.timedelta(i) for i in range(-400, 400, 3)]
+        for range_type in ['cda', 'da', 'wenda', 'wa', 'ma', 'qa', 'sa', 'suma', 'wina', 'ya', 'gya', 'balmo', 'deca']:
+            for offset in [-3, -1, 1, 2, 7]:
+                relative_date_range = RelativeDateRange(range_type, offset)
+                starts, ends = relative_date_range.fix_many(obs_dates)
+                for obs_date, start, end in zip(obs_dates, starts, ends):
+                    expected = relative_date_range.fix(obs_date)
+                    self.assertEqual(expected.start.toordinal(), start)
+                    self.assertEqual(expected.end.toordinal(), end)
+
+        # test ordinal and datetime64 inputs, which extend the cached table
+        relative_date_range = RelativeDateRange('qa', 1)
+        starts, ends = relative_date_range.fix_many(np.array([dt.date(2030, 2, 1).toordinal()]))
+        self.assertEqual([DateRange('2030-Q2').start.toordinal()], list(starts))
+        self.assertEqual([DateRange('2030-Q2').end.toordinal()], list(ends))
+        starts, ends = relative_date_range.fix_many(np.array(['1999-12-31', '2000-01-01'], dtype='datetime64[D]'))
+        self.assertEqual([DateRange('2000-Q1').start.toordinal(), DateRange('2000-Q2').start.toordinal()],
+                         list(starts))
+
+        # range types that loop over fix only fix the distinct obs_dates, and aren't held in a table, even for dates
+        # decades apart
+        relative_date_range = RelativeDateRange('wenda', 1)
+        obs_dates = [dt.date(1950, 1, 2), dt.date(2050, 1, 3), dt.date(1950, 1, 2)]
+        starts, ends = relative_date_range.fix_many(obs_dates)
+        self.assertEqual([relative_date_range.fix(obs_date).start.toordinal() for obs_date in obs_dates], list(starts))
+        self.assertNotIn((relative_date_range.range_type, 1), _fix_tables)
+        self.assertEqual("relative_date_range_fixes", _fix_tables.name)
+
+        # test invalid fixes
+        with self.assertRaises(ValueError):
+            RelativeDateRange('da', 0).fix_many([self.date, self.weekend])
+        starts, ends = RelativeDateRange('da', 0).fix_many([self.date])
+        self.assertEqual([self.date.toordinal()], list(starts))
@@ -1,8 +1,10 @@
 import datetime as dt
 import unittest
 
+import numpy as np
+
 from core.base.quantity import DAY
-from core.forward_curves.tests.mock_curves import mock_discount_curve
+from core.forward_curves.tests.mock_curves import mock_discount_curve, MockDiscountCurve, dates_to_df
 from core.time_period.date_range import DateRange, LoadShapedDateRange
 from core.time_period.settlement_rules import GasSettlementRule, UKPowerSettlementRule, DayOfDeliverySettlementRule, \
                                               EUASettlementRule
@@ -104,4 +106,42 @@ class EUASettlementRuleTest(unittest.TestCase):
         self.assertEqual(expected, period.discounted_duration(EUASettlementRule, mock_discount_curve))
         dict = {DateRange('2012-Q4'): dt.date(2013, 1, 1),
                 DateRange('2013-Q1'): dt.date(2014, 1, 1)}
-        self.assertEqual(dict, period.settlement_dates(EUASettlementRule))
\ No newline at end of file
+        self.assertEqual(dict, period.settlement_dates(EUASettlementRule))
+
+
+class SettlementOrdinalsTest(unittest.TestCase):
+
+    def test_matches_settlement_dates(self):
+        period = DateRange(dt.date(2012, 1, 1), dt.date(2016, 12, 31))
+        ordinals = period.ordinals
+        for rule in [GasSettlementRule, UKPowerSettlementRule, EUASettlementRule, DayOfDeliverySettlementRule]:
+            settlement_ordinals = rule.settlement_ordinals(ordinals, ordinals)
+            expected = {}
+            for part, settlement_date in period.settlement_dates(rule).items():
+                for day in part:
+                    expected[day.start.toordinal()] = settlement_date.toordinal()
+            self.assertEqual([expected[ordinal] for ordinal in ordinals], list(settlement_ordinals))
+
+    def test_day_of_delivery_requires_days(self):
+        with self.assertRaises(ValueError):
+            DayOfDeliverySettlementRule.settlement_ordinals(np.array([1, 2]), np.array([1, 3]))
+
+    def test_settlement_schedule(self):
+        start, end = dt.date(2012, 12, 25).toordinal(), dt.date(2013, 3, 3).toordinal()
+        ordinals = np.arange(start, end + 1)
+        for rule in [GasSettlementRule, UKPowerSettlementRule, EUASettlementRule, DayOfDeliverySettlementRule]:
+            expected = list(rule.settlement_ordinals(ordinals, ordinals))
+            # the second call is read from the cache
+            self.assertEqual(expected, list(rule.settlement_schedule(start, end)))
+            self.assertEqual(expected, list(rule.settlement_schedule(start, end)))
+        self.assertEqual(0, len(GasSettlementRule.settlement_schedule(end, start)))
+
+    def test_discounted_duration_cache_invalidation(self):
+        discount_curve = MockDiscountCurve(dict(dates_to_df))
+        dec_12 = DateRange('2012-M12')
+        self.assertEqual(dec_12.duration * 0.97, dec_12.discounted_duration(GasSettlementRule, discount_curve))
+        # curves don't change, so a curve with different data has a different fingerprint
+        changed_dates_to_df = dict(dates_to_df)
+        changed_dates_to_df[dt.date(2013, 1, 20)] = 0.5
+        changed_curve = MockDiscountCurve(changed_dates_to_df)
+        self.assertEqual(dec_12.duration * 0.5, dec_12.discounted_duration(GasSettlementRule, changed_curve))
@@ -1,7 +1,7 @@
 import datetime as dt
 import unittest
 
-from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.date_range import DateRange, LoadShapedDateRange, ALWAYS_DR
 from core.time_period.load_shape import LoadShape, BASE, PEAK, OFFPEAK, \
     DAYTIME, NIGHTTIME, WEEKDAY, WEEKEND, WEEKEND_OFFPEAK, WEEKDAY_OFFPEAK, WEEKEND_PEAK
 from core.time_period.time_period_sets import TimePeriodSet, _LoadShapeType, _DateRangeType, _LoadShapedDateRangeType
@@ -133,8 +133,10 @@ class TestTimePeriodSet(unittest.TestCase):
         self.assertEqual(expected, left.union(['offpeak']))
         expected = TimePeriodSet([BASE, PEAK, WEEKDAY_OFFPEAK, WEEKEND_OFFPEAK])
         self.assertEqual(expected, left.union(TimePeriodSet([WEEKDAY_OFFPEAK, WEEKEND_OFFPEAK])))
-        with self.assertRaises(TypeError):
-            left.union(TimePeriodSet([DateRange('2012'), DateRange('2013')]))
+        # mixed types are promoted to LoadShapedDateRanges
+        expected = TimePeriodSet([LoadShapedDateRange(ALWAYS_DR, BASE), LoadShapedDateRange(ALWAYS_DR, PEAK),
+                                  LoadShapedDateRange('2012', BASE), LoadShapedDateRange('2013', BASE)])
+        self.assertEqual(expected, left.union(TimePeriodSet([DateRange('2012'), DateRange('2013')])))
         expected = TimePeriodSet({DateRange('2016'),
                                  DateRange('2016-SUM'),
                                  DateRange('2016-M1'),
@@ -159,6 +161,10 @@ class TestTimePeriodSet(unittest.TestCase):
         self.assertTrue(self.drs.intersects(TimePeriodSet({'2017-WIN', '2020'}, DateRange)))
         self.assertFalse(self.drs.intersects(TimePeriodSet({'2017-SUM', '2020'}, DateRange)))
         self.assertTrue(self.drs.intersects(TimePeriodSet({'2017-WIN', '2020'}, LoadShapedDateRange, PEAK)))
+        self.assertTrue(TimePeriodSet([PEAK]).intersects(DateRange('2016')))
+        self.assertFalse(TimePeriodSet([PEAK]).intersects(LoadShapedDateRange('2016-M1', OFFPEAK)))
+        weekend = TimePeriodSet([DateRange('2016-1-2'), DateRange('2016-1-3')])
+        self.assertFalse(TimePeriodSet([WEEKDAY]).intersects(weekend))
 
     def test_intersection(self):
         expected = TimePeriodSet({'2018-Q1'}, DateRange)
@@ -183,6 +189,54 @@ class TestTimePeriodSet(unittest.TestCase):
         self.assertEqual(expected, self.drs.intersection(DateRange('2017-SUM')))
         self.assertEqual(expected, self.drs.intersection(TimePeriodSet({'2017-SUM', '2020'}, DateRange)))
 
+    def test_normalise(self):
+        expected = TimePeriodSet({DateRange('2016'), DateRange('2018')})
+        self.assertEqual(expected, self.drs.normalise())
+        expected = TimePeriodSet({DateRange(dt.date(2016, 1, 1), dt.date(2017, 3, 31))})
+        self.assertEqual(expected, TimePeriodSet({'2016', '2017-Q1'}, DateRange).normalise())
+        self.assertEqual(TimePeriodSet({BASE}), TimePeriodSet({PEAK, OFFPEAK}).normalise())
+        expected = TimePeriodSet({LoadShapedDateRange('2016-M1', BASE)})
+        test_set = TimePeriodSet({LoadShapedDateRange('2016-M1', PEAK), LoadShapedDateRange('2016-M1', OFFPEAK)})
+        self.assertEqual(expected, test_set.normalise())
+        self.assertEqual(TimePeriodSet([]), TimePeriodSet([]).normalise())
+
+    def test_difference(self):
+        expected = TimePeriodSet({DateRange('2016-Q1'), DateRange(dt.date(2016, 7, 1), dt.date(2016, 12, 31)),
+                                  DateRange('2018')})
+        self.assertEqual(expected, self.drs.difference(DateRange('2016-Q2')))
+        self.assertEqual(expected, self.drs.difference(TimePeriodSet({'2016-Q2', '2020'}, DateRange)))
+        self.assertEqual(TimePeriodSet([]), self.drs.difference(self.drs))
+        self.assertEqual(self.drs.normalise(), self.drs.difference(TimePeriodSet([])))
+        self.assertEqual(TimePeriodSet({OFFPEAK}), TimePeriodSet({BASE}).difference(PEAK))
+
+        # mixed types are promoted to LoadShapedDateRanges
+        expected = TimePeriodSet({LoadShapedDateRange('2016', OFFPEAK), LoadShapedDateRange('2018', OFFPEAK)})
+        self.assertEqual(expected, self.drs.difference(PEAK))
+
+        # weekend hours are dropped from periods without any weekend days, and vice versa
+        weekend = DateRange(dt.date(2016, 1, 2), dt.date(2016, 1, 3))
+        self.assertEqual(TimePeriodSet([]), TimePeriodSet({weekend}).difference(WEEKEND))
+        expected = TimePeriodSet({LoadShapedDateRange(weekend, WEEKEND_OFFPEAK)})
+        self.assertEqual(expected, TimePeriodSet({weekend}).difference(WEEKEND_PEAK))
+
+    def test_symmetric_difference(self):
+        expected = TimePeriodSet({DateRange('2016-SUM'), DateRange(dt.date(2017, 1, 1), dt.date(2018, 12, 31))})
+        test_set = TimePeriodSet({'2016-WIN', '2016-Q1', '2017'}, DateRange)
+        self.assertEqual(expected, self.drs.symmetric_difference(test_set))
+        self.assertEqual(expected, test_set.symmetric_difference(self.drs))
+        self.assertEqual(TimePeriodSet([]), self.drs.symmetric_difference(self.drs))
+        self.assertEqual(TimePeriodSet({BASE}), TimePeriodSet({PEAK}).symmetric_difference(OFFPEAK))
+
+    def test_promote(self):
+        self.assertEqual(LoadShapedDateRange('2016', BASE), TimePeriodSet.promote(DateRange('2016')))
+        self.assertEqual(LoadShapedDateRange(DateRange(dt.date.min, dt.date.max - dt.timedelta(365)), PEAK),
+                         TimePeriodSet.promote(PEAK))
+        expected = TimePeriodSet({LoadShapedDateRange('2016', BASE), LoadShapedDateRange('2018', BASE)})
+        self.assertEqual(expected, TimePeriodSet.promote(TimePeriodSet({'2016', '2018'}, DateRange)))
+        self.assertEqual(_LoadShapedDateRangeType, TimePeriodSet.promote(self.drs).time_period_type)
+        with self.assertRaises(TypeError):
+            TimePeriodSet.promote('2016')
+
     def test_LoadShape_partition(self):
         self.assertEqual(TimePeriodSet({PEAK}).partition, {PEAK})
         base_peak = {BASE, PEAK}
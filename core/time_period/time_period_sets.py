@@ -1,12 +1,11 @@
-# TODO: create promoting operations for union and intersects and intersection. These would be static methods that
-# TODO: promote TimePeriodSets with LoadShapeType, or DateRangeType (or individual LoadShape or DateRange objects)
-# TODO: into a TimePeriodSet with LoadShapedDateRangeType (or individual LoadShapedDateRange) and then call the existing
-# TODO: union, intersect and intersection operations.
-
-from core.time_period.date_range import DateRange, LoadShapedDateRange
-from core.time_period.load_shape import LoadShape, BASE
+from core.time_period.date_range import DateRange, LoadShapedDateRange, ALWAYS_DR
+from core.time_period.load_shape import LoadShape, BASE, WEEKDAY, WEEKEND
 
 import datetime as dt
+import numpy as np
+
+# the value of each of the 48 bits in a LoadShape bitmap, used to unpack bitmaps into boolean arrays
+_BITS = np.int64(1) << np.arange(48, dtype=np.int64)
 
 
 class TimePeriodSet(frozenset):
@@ -82,42 +81,65 @@ class TimePeriodSet(frozenset):
         return not self == other
 
     def union(self, other):
+        """
+        Returns the union of self and other, an iterable of time periods of the same type as self or a TimePeriodSet.
+        If other is a TimePeriodSet of a different time period type, both are promoted to sets of LoadShapedDateRange
+        objects first.
+
+        :param other: iterable of time periods, or TimePeriodSet object
+        :return: TimePeriodSet
+        """
         time_period_type = self.time_period_type
         default_load_shape = self.default_load_shape
         if isinstance(other, TimePeriodSet):
-            if time_period_type != other.time_period_type:
-                raise TypeError("cannot join TimePeriodSet objects if they have different time_period_type")
+            if time_period_type and other.time_period_type and time_period_type != other.time_period_type:
+                return TimePeriodSet.promote(self).union(TimePeriodSet.promote(other))
             if self.default_load_shape != other.default_load_shape:
                 default_load_shape = None
         return TimePeriodSet(super(TimePeriodSet, self).union(other), time_period_type, default_load_shape)
 
     def intersects(self, other):
-        if isinstance(other, (LoadShapedDateRange, DateRange, LoadShape)):
-            return any(item.intersects(other) for item in self)
-        elif type(other) == TimePeriodSet:
-            return any(item.intersects(other_item) for item in self for other_item in other)
+        """
+        :param other: LoadShape, DateRange, LoadShapedDateRange or TimePeriodSet object, which is promoted along with
+                      self to LoadShapedDateRange objects if the time period types differ
+        :return: Boolean
+        """
+        if isinstance(other, (LoadShapedDateRange, DateRange, LoadShape, TimePeriodSet)):
+            lhs, rhs, _ = self._promoted(other)
+            return any(item.intersects(other_item) for item in lhs for other_item in rhs)
 
     def intersection(self, other):
-        # promotion_dict is used to find the correct time_period_type for the intersection
-        promotion_dict = {frozenset({LoadShape, LoadShape}): _LoadShapeType,
-                          frozenset({LoadShape, DateRange}): _LoadShapedDateRangeType,
-                          frozenset({LoadShape, LoadShapedDateRange}): _LoadShapedDateRangeType,
-                          frozenset({DateRange, DateRange}): _DateRangeType,
-                          frozenset({DateRange, LoadShapedDateRange}): _LoadShapedDateRangeType,
-                          frozenset({LoadShapedDateRange, LoadShapedDateRange}): _LoadShapedDateRangeType}
-        if isinstance(other, (DateRange, LoadShape, LoadShapedDateRange)):
-            collection = [item.intersection(other) for item in self if item.intersects(other)]
-            time_period_type = promotion_dict[frozenset({self.time_period_type.time_period_class, type(other)})]
-            return TimePeriodSet(collection, time_period_type, self.default_load_shape)
-        elif isinstance(other, TimePeriodSet):
-            collection = [item.intersection(other_item) for item in self for other_item in other
-                          if item.intersects(other_item)]
-            lhs_time_period_class = self.time_period_type.time_period_class
-            rhs_time_period_class = other.time_period_type.time_period_class
-            time_period_type = promotion_dict[frozenset({lhs_time_period_class, rhs_time_period_class})]
-            return TimePeriodSet(collection, time_period_type, self.default_load_shape)
+        """
+        Returns the set of intersections of each item of self with each item of other (or other itself, if it's a time
+        period). If the time period types differ, both are promoted to LoadShapedDateRange objects first.
+
+        :param other: LoadShape, DateRange, LoadShapedDateRange or TimePeriodSet object
+        :return: TimePeriodSet
+        """
+        if not isinstance(other, (DateRange, LoadShape, LoadShapedDateRange, TimePeriodSet)):
+            raise TypeError("intersection only implemented for time periods and TimePeriodSets: {} provided"
+                            .format(type(other)))
+        lhs, rhs, time_period_type = self._promoted(other)
+        collection = [item.intersection(other_item) for item in lhs for other_item in rhs
+                      if item.intersects(other_item)]
+        return TimePeriodSet(collection, time_period_type, self.default_load_shape)
+
+    def _promoted(self, other):
+        """
+        :param other: LoadShape, DateRange, LoadShapedDateRange or TimePeriodSet object
+        :return: tuple of the items of self, the items of other (a TimePeriodSet, or a list of other) and their
+                 time_period_type. If the time period types differ, both sides are promoted to LoadShapedDateRange
+                 objects.
+        """
+        if isinstance(other, TimePeriodSet):
+            other_type = other.time_period_type
         else:
-            raise TypeError("intersection only implemented for homogeneous time period types")
+            other_type = _time_period_type(other)
+            other = [other]
+        if self.time_period_type and other_type and self.time_period_type != other_type:
+            return TimePeriodSet.promote(self), [TimePeriodSet.promote(item) for item in other], \
+                _LoadShapedDateRangeType
+        return self, other, self.time_period_type or other_type
 
     @property
     def partition(self):
@@ -146,6 +168,56 @@ class TimePeriodSet(frozenset):
         """
         return all(time_period.within(other) for time_period in self)
 
+    def normalise(self):
+        """
+        Returns the minimal set of disjoint time periods which covers exactly the same hours as self. Overlapping and
+        adjacent time periods are merged. The time_period_type is preserved.
+
+        :return: TimePeriodSet
+        """
+        return _combine(self, TimePeriodSet([]), lambda lhs, rhs: lhs)
+
+    def difference(self, other):
+        """
+        Returns the normalised TimePeriodSet covering the hours in self which are not in other. If the time period
+        types differ, the result is promoted to a set of LoadShapedDateRange objects.
+
+        :param other: LoadShape, DateRange, LoadShapedDateRange or TimePeriodSet object
+        :return: TimePeriodSet
+        """
+        return _combine(self, other, lambda lhs, rhs: lhs & ~rhs)
+
+    def symmetric_difference(self, other):
+        """
+        Returns the normalised TimePeriodSet covering the hours in exactly one of self and other. If the time period
+        types differ, the result is promoted to a set of LoadShapedDateRange objects.
+
+        :param other: LoadShape, DateRange, LoadShapedDateRange or TimePeriodSet object
+        :return: TimePeriodSet
+        """
+        return _combine(self, other, lambda lhs, rhs: lhs ^ rhs)
+
+    @staticmethod
+    def promote(time_period):
+        """
+        Promotes a LoadShape or DateRange (or a TimePeriodSet of either) into the equivalent LoadShapedDateRange
+        (or TimePeriodSet of LoadShapedDateRange objects). A LoadShape is promoted over ALWAYS_DR, a DateRange is
+        promoted with the BASE load shape.
+
+        :param time_period: LoadShape, DateRange, LoadShapedDateRange or TimePeriodSet object
+        :return: LoadShapedDateRange or TimePeriodSet object
+        """
+        if isinstance(time_period, TimePeriodSet):
+            return TimePeriodSet([TimePeriodSet.promote(item) for item in time_period])
+        if isinstance(time_period, LoadShapedDateRange):
+            return time_period
+        if isinstance(time_period, DateRange):
+            return LoadShapedDateRange(time_period, BASE)
+        if isinstance(time_period, LoadShape):
+            return LoadShapedDateRange(ALWAYS_DR, time_period)
+        raise TypeError("cannot promote {} into a LoadShapedDateRange".format(time_period))
+
+
 class _TimePeriodType(object):
 
     aliases = set()
@@ -335,3 +407,119 @@ class _LoadShapedDateRangeType(_TimePeriodType):
                         equivalence_classes[intersecting_lsdrs] = \
                             equivalence_classes[intersecting_lsdrs].union(promoted_date_range_set)
         return set(lsdr_set for lsdr_set in equivalence_classes.values())
+
+
+def _time_period_type(time_period):
+    """the _TimePeriodType of a single LoadShape, DateRange or LoadShapedDateRange object"""
+    for candidate_type in _TimePeriodType.__subclasses__():
+        if type(time_period) == candidate_type.time_period_class:
+            return candidate_type
+    raise TypeError("{} isn't a known time period".format(time_period))
+
+
+def _combine(lhs, rhs, operation):
+    """
+    Helper function for the set algebra on TimePeriodSet. Both sides are converted into arrays of intervals (start
+    ordinal, exclusive end ordinal and LoadShape bitmap). The union of all of the start and end points splits time into
+    elementary segments, and a sweep over these segments gives the bitmap covered by each side. The bitwise operation
+    is then applied segment by segment, and neighbouring segments with the same bitmap are merged.
+
+    :param lhs: TimePeriodSet
+    :param rhs: LoadShape, DateRange, LoadShapedDateRange or TimePeriodSet object
+    :param operation: function combining two arrays of bitmaps, e.g. lambda lhs, rhs: lhs & ~rhs
+    :return: normalised TimePeriodSet
+    """
+    if not isinstance(rhs, TimePeriodSet):
+        rhs = TimePeriodSet([rhs])
+    if lhs.time_period_type == rhs.time_period_type or not rhs.time_period_type:
+        time_period_type = lhs.time_period_type
+    elif not lhs.time_period_type:
+        time_period_type = rhs.time_period_type
+    else:
+        time_period_type = _LoadShapedDateRangeType
+    if not time_period_type:
+        return TimePeriodSet([])
+
+    lhs_starts, lhs_ends, lhs_bitmaps = _intervals(lhs)
+    rhs_starts, rhs_ends, rhs_bitmaps = _intervals(rhs)
+    boundaries = np.unique(np.concatenate([lhs_starts, lhs_ends, rhs_starts, rhs_ends]))
+    if len(boundaries) < 2:
+        return TimePeriodSet([])
+    bitmaps = operation(_cover(boundaries, lhs_starts, lhs_ends, lhs_bitmaps),
+                        _cover(boundaries, rhs_starts, rhs_ends, rhs_bitmaps))
+    starts, ends, bitmaps = _merge(boundaries[:-1], boundaries[1:], bitmaps)
+    if time_period_type == _LoadShapedDateRangeType:
+        # drop the weekday (weekend) hours from periods which don't contain a weekday (weekend)
+        bitmaps &= _day_type_mask(starts, ends)
+        starts, ends, bitmaps = _merge(starts, ends, bitmaps)
+    non_empty = bitmaps != 0
+    starts, ends, bitmaps = starts[non_empty], ends[non_empty], bitmaps[non_empty]
+
+    if time_period_type == _LoadShapeType:
+        collection = [LoadShape(int(bitmap)) for bitmap in bitmaps]
+    elif time_period_type == _DateRangeType:
+        collection = [DateRange(dt.date.fromordinal(int(start)), dt.date.fromordinal(int(end) - 1))
+                      for start, end in zip(starts, ends)]
+    else:
+        collection = [LoadShapedDateRange(DateRange(dt.date.fromordinal(int(start)), dt.date.fromordinal(int(end) - 1)),
+                                          LoadShape(int(bitmap)))
+                      for start, end, bitmap in zip(starts, ends, bitmaps)]
+    return TimePeriodSet(collection)
+
+
+def _merge(starts, ends, bitmaps):
+    """
+    Merges neighbouring intervals which share the same bitmap. The intervals must be sorted and contiguous.
+    """
+    first = np.flatnonzero(np.concatenate([[True], bitmaps[1:] != bitmaps[:-1]]))
+    last = np.concatenate([first[1:], [len(bitmaps)]]) - 1
+    return starts[first], ends[last], bitmaps[first]
+
+
+def _intervals(time_period_set):
+    """
+    Converts a TimePeriodSet into arrays of start ordinals, exclusive end ordinals and LoadShape bitmaps. LoadShape
+    objects span ALWAYS_DR, DateRange objects have the BASE bitmap. Empty time periods are dropped.
+    """
+    starts, ends, bitmaps = [], [], []
+    for time_period in time_period_set:
+        if isinstance(time_period, LoadShape):
+            date_range, bitmap = ALWAYS_DR, time_period.bitmap
+        elif isinstance(time_period, DateRange):
+            date_range, bitmap = time_period, BASE.bitmap
+        else:
+            date_range, bitmap = time_period.date_range, time_period.load_shape.bitmap
+        if date_range.start <= date_range.end and bitmap:
+            starts.append(date_range.start.toordinal())
+            ends.append(date_range.end.toordinal() + 1)
+            bitmaps.append(bitmap)
+    return np.array(starts, np.int64), np.array(ends, np.int64), np.array(bitmaps, np.int64)
+
+
+def _cover(boundaries, starts, ends, bitmaps):
+    """
+    Returns the union of the bitmaps covering each of the elementary segments between consecutive boundaries. Each bit
+    is counted separately: +1 where an interval starts and -1 where it ends, so a cumulative sum gives the number of
+    intervals covering each segment.
+    """
+    if not len(starts):
+        return np.zeros(len(boundaries) - 1, np.int64)
+    bits = ((bitmaps[:, np.newaxis] & _BITS) != 0).astype(np.int64)
+    counts = np.zeros((len(boundaries), 48), np.int64)
+    np.add.at(counts, np.searchsorted(boundaries, starts), bits)
+    np.subtract.at(counts, np.searchsorted(boundaries, ends), bits)
+    covered = np.cumsum(counts, axis=0)[:-1] > 0
+    return (covered * _BITS).sum(axis=1)
+
+
+def _day_type_mask(starts, ends):
+    """
+    Returns, for each segment [start, end), the WEEKDAY bitmap if the segment contains a weekday, united with the
+    WEEKEND bitmap if the segment contains a weekend day.
+    """
+    # ordinal 1 (0001-01-01) is a Monday
+    first_weekday = (starts - 1) % 7
+    last_weekday = first_weekday + (ends - starts) - 1
+    has_weekday = (first_weekday < 5) | (last_weekday >= 7)
+    has_weekend = last_weekday >= 5
+    return np.where(has_weekday, WEEKDAY.bitmap, 0) | np.where(has_weekend, WEEKEND.bitmap, 0)
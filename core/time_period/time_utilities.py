@@ -4,6 +4,13 @@
 # Global Constants
 from inputs.static_data.time_constants import DAYS_PER_YEAR
 
+import datetime as dt
+import numpy as np
+
+# ordinal of 1970-01-01, the epoch of numpy datetime64 objects
+EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+
+
 def time_between(start_date, end_date):
     """Calculates the time between two dates as a fraction of a year"""
     return (end_date - start_date).days / DAYS_PER_YEAR
@@ -63,3 +70,13 @@ def workdays(start_date,
         num_workdays -= sum(hols_in_whichdays)
 
     return num_workdays
+
+
+def month_indices(ordinals):
+    """Returns the month of each ordinal date in a numpy array, counted in months since January 1970"""
+    return (ordinals - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def month_start_ordinals(month_indices):
+    """Returns the ordinal of the first day of each month in a numpy array, counted in months since January 1970"""
+    return month_indices.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
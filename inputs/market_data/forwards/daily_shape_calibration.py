@@ -1,8 +1,15 @@
+import threading
 from abc import abstractmethod, ABCMeta
 
+from core.base.cache import LRUCache
 from core.forward_curves.shape_ratio import DailyShapeRatioCurve
 from core.time_period.date_range import DateRange, LoadShapedDateRange
-from inputs.market_data.forwards.quotes import AbstractContinuousQuotes
+from core.time_period.load_shape import BASE
+from inputs.market_data.forwards.quotes import AbstractContinuousQuotes, MissingPriceError
+from inputs.static_data.time_constants import SECONDS_PER_DAY
+
+# the relative prices of the leaves of each _ShapeRatioTree that has been evaluated, keyed by the tree
+_relative_price_cache = LRUCache(4096, name="shape_ratio_tree")
 
 
 class AbstractDailyShapeCalibration(object, metaclass=ABCMeta):
@@ -19,6 +26,8 @@ class AbstractDailyShapeCalibration(object, metaclass=ABCMeta):
         self.quarter_to_month = quarter_to_month
         self.period_to_quarter = {}  # this is over-written by the concrete sub-class
         self._cached_shape_ratio_forwards = {}
+        # guards the cache, so that a calibration can be shared between threads pricing concurrently
+        self._lock = threading.Lock()
 
     def shape_ratio_curve(self, time_period_set):
         """
@@ -31,10 +40,15 @@ class AbstractDailyShapeCalibration(object, metaclass=ABCMeta):
         # period is the Season, Calendar Year or other date range corresponding to the concrete DailyShapeCalibration
         # class. E.g. period is a Season for the SeasonBasedDailtShapeCalibration class.
         period = self._find_period(time_period_set)
-        if period not in self._cached_shape_ratio_forwards:
-            relative_price_dict = self._tree(period).relative_price_dict
-            self._cached_shape_ratio_forwards[period] = DailyShapeRatioCurve(relative_price_dict)
-        return self._cached_shape_ratio_forwards[period]
+        with self._lock:
+            shape_ratio_curve = self._cached_shape_ratio_forwards.get(period)
+        if shape_ratio_curve is None:
+            shape_ratio_curve = DailyShapeRatioCurve(self._tree(period).relative_price_dict)
+            # if another thread built the curve for the same period in the meantime, use that one, so that every
+            # caller shares the same curve
+            with self._lock:
+                shape_ratio_curve = self._cached_shape_ratio_forwards.setdefault(period, shape_ratio_curve)
+        return shape_ratio_curve
 
     @abstractmethod
     def _find_period(self, time_period_set):
@@ -44,6 +58,16 @@ class AbstractDailyShapeCalibration(object, metaclass=ABCMeta):
         time_period_set.
         """
 
+    def _period_to_quarter(self, period):
+        """
+        The period to quarter ratios for a period found by _find_period. Overridden by concrete sub-classes whose
+        ratios depend on the period (e.g. summer and winter seasons have different quarters).
+
+        :param period: LoadShapedDateRange object representing the period (from the concrete class)
+        :return: dict keyed by LoadShape object(s), containing the list of ratios of the quarters of the period
+        """
+        return self.period_to_quarter
+
     def _tree(self, period):
         """
         Creates a ShapeRatioTree object containing the calibration data for a given year and load_shape.
@@ -51,7 +75,8 @@ class AbstractDailyShapeCalibration(object, metaclass=ABCMeta):
         :param period: LoadShapedDateRange object representing the period (from the concrete class)
         :return: ShapeRatioTree object containing the calibration data for this season and load_shape
         """
-        ratios_and_subtrees = {(self.period_to_quarter[quarter.load_shape][index], self._quarter_tree(quarter))
+        period_to_quarter = self._period_to_quarter(period)
+        ratios_and_subtrees = {(period_to_quarter[quarter.load_shape][index], self._quarter_tree(quarter))
                                for index, quarter in enumerate(period.split_by_quarter)}
         return _ShapeRatioTree(period, frozenset(ratios_and_subtrees))
 
@@ -112,10 +137,8 @@ class SeasonBasedDailyShapeCalibration(AbstractDailyShapeCalibration):
         end = max(time_period.end for time_period in time_period_set)
         try:
             season = DateRange(start, range_type="sum")
-            self.period_to_quarter = {key: list[1:3] for key, list in self.season_to_quarter.items()}
         except ValueError:
             season = DateRange(start, range_type="win")
-            self.period_to_quarter = {key: [list[3], list[0]] for key, list in self.season_to_quarter.items()}
         if end not in season:
             raise ValueError("shape information doesn't cover the period being priced")
         for available_load_shape in self.load_shapes:
@@ -127,6 +150,12 @@ class SeasonBasedDailyShapeCalibration(AbstractDailyShapeCalibration):
                              .format(str(time_period_set), str(self.load_shapes)))
         return LoadShapedDateRange(season, load_shape)
 
+    def _period_to_quarter(self, period):
+        """the Q2 and Q3 ratios for a summer, or the Q4 and Q1 ratios for a winter"""
+        if period.start.month == 4:
+            return {key: ratios[1:3] for key, ratios in self.season_to_quarter.items()}
+        return {key: [ratios[3], ratios[0]] for key, ratios in self.season_to_quarter.items()}
+
 
 class CalendarBasedDailyShapeCalibration(AbstractDailyShapeCalibration):
 
@@ -181,6 +210,7 @@ class _ShapeRatioTree(object):
         """
         self.time_period = load_shaped_date_range
         self.ratios_and_subtrees = ratios_and_subtrees
+        self._hash = None
 
     @property
     def relative_price_dict(self):
@@ -190,9 +220,40 @@ class _ShapeRatioTree(object):
 
         :return: Quotes object which gives the relative prices of the time periods at the leaves of this ratio tree.
         """
+        return AbstractContinuousQuotes(dict(self._relative_prices()[0]))
 
+    def _relative_prices(self):
+        """
+        Evaluates the tree bottom up. Each sub-tree is evaluated once and memoised (keyed by the tree, so equal
+        sub-trees of different trees share the result). Where the sub-trees of a node partition its time period, the
+        ratios are multiplicative: the relative price of a leaf is its relative price within its sub-tree, times the
+        ratio of the sub-tree, over the duration weighted average of the ratios of the node. Otherwise the node is
+        evaluated through a pseudo forward curve of its ratios.
+
+        :return: tuple of a dict of the relative prices of the leaves of this tree, and True if every node of the tree
+                 is partitioned by its sub-trees (so the leaves are within the time period of the tree)
+        """
+        result = _relative_price_cache.get(self)
+        if result is None:
+            result = self._evaluate()
+            _relative_price_cache[self] = result
+        return result
+
+    def _evaluate(self):
         if not self.ratios_and_subtrees:
-            return AbstractContinuousQuotes({self.time_period: 1})  # we are at a leaf node
+            return {self.time_period: 1}, True  # we are at a leaf node
+
+        sub_results = [(ratio, sub_tree, sub_tree._relative_prices()) for ratio, sub_tree in self.ratios_and_subtrees]
+        nested = all(sub_nested for _, _, (_, sub_nested) in sub_results) and self._is_partitioned()
+        if nested:
+            durations = [sub_tree.time_period.duration.value for _, sub_tree, _ in sub_results]
+            normalisation = sum(ratio * duration for (ratio, _, _), duration in zip(sub_results, durations))
+            normalisation /= sum(durations)
+            results = {}
+            for ratio, _, (sub_dict, _) in sub_results:
+                results.update({sub_time_period: sub_ratio * ratio / normalisation
+                                for sub_time_period, sub_ratio in sub_dict.items()})
+            return results, True
 
         # create a pseudo forward curve which can be used to scale the relative price dicts of the sub-trees.
         # this means we can avoid having to have pre-normalised raios in our ratios_and_subtrees set
@@ -202,13 +263,34 @@ class _ShapeRatioTree(object):
 
         # now iterate through each of the sub-trees, building up our results dict
         results = {}
-        for ratio, sub_tree in self.ratios_and_subtrees:
-            sub_dict = sub_tree.relative_price_dict.price_dict
+        for _, _, (sub_dict, _) in sub_results:
             # normalise using the immediate_period_relative_price
             normalised_sub_dict = {sub_time_period: sub_ratio * shape_ratio_curve.price(sub_time_period) / normalisation
                                    for sub_time_period, sub_ratio in sub_dict.items()}
             results.update(normalised_sub_dict)
-        return AbstractContinuousQuotes(results)
+        return results, False
+
+    def _is_partitioned(self):
+        """
+        True if the time periods of the sub-trees are within this tree's time period, don't overlap, and cover it.
+        Overlaps are checked by days and load shapes, so some disjoint sub-trees may be treated as overlapping.
+        """
+        periods = [(time_period.start, time_period.end, getattr(time_period, "load_shape", BASE).bitmap)
+                   for time_period in (sub_tree.time_period for _, sub_tree in self.ratios_and_subtrees)]
+        start, end = self.time_period.start, self.time_period.end
+        bitmap = getattr(self.time_period, "load_shape", BASE).bitmap
+        if any(sub_start < start or sub_end > end or sub_bitmap & ~bitmap
+               for sub_start, sub_end, sub_bitmap in periods):
+            return False
+        for index, (start1, end1, bitmap1) in enumerate(periods):
+            for start2, end2, bitmap2 in periods[index + 1:]:
+                if start1 <= end2 and start2 <= end1 and bitmap1 & bitmap2:
+                    return False
+        covered = sum(sub_tree.time_period.duration.value for _, sub_tree in self.ratios_and_subtrees)
+        if abs(covered - self.time_period.duration.value) > 1 / SECONDS_PER_DAY:
+            raise MissingPriceError("the sub-trees of {} don't cover it (out by {} days)"
+                                    .format(self.time_period, covered - self.time_period.duration.value))
+        return True
 
     def __eq__(self, other):
         return self.time_period == other.time_period and self.ratios_and_subtrees == other.ratios_and_subtrees
@@ -217,4 +299,7 @@ class _ShapeRatioTree(object):
         return not self == other
 
     def __hash__(self):
-        return hash((self.time_period, self.ratios_and_subtrees))
\ No newline at end of file
+        # the tree is immutable, so its (recursive) hash is calculated once
+        if self._hash is None:
+            self._hash = hash((self.time_period, self.ratios_and_subtrees))
+        return self._hash
\ No newline at end of file
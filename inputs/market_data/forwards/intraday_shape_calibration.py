@@ -1,30 +1,57 @@
-from abc import abstractmethod, ABCMeta
+from abc import ABCMeta
+
+import numpy as np
 
-from core.base.quantity import HOUR
 from core.forward_curves.shape_ratio import IntradayShapeRatioCurve
 from core.time_period.date_range import LoadShapedDateRange
-from core.time_period.load_shape import WEEKDAY_OFFPEAK, PEAK, WEEKEND_OFFPEAK, WEEKEND_PEAK, DAYTIME
+from core.time_period.load_shape import WEEKDAY_OFFPEAK, PEAK, WEEKEND_OFFPEAK, WEEKEND_PEAK, EFA_DAY_BLOCKS
+from core.time_period.time_utilities import month_indices
+
+# the bits of a LoadShape bitmap for the 24 hours of a weekday
+_DAY_BITMAP = (1 << 24) - 1
 
 
 class BaseIntradayShapeCalibration(object, metaclass=ABCMeta):
-    """base class for holding intraday shape ratio information"""
+    """
+    base class for holding intraday shape ratio information. The ratios are held as a (blocks x 12 months x slots)
+    array, where the blocks are the load_shapes of the concrete sub-class and the slots are the settlement periods of
+    each block, in order from the start of the trading day. The block and slot of every hour (and settlement period)
+    of a weekday and of a weekend day are looked up once, when the calibration is built, so extracting ratios (for one
+    hour or in bulk) is array indexing.
+    """
 
     load_shapes = []  # load shapes are supplied by the concrete sub-class.
+    day_start_hour = 0  # the hour at which the trading day, and so the first slot of a block, starts
+    periods_per_hour = 1  # the number of settlement periods in each hour
+
+    def __init__(self, calibration_data):
+        """
+        :param calibration_data: nested lists (or an array) of floats; blocks * 12 months * settlement periods per
+                                 block, where the ratios of each block and month average to 1
+        """
+        self._blocks, self._slots = _hour_lookup(self.load_shapes, self.day_start_hour)
+        shape = (len(self.load_shapes), 12, (int(self._slots.max()) + 1) * self.periods_per_hour)
+        try:
+            self.ratios = np.array(calibration_data, np.float64)
+        except ValueError:
+            raise ValueError("calibration data must be {} blocks * {} months * {} periods".format(*shape))
+        if self.ratios.shape != shape:
+            raise ValueError("calibration data must be {} blocks * {} months * {} periods: {} provided"
+                             .format(*(shape + (" * ".join(str(size) for size in self.ratios.shape),))))
+        averages = self.ratios.mean(axis=2)
+        invalid = np.argwhere(np.abs(averages - 1) >= 1e-6)
+        if len(invalid):
+            block, month = invalid[0]
+            raise ValueError("ratios don't average to 1: {} for block {} in month {}"
+                             .format(averages[block, month], self.load_shapes[block], month + 1))
+        # the ratio of each hour is the average of the ratios of its settlement periods
+        self._hourly_ratios = self.ratios.reshape(shape[:2] + (-1, self.periods_per_hour)).mean(axis=3)
 
     def decorate(self, shape_ratio_curve):
         """Takes a DailyShapeRatioCurve and returns an IntradayShapeRatioCurve that embeds the
         IntradayShapeCalibration data"""
         return IntradayShapeRatioCurve(shape_ratio_curve, self)
 
-    @classmethod
-    def _load_shape_index(cls, time_period):
-        """helper method common to both concrete subclasses, tells us which loadshape block we are in"""
-        i = 0
-        while not time_period.intersects(cls.load_shapes[i]):
-            i += 1
-        return i
-
-    @abstractmethod
     def extract_shape_ratio(self, hour_time_period):
         """
         extracts the shape ratio needed to shape the given hour_time_period using the information contained in this
@@ -34,6 +61,46 @@ class BaseIntradayShapeCalibration(object, metaclass=ABCMeta):
         :return: ratio of the price of the hour time period, over the denominator time period
                  and the denominator time period
         """
+        date = hour_time_period.start
+        weekend = int(date.weekday() > 4)
+        # the hours of the load shape that apply to this day
+        bits = hour_time_period.load_shape.bitmap >> (24 * weekend) & _DAY_BITMAP
+        assert bits and not bits & (bits - 1), "input time period must be a single hour"
+        hour = bits.bit_length() - 1
+        block = self._blocks[weekend, hour]
+        denominator_period = LoadShapedDateRange(date, self.load_shapes[block])
+        return denominator_period, float(self._hourly_ratios[block, date.month - 1, self._slots[weekend, hour]])
+
+    def extract_shape_ratios(self, ordinals):
+        """
+        Vector version of extract_shape_ratio, for every hour of each of an array of days.
+
+        :param ordinals: numpy int64 array of ordinal dates
+        :return: tuple of numpy (days x 24) arrays: the index in load_shapes of the block that each hour (00:00 to
+                 23:00) is in, and the ratio of the price of the hour to the price of the block on that day
+        """
+        ordinals = np.asarray(ordinals, np.int64)
+        weekend = ((ordinals - 1) % 7 > 4).astype(np.int64)
+        months = (month_indices(ordinals) % 12)[:, np.newaxis]
+        blocks = self._blocks[weekend]
+        return blocks, self._hourly_ratios[blocks, months, self._slots[weekend]]
+
+    def extract_period_shape_ratios(self, ordinals):
+        """
+        Version of extract_shape_ratios for every settlement period (e.g. half hour) of each of an array of days.
+
+        :param ordinals: numpy int64 array of ordinal dates
+        :return: tuple of numpy (days x settlement periods per day) arrays: the index in load_shapes of the block that
+                 each settlement period (from 00:00) is in, and the ratio of the price of the settlement period to the
+                 price of the block on that day
+        """
+        ordinals = np.asarray(ordinals, np.int64)
+        weekend = ((ordinals - 1) % 7 > 4).astype(np.int64)
+        months = (month_indices(ordinals) % 12)[:, np.newaxis]
+        blocks = np.repeat(self._blocks, self.periods_per_hour, axis=1)[weekend]
+        slots = (np.repeat(self._slots, self.periods_per_hour, axis=1) * self.periods_per_hour +
+                 np.tile(np.arange(self.periods_per_hour), 24))[weekend]
+        return blocks, self.ratios[blocks, months, slots]
 
 
 class PowerIntradayShapeCalibration(BaseIntradayShapeCalibration):
@@ -45,44 +112,100 @@ class PowerIntradayShapeCalibration(BaseIntradayShapeCalibration):
     def __init__(self, calibration_data):
         """
         calibration data is provided as a list of list of lists, the first list has 4 elements corresponding to
+        the load_shapes, and the hours of each block are in clock order (so 00:00 to 07:00 then 20:00 to 23:00 for the
+        offpeak blocks)
 
         :param calibration_data: a list of list of lists of floats; 4 blocks * 12 months * 12 hours
         """
-        self.ratios = calibration_data
-        assert len(self.ratios) == 4, "need data for 4 loadshaptes: only {} provided".format(len(self.ratios))
-        for ratios_by_month in self.ratios:
-            assert len(ratios_by_month) == 12, "need data for 12 months: only {} provided".format(len(ratios_by_month))
-            for ratios_by_hour in ratios_by_month:
-                assert len(ratios_by_hour) == 12, "need data for 12 hours: only {} provided".format(len(ratios_by_hour))
-                average = sum(ratios_by_hour) / 12
-                assert 0.999999 < average < 1.000001, "ratios don't average to 1: {}".format(average)
+        super().__init__(calibration_data)
 
-    def decorate(self, shape_ratio_curve):
-        return IntradayShapeRatioCurve(shape_ratio_curve, self)
 
-    def extract_shape_ratio(self, hour_time_period):
-        assert hour_time_period.duration == 1 * HOUR, "input time period must be a single hour"
-        load_shape = self._load_shape_index(hour_time_period)
-        month = self._month_index(hour_time_period)
-        hour = self._hour_index(hour_time_period)
-        denominator_period = LoadShapedDateRange(hour_time_period.start, self.load_shapes[load_shape])
-        return denominator_period, self.ratios[load_shape][month][hour]
-
-    @staticmethod
-    def _hour_index(time_period):
-        """works out the hour in a 12 hour format - so if time_period has a loadshape that's in DAYTIME, returns
-        the index of the hour in DAYTIME, likewise if time_period is in NIGHTTIME"""
-        hour = time_period.load_shape.hour
-        if time_period.intersects(DAYTIME):
-            # take off the 8 hours between midnight and the start of DAYTIME
-            return hour - 8
-        # hour is in NIGHTTIME
-        if hour < 8:
-            return hour
-        else:
-            # take off the 12 hours of DAYTIME
-            return hour - 12
-
-    @staticmethod
-    def _month_index(time_period):
-        return time_period.start.month - 1
+class HalfHourlyPowerIntradayShapeCalibration(PowerIntradayShapeCalibration):
+    """
+    PowerIntradayShapeCalibration with a ratio for each half hour, so that curves can be shaped down to the half hourly
+    settlement periods. Hours are shaped by the average of the ratios of their half hours.
+    """
+
+    periods_per_hour = 2
+
+    def __init__(self, calibration_data):
+        """
+        :param calibration_data: a list of list of lists of floats; 4 blocks * 12 months * 24 half hours
+        """
+        super().__init__(calibration_data)
+
+
+class EfaIntradayShapeCalibration(BaseIntradayShapeCalibration):
+    """
+    class which stores the ratios for shaping intraday UK power forward curves by EFA block, the way the market
+    trades. The EFA day starts at 23:00 and has 6 blocks of 4 hours. Load shapes are within a calendar day, so the
+    23:00 hour is shaped with the first block of its own calendar day (and the month of that day). This is deliberate:
+    Friday 23:00 is shaped as a weekday hour and the 23:00 hour at a month end with the ratios of the old month, and
+    both are priced against the block of the calendar day, which the shaped forward curve holds a price for.
+    """
+
+    load_shapes = EFA_DAY_BLOCKS
+    day_start_hour = 23
+
+    def __init__(self, calibration_data):
+        """
+        :param calibration_data: a list of list of lists of floats; 6 EFA blocks * 12 months * 4 hours, where the hours
+                                 of each block are in order from the start of the EFA day (so 23:00 is the first hour of
+                                 the first block)
+        """
+        super().__init__(calibration_data)
+
+
+class HalfHourlyEfaIntradayShapeCalibration(EfaIntradayShapeCalibration):
+    """EfaIntradayShapeCalibration with a ratio for each half hour"""
+
+    periods_per_hour = 2
+
+    def __init__(self, calibration_data):
+        """
+        :param calibration_data: a list of list of lists of floats; 6 EFA blocks * 12 months * 8 half hours
+        """
+        super().__init__(calibration_data)
+
+
+def intraday_shape_calibration(asset_static, calibration_data, periods_per_hour=1):
+    """
+    The intraday shape calibration for an asset: by EFA block for assets that trade an EFA day (UK power) and by
+    peak / offpeak block otherwise.
+
+    :param asset_static: AssetStatic object, which must have an intraday shape
+    :param calibration_data: a list of list of lists of floats, as for the calibration class selected
+    :param periods_per_hour: int, 1 for hourly or 2 for half hourly ratios
+    :return: BaseIntradayShapeCalibration object
+    """
+    if not asset_static.has_intraday_shape:
+        raise ValueError("asset has no intraday shape")
+    if asset_static.has_efa_day:
+        calibrations = {1: EfaIntradayShapeCalibration, 2: HalfHourlyEfaIntradayShapeCalibration}
+    else:
+        calibrations = {1: PowerIntradayShapeCalibration, 2: HalfHourlyPowerIntradayShapeCalibration}
+    if periods_per_hour not in calibrations:
+        raise ValueError("periods_per_hour must be 1 or 2, not {}".format(periods_per_hour))
+    return calibrations[periods_per_hour](calibration_data)
+
+
+def _hour_lookup(load_shapes, day_start_hour=0):
+    """
+    The block and the slot within the block of every hour of a weekday and a weekend day, given blocks that partition
+    the hours of the week. The slots of a block number its hours on the day in order from day_start_hour.
+
+    :param load_shapes: list of LoadShape objects, the blocks
+    :param day_start_hour: int, the hour at which the day starts
+    :return: tuple of numpy (2 x 24) int64 arrays of the index in load_shapes and the slot, for weekdays (row 0)
+             and weekend days (row 1)
+    """
+    blocks = np.zeros((2, 24), np.int64)
+    slots = np.zeros((2, 24), np.int64)
+    for weekend in range(2):
+        for hour in range(24):
+            block = next(index for index, load_shape in enumerate(load_shapes)
+                         if load_shape.bitmap >> (hour + 24 * weekend) & 1)
+            hours = [other for other in range(24) if load_shapes[block].bitmap >> (other + 24 * weekend) & 1]
+            blocks[weekend, hour] = block
+            slots[weekend, hour] = sorted(hours, key=lambda other: (other - day_start_hour) % 24).index(hour)
+    return blocks, slots
@@ -1,10 +1,11 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 from core.time_period.date_range import LoadShapedDateRange, DateRange
 from core.time_period.load_shape import OFFPEAK, PEAK, WEEKEND, WEEKDAY, WEEKEND_OFFPEAK, BASE
 from core.time_period.time_period_sets import TimePeriodSet
 from inputs.market_data.forwards.daily_shape_calibration import SeasonBasedDailyShapeCalibration, \
-    CalendarBasedDailyShapeCalibration, _ShapeRatioTree
+    CalendarBasedDailyShapeCalibration, _ShapeRatioTree, _relative_price_cache
 
 
 class SeasonBasedDailyShapeCalibrationTestCase(unittest.TestCase):
@@ -19,6 +20,27 @@ class SeasonBasedDailyShapeCalibrationTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             daily._find_period(TimePeriodSet({LoadShapedDateRange("2016-Q1", BASE)}))
 
+    def test_concurrent_seasons(self):
+        """summer and winter curves can be built and priced from the same calibration by many threads at once"""
+        s_to_q = {BASE: [0.95, 1.05, 0.9, 1.1]}
+        q_to_m = {BASE: [1.3, 1.4, 1.3, 1.1, 1.2, 1.1, 1.3, 1.4, 1.3, 1.1, 1.2, 1.1]}
+        wdwe = {WEEKDAY: 1.1, WEEKEND: 1.0}
+        periods = [DateRange("2011-M{}".format(month)) for month in range(1, 13)]
+
+        def price(calibration, period):
+            curve = calibration.shape_ratio_curve(TimePeriodSet([period]))
+            return curve.price(period) / curve.price(period.expand("quarter"))
+
+        serial = SeasonBasedDailyShapeCalibration(s_to_q, q_to_m, wdwe)
+        expected = [price(serial, period) for period in periods]
+        shared = SeasonBasedDailyShapeCalibration(s_to_q, q_to_m, wdwe)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda period: price(shared, period), periods * 8))
+        for index, result in enumerate(results):
+            self.assertAlmostEqual(expected[index % 12], result, 12)
+        # each season's curve was built once and is shared
+        self.assertEqual(3, len(shared._cached_shape_ratio_forwards))
+
 
 class CalendarBasedDailyShapeCalibrationTestCase(unittest.TestCase):
 
@@ -134,3 +156,34 @@ class ShapeRatiosTestCase(unittest.TestCase):
         # test q_to_m
         expected_m_ratio = 1.2 * 91 / (1.1 * 30 + 1.2 * 31 + 1.1 * 30)
         self.assertAlmostEqual(curve.price(DateRange("2011-M5")), expected_q_ratio * expected_m_ratio)
+
+    def test_relative_price_dict(self):
+        prices = self.summer11_tree.relative_price_dict.price_dict
+        self.assertEqual(12, len(prices))
+        q2_ratio = 1.05 * 183 / (1.05 * 91 + 0.95 * 92)
+        m5_ratio = 1.2 * 91 / (1.1 * 30 + 1.2 * 31 + 1.1 * 30)
+        weekend = LoadShapedDateRange("2011-M5", WEEKEND)
+        weekday = LoadShapedDateRange("2011-M5", WEEKDAY)
+        weekend_ratio = 31 / (1.1 * weekday.duration.value + weekend.duration.value)
+        self.assertAlmostEqual(prices[weekend], q2_ratio * m5_ratio * weekend_ratio, 12)
+        self.assertAlmostEqual(prices[weekday], q2_ratio * m5_ratio * weekend_ratio * 1.1, 12)
+
+    def test_relative_price_dict_memoised(self):
+        tree = _ShapeRatioTree(LoadShapedDateRange("2011-M5"), frozenset([
+            (1.1, _ShapeRatioTree(LoadShapedDateRange("2011-M5", WEEKDAY))),
+            (1.0, _ShapeRatioTree(LoadShapedDateRange("2011-M5", WEEKEND)))]))
+        expected = tree.relative_price_dict.price_dict
+        hits = _relative_price_cache.hits
+        # an equal tree, built separately, is looked up rather than evaluated again
+        equal_tree = _ShapeRatioTree(LoadShapedDateRange("2011-M5"), frozenset(tree.ratios_and_subtrees))
+        self.assertEqual(expected, equal_tree.relative_price_dict.price_dict)
+        self.assertEqual(hits + 1, _relative_price_cache.hits)
+
+    def test_relative_price_dict_overlapping(self):
+        """sub-trees that overlap are resolved through a pseudo forward curve"""
+        tree = _ShapeRatioTree(LoadShapedDateRange("2011-M5"), frozenset([
+            (1.0, _ShapeRatioTree(LoadShapedDateRange("2011-M5"))),
+            (1.2, _ShapeRatioTree(LoadShapedDateRange("2011-M5", PEAK)))]))
+        prices = tree.relative_price_dict.price_dict
+        self.assertAlmostEqual(1, prices[LoadShapedDateRange("2011-M5")], 12)
+        self.assertAlmostEqual(1.2, prices[LoadShapedDateRange("2011-M5", PEAK)], 12)
@@ -1,33 +1,39 @@
+import datetime as dt
 import unittest
 
+import numpy as np
+
 from core.forward_curves.shape_ratio import UnshapedDailyRatioCurve
-from core.time_period.date_range import LoadShapedDateRange
-from core.time_period.load_shape import WEEKDAY_HOURS, WEEKEND_HOURS, PEAK, WEEKEND_OFFPEAK, BASE, WEEKDAY_EFAS
-from inputs.market_data.forwards.intraday_shape_calibration import PowerIntradayShapeCalibration
-from inputs.market_data.forwards.tests.testing_data import intraday_shape_ratios, wd_pk, we_op, wd_op
+from core.time_period.date_range import DateRange, LoadShapedDateRange
+from core.time_period.load_shape import WEEKDAY_HOURS, WEEKEND_HOURS, PEAK, WEEKEND_OFFPEAK, BASE, WEEKDAY_EFAS, \
+    WEEKEND_PEAK, HOURS, EFA_DAY_BLOCKS
+from inputs.market_data.forwards.intraday_shape_calibration import PowerIntradayShapeCalibration, \
+    HalfHourlyPowerIntradayShapeCalibration, EfaIntradayShapeCalibration, HalfHourlyEfaIntradayShapeCalibration, \
+    intraday_shape_calibration, _hour_lookup
+from inputs.market_data.forwards.tests.testing_data import intraday_shape_ratios, wd_pk, we_op, wd_op, we_pk
+from inputs.static_data.asset_static import UKPOWER, DUTCHPOWER, NBP
 
 
 class IntraDayShapeCalibrationTestCase(unittest.TestCase):
 
-    def test_time_of_week_index(self):
-        time_period = LoadShapedDateRange("2016-7-31", WEEKDAY_HOURS[8])
-        self.assertEqual(PowerIntradayShapeCalibration._load_shape_index(time_period), 1)  # wd_pk
-        time_period = LoadShapedDateRange("2016-7-31", WEEKEND_HOURS[7])
-        self.assertEqual(PowerIntradayShapeCalibration._load_shape_index(time_period), 2)  # we_op
-
-    def test_month_index(self):
-        time_period = LoadShapedDateRange("2015-7-31", WEEKDAY_HOURS[8])
-        self.assertEqual(PowerIntradayShapeCalibration._month_index(time_period), 6)
-
-    def test_hour_index(self):
-        hours_and_expected_indices = [
+    def test_hour_lookup(self):
+        blocks, slots = _hour_lookup(PowerIntradayShapeCalibration.load_shapes)
+        self.assertEqual((2, 24), blocks.shape)
+        self.assertEqual(1, blocks[0, 8])  # wd_pk
+        self.assertEqual(2, blocks[1, 7])  # we_op
+        hours_and_expected_slots = [
             # daytime
             (8, 0), (19, 11),
             # nighttime
             (0, 0), (7, 7), (20, 8), (23, 11)]
-        for hour, i in hours_and_expected_indices:
-            time_period = LoadShapedDateRange("2016-7-31", WEEKDAY_HOURS[hour])
-            self.assertEqual(PowerIntradayShapeCalibration._hour_index(time_period), i)
+        for hour, slot in hours_and_expected_slots:
+            self.assertEqual(slot, slots[0, hour])
+            self.assertEqual(slot, slots[1, hour])
+
+    def test_ratios(self):
+        # the ratios are indexed by block, then month (from January), then slot
+        self.assertEqual(wd_pk[6][0], intraday_shape_ratios.ratios[1, 6, 0])
+        self.assertEqual(we_op[11][11], intraday_shape_ratios.ratios[2, 11, 11])
 
     def test_get_peak_ratio(self):
         time_period = LoadShapedDateRange("2016-7-29", WEEKDAY_HOURS[8])
@@ -45,6 +51,35 @@ class IntraDayShapeCalibrationTestCase(unittest.TestCase):
         expected = (denominator_time_period, we_op[6][0])
         self.assertEqual(intraday_shape_ratios.extract_shape_ratio(time_period), expected)
 
+    def test_extract_shape_ratios(self):
+        ordinals = np.arange(DateRange("2016-7-29").start.toordinal(), DateRange("2016-8-2").start.toordinal() + 1)
+        blocks, ratios = intraday_shape_ratios.extract_shape_ratios(ordinals)
+        self.assertEqual((5, 24), ratios.shape)
+        for day, ordinal in enumerate(ordinals):
+            for hour in range(24):
+                date = dt.date.fromordinal(int(ordinal))
+                hours = WEEKEND_HOURS if date.weekday() > 4 else WEEKDAY_HOURS
+                time_period = LoadShapedDateRange(date, hours[hour])
+                denominator_time_period, ratio = intraday_shape_ratios.extract_shape_ratio(time_period)
+                self.assertEqual(ratio, ratios[day, hour])
+                self.assertEqual(denominator_time_period.load_shape,
+                                 intraday_shape_ratios.load_shapes[blocks[day, hour]])
+
+    def test_calibration_tensor(self):
+        self.assertEqual((4, 12, 12), intraday_shape_ratios.ratios.shape)
+        self.assertEqual(np.float64, intraday_shape_ratios.ratios.dtype)
+        with self.assertRaises(ValueError):
+            PowerIntradayShapeCalibration([wd_op, wd_pk, we_op])
+        with self.assertRaises(ValueError):
+            PowerIntradayShapeCalibration([wd_op, wd_pk, we_op, [row[:11] for row in we_op]])
+        with self.assertRaises(ValueError):
+            PowerIntradayShapeCalibration([wd_op, wd_pk, we_op, [[ratio * 1.01 for ratio in row] for row in we_op]])
+
+    def test_hour_on_weekend(self):
+        """an hour of every day is shaped with the block it falls in on the day"""
+        time_period = LoadShapedDateRange("2016-7-31", HOURS[9])
+        denominator_time_period = LoadShapedDateRange("2016-7-31", WEEKEND_PEAK)
+        self.assertEqual(intraday_shape_ratios.extract_shape_ratio(time_period), (denominator_time_period, we_pk[6][1]))
 
     def test_decorate(self):
         unshaped = UnshapedDailyRatioCurve()
@@ -58,4 +93,104 @@ class IntraDayShapeCalibrationTestCase(unittest.TestCase):
         self.assertAlmostEqual(intraday.price(time_period), wd_op[7][0])
         time_period = LoadShapedDateRange("2016-M4", WEEKDAY_EFAS[3])
         expected = (1.121479411 + 1.081247748 + 0.981449994 + 0.897401978) / 4
-        self.assertAlmostEqual(intraday.price(time_period), expected)
\ No newline at end of file
+        self.assertAlmostEqual(intraday.price(time_period), expected)
+
+
+class EfaIntradayShapeCalibrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # the ratios of block b in month m are b, m and 2 above and below 1, with the first hour of each block highest
+        self.data = [[[1 + (block + month) / 100, 1 + 2 / 100, 1 - 2 / 100, 1 - (block + month) / 100]
+                      for month in range(12)] for block in range(6)]
+        self.calibration = EfaIntradayShapeCalibration(self.data)
+
+    def test_efa_day_starts_at_23(self):
+        date = dt.date(2016, 7, 29)
+        denominator_period, ratio = self.calibration.extract_shape_ratio(LoadShapedDateRange(date, HOURS[23]))
+        self.assertEqual(LoadShapedDateRange(date, EFA_DAY_BLOCKS[0]), denominator_period)
+        self.assertEqual(self.data[0][6][0], ratio)
+        _, ratio = self.calibration.extract_shape_ratio(LoadShapedDateRange(date, HOURS[0]))
+        self.assertEqual(self.data[0][6][1], ratio)
+        denominator_period, ratio = self.calibration.extract_shape_ratio(LoadShapedDateRange(date, HOURS[3]))
+        self.assertEqual(LoadShapedDateRange(date, EFA_DAY_BLOCKS[1]), denominator_period)
+        self.assertEqual(self.data[1][6][0], ratio)
+
+    def test_23_is_shaped_with_its_calendar_day(self):
+        # deliberately, Friday 23:00 is shaped as a weekday hour against Friday's first block, not Saturday's
+        friday = dt.date(2016, 7, 29)
+        denominator_period, ratio = self.calibration.extract_shape_ratio(LoadShapedDateRange(friday, HOURS[23]))
+        self.assertEqual(LoadShapedDateRange(friday, EFA_DAY_BLOCKS[0]), denominator_period)
+        blocks, ratios = self.calibration.extract_shape_ratios(np.array([friday.toordinal()]))
+        self.assertEqual((0, ratio), (blocks[0, 23], ratios[0, 23]))
+        # and the 23:00 hour at a month end with the ratios of the old month against the block of the old month
+        month_end = dt.date(2016, 7, 31)
+        denominator_period, ratio = self.calibration.extract_shape_ratio(LoadShapedDateRange(month_end, HOURS[23]))
+        self.assertEqual(LoadShapedDateRange(month_end, EFA_DAY_BLOCKS[0]), denominator_period)
+        self.assertEqual(self.data[0][6][0], ratio)
+        self.assertNotEqual(self.data[0][7][0], ratio)
+
+    def test_extract_shape_ratios(self):
+        ordinals = np.arange(dt.date(2016, 7, 29).toordinal(), dt.date(2016, 8, 1).toordinal() + 1)
+        blocks, ratios = self.calibration.extract_shape_ratios(ordinals)
+        for day, ordinal in enumerate(ordinals):
+            date = dt.date.fromordinal(int(ordinal))
+            for hour in range(24):
+                denominator_period, ratio = self.calibration.extract_shape_ratio(LoadShapedDateRange(date, HOURS[hour]))
+                self.assertEqual(ratio, ratios[day, hour])
+                self.assertEqual(denominator_period.load_shape, EFA_DAY_BLOCKS[blocks[day, hour]])
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            EfaIntradayShapeCalibration(self.data[:4])
+        with self.assertRaises(ValueError):
+            EfaIntradayShapeCalibration(wd_op)
+
+
+class HalfHourlyIntradayShapeCalibrationTestCase(unittest.TestCase):
+
+    def test_half_hourly_power(self):
+        # split each hour into a half hour 5% above and one 5% below the hourly ratio
+        data = [[[ratio * factor for ratio in ratios for factor in (1.05, 0.95)] for ratios in block]
+                for block in (wd_op, wd_pk, we_op, we_pk)]
+        calibration = HalfHourlyPowerIntradayShapeCalibration(data)
+        self.assertEqual((4, 12, 24), calibration.ratios.shape)
+        ordinals = np.arange(dt.date(2016, 7, 29).toordinal(), dt.date(2016, 8, 1).toordinal() + 1)
+        blocks, ratios = calibration.extract_period_shape_ratios(ordinals)
+        self.assertEqual((4, 48), ratios.shape)
+        hourly_blocks, hourly_ratios = calibration.extract_shape_ratios(ordinals)
+        np.testing.assert_array_equal(hourly_blocks, blocks[:, ::2])
+        np.testing.assert_allclose(hourly_ratios, ratios.reshape(4, 24, 2).mean(axis=2))
+        expected_blocks, expected_ratios = intraday_shape_ratios.extract_shape_ratios(ordinals)
+        np.testing.assert_array_equal(expected_blocks, hourly_blocks)
+        np.testing.assert_allclose(expected_ratios, hourly_ratios)
+        # the first half hour of 08:00 on a weekday in July
+        self.assertAlmostEqual(wd_pk[6][0] * 1.05, ratios[0, 16])
+
+    def test_half_hourly_efa(self):
+        data = [[[1.1, 0.9] * 4 for _ in range(12)] for _ in range(6)]
+        calibration = HalfHourlyEfaIntradayShapeCalibration(data)
+        blocks, ratios = calibration.extract_period_shape_ratios(np.array([dt.date(2016, 7, 29).toordinal()]))
+        self.assertEqual([1.1, 0.9], list(ratios[0, 46:]))
+        self.assertEqual([0, 0], list(blocks[0, 46:]))
+        self.assertEqual(1, calibration.extract_shape_ratio(LoadShapedDateRange("2016-7-29", HOURS[23]))[1])
+
+
+class IntradayShapeCalibrationSelectionTestCase(unittest.TestCase):
+
+    def test_efa_day(self):
+        data = [[[1.] * 4 for _ in range(12)] for _ in range(6)]
+        self.assertIsInstance(intraday_shape_calibration(UKPOWER, data), EfaIntradayShapeCalibration)
+        half_hourly_data = [[[1.] * 8 for _ in range(12)] for _ in range(6)]
+        self.assertIsInstance(intraday_shape_calibration(UKPOWER, half_hourly_data, periods_per_hour=2),
+                              HalfHourlyEfaIntradayShapeCalibration)
+
+    def test_peak_offpeak(self):
+        data = [wd_op, wd_pk, we_op, we_pk]
+        calibration = intraday_shape_calibration(DUTCHPOWER, data)
+        self.assertIs(PowerIntradayShapeCalibration, type(calibration))
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            intraday_shape_calibration(NBP, [wd_op, wd_pk, we_op, we_pk])
+        with self.assertRaises(ValueError):
+            intraday_shape_calibration(DUTCHPOWER, [wd_op, wd_pk, we_op, we_pk], periods_per_hour=4)
@@ -20,41 +20,41 @@ class CommodityStatic(AssetStatic):
     def __init__(self, currency, settlement_rule, unit, has_shape=False, has_intraday_shape=False, has_efa_day=False):
         super().__init__(has_shape, has_intraday_shape, has_efa_day)
         assert isinstance(currency, Unit)
-        assert isinstance(settlement_rule, AbstractSettlementRule)
+        assert issubclass(settlement_rule, AbstractSettlementRule)
         assert isinstance(unit, Unit)
         self.currency = currency
         self.settlement_rule = settlement_rule
         self.unit = unit
 
 UKPOWER = CommodityStatic(currency=GBP,
-                          settlement_rule=UKPowerSettlementRule(),
+                          settlement_rule=UKPowerSettlementRule,
                           unit=GBP / MWH,
                           has_shape=True,
                           has_intraday_shape=True,
                           has_efa_day=True)
 
 DUTCHPOWER = CommodityStatic(currency=EUR,
-                             settlement_rule=UKPowerSettlementRule(),
+                             settlement_rule=UKPowerSettlementRule,
                              unit=EUR / MWH,
                              has_shape=True,
                              has_intraday_shape=True)
 
 GERMANPOWER = CommodityStatic(currency=EUR,
-                              settlement_rule=GasSettlementRule(),
+                              settlement_rule=GasSettlementRule,
                               unit=EUR / MWH,
                               has_shape=True,
                               has_intraday_shape=True)
 
 NBP = CommodityStatic(currency=GBP,
-                      settlement_rule=GasSettlementRule(),
+                      settlement_rule=GasSettlementRule,
                       unit=PENCE / THERM,
                       has_shape=True)
 
 TTF = CommodityStatic(currency=EUR,
-                      settlement_rule=GasSettlementRule(),
+                      settlement_rule=GasSettlementRule,
                       unit=EUR / MWH,
                       has_shape=True)
 
 HENRYHUB = CommodityStatic(currency=USD,
-                           settlement_rule=GasSettlementRule(),
-                           )
\ No newline at end of file
+                           settlement_rule=GasSettlementRule,
+                           unit=USD / MMBTU)
\ No newline at end of file